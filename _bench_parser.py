@@ -0,0 +1,723 @@
+"""Throughput benchmark for DocumentParserService / DocumentParseEngine
+
+用法:
+    python _bench_parser.py [样本目录] [--repeat N] > bench_output.txt
+不传样本目录时, 使用可用的依赖 (PyMuPDF / python-docx / openpyxl) 生成一组混合语料。
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.stdout.reconfigure(encoding='utf-8')
+# 基准测试测量的是解析本身, 默认关闭内容寻址解析缓存
+os.environ.setdefault("DOC_PARSE_CACHE_PATH", "")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PIPELINE_FILE = os.path.join(HERE, "多数据源获取数据.py")
+
+
+def load_pipeline() -> dict:
+    """加载 Dify 节点代码中的类定义 (在 main(...) 调用之前截断)。"""
+    with open(PIPELINE_FILE, encoding='utf-8') as f:
+        code = f.read()
+    lines = code.split('\n')
+    cut_line = next((i for i, line in enumerate(lines)
+                     if line.startswith("main({") or line.startswith("main('")), None)
+    safe_code = '\n'.join(lines[:cut_line]) if cut_line else code
+    exec_globals = {"__name__": "dify_pipeline"}
+    exec(compile(safe_code, PIPELINE_FILE, "exec"), exec_globals)
+    # 基准测试只关心解析耗时, 不上传图片
+    uploader = exec_globals['EmbeddedImageUploader']
+    uploader.upload_images = classmethod(lambda cls, images: {})
+
+    async def _no_upload(cls, pending, client):
+        return {}
+    uploader.upload_pending = classmethod(_no_upload)
+    return exec_globals
+
+
+# ── 语料 ─────────────────────────────────────────────────────
+def _make_pdf(pages: int = 12) -> bytes:
+    import fitz
+    doc = fitz.open()
+    for pi in range(pages):
+        page = doc.new_page()
+        y = 72
+        for li in range(40):
+            page.insert_text((72, y), f"Page {pi + 1} line {li + 1}: childcare industry report sample text.")
+            y += 16
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _make_report_pdf(pages: int = 30) -> bytes:
+    """多页报告: 正文 + 每 5 页一张带线框的表格 + 每 3 页一张图片。"""
+    import fitz
+    doc = fitz.open()
+    pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 160, 120), False)
+    for x in range(160):
+        for y in range(120):
+            pix.set_pixel(x, y, ((x * 7) % 256, (y * 11) % 256, ((x + y) * 3) % 256))
+    img_bytes = pix.tobytes("png")
+    for pi in range(pages):
+        page = doc.new_page()
+        y = 72
+        for li in range(25):
+            page.insert_text((72, y), f"Page {pi + 1} line {li + 1}: childcare industry report sample text.")
+            y += 14
+        if pi % 5 == 0:
+            top, rows, cols, rh, cw = y + 10, 6, 4, 18, 110
+            for r in range(rows + 1):
+                page.draw_line((72, top + r * rh), (72 + cols * cw, top + r * rh))
+            for c in range(cols + 1):
+                page.draw_line((72 + c * cw, top), (72 + c * cw, top + rows * rh))
+            for r in range(rows):
+                for c in range(cols):
+                    page.insert_text((76 + c * cw, top + r * rh + 13), f"r{r}c{c}")
+            y = top + rows * rh + 10
+        if pi % 3 == 0:
+            page.insert_image(fitz.Rect(72, y + 10, 232, y + 130), stream=img_bytes)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def _make_docx(paragraphs: int = 400) -> bytes:
+    from io import BytesIO
+    from docx import Document
+    doc = Document()
+    for i in range(paragraphs):
+        if i % 50 == 0:
+            doc.add_heading(f"章节 {i // 50 + 1}", level=1)
+        doc.add_paragraph(f"第 {i + 1} 段: 托育机构备案与从业人员调研样本文本。" * 3)
+    table = doc.add_table(rows=30, cols=5)
+    for r, row in enumerate(table.rows):
+        for c, cell in enumerate(row.cells):
+            cell.text = f"r{r}c{c}"
+    buf = BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+
+def _make_xlsx(rows: int = 3000) -> bytes:
+    from io import BytesIO
+    from openpyxl import Workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["地区", "年份", "机构数", "从业人数", "备注"])
+    for i in range(rows):
+        ws.append([f"地区{i % 30}", 2015 + i % 10, i, i * 3, "统计年鉴样本"])
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def _make_csv(rows: int = 20000) -> bytes:
+    lines = ["地区,年份,机构数,从业人数"] + [f"地区{i % 30},{2015 + i % 10},{i},{i * 3}" for i in range(rows)]
+    return "\n".join(lines).encode("utf-8")
+
+
+def _make_html(paragraphs: int = 200) -> bytes:
+    body = "".join(f"<p>第 {i} 段正文: 托育服务行业新闻样本内容, 用于测试正文提取。</p>" for i in range(paragraphs))
+    return f"<html><head><title>news</title></head><body><nav>首页 | 登录</nav><article>{body}</article></body></html>".encode("utf-8")
+
+
+def build_corpus(sample_dir: str = "") -> list:
+    """返回 [(名称, 扩展名, 字节)]"""
+    corpus = []
+    if sample_dir:
+        for name in sorted(os.listdir(sample_dir)):
+            path = os.path.join(sample_dir, name)
+            ext = os.path.splitext(name)[1].lower()
+            if os.path.isfile(path) and ext:
+                with open(path, "rb") as f:
+                    corpus.append((name, ext, f.read()))
+        return corpus
+    for name, ext, maker in [("report.pdf", ".pdf", _make_pdf), ("tables.pdf", ".pdf", _make_report_pdf), ("survey.docx", ".docx", _make_docx),
+                             ("yearbook.xlsx", ".xlsx", _make_xlsx), ("export.csv", ".csv", _make_csv),
+                             ("news.html", ".html", _make_html)]:
+        try:
+            corpus.append((name, ext, maker()))
+        except ImportError as e:
+            print(f"  跳过 {name}: 缺少依赖 ({e.name})")
+    return corpus
+
+
+# ── 基准 ─────────────────────────────────────────────────────
+def bench_engine_modes(g: dict, corpus: list, repeat: int) -> None:
+    """线程模式 vs 进程池模式: 并发解析 repeat 份混合语料的吞吐量。"""
+    engine_cls = g['DocumentParseEngine']
+    service = g['DocumentParserService']()
+    jobs = [(ext, data, name) for _ in range(repeat) for name, ext, data in corpus]
+    total_mb = sum(len(data) for _, data, _ in jobs) / 1024 / 1024
+
+    async def _run(mode: str) -> float:
+        engine = engine_cls(service, mode=mode)
+        engine.start()  # 解析子进程在首次使用时 fork, 不计入耗时
+        try:
+            start = time.perf_counter()
+            await asyncio.gather(*(engine.parse(data, ext, name) for ext, data, name in jobs))
+            return time.perf_counter() - start
+        finally:
+            await engine.aclose()
+
+    print(f"\n[engine] {len(jobs)} 个文档, {total_mb:.1f} MB, CPU 核数 {os.cpu_count()}")
+    for mode in ("thread", "process"):
+        elapsed = asyncio.run(_run(mode))
+        print(f"  {mode:<8} {elapsed:7.2f}s  {len(jobs) / elapsed:6.2f} docs/s  {total_mb / elapsed:6.2f} MB/s")
+
+
+def _legacy_pdf_passes(g: dict, data: bytes, max_pages: int = 50) -> None:
+    """旧版 _parse_pdf 的三次遍历: pdfplumber 全部页面找表格 + fitz 文本 + 图片上传前再次 fitz 提取。"""
+    import fitz
+    import pdfplumber
+    from io import BytesIO
+    with pdfplumber.open(BytesIO(data)) as pdf:
+        for pp in pdf.pages[:max_pages]:
+            for tbl in pp.find_tables():
+                tbl.extract()
+    with fitz.open(stream=data, filetype="pdf") as doc:
+        for pi in range(min(len(doc), max_pages)):
+            doc.load_page(pi).get_text("dict", sort=True)
+    g['EmbeddedImageUploader'].extract_from_pdf(data, max_pages=max_pages)
+
+
+def bench_pdf_single_pass(g: dict, corpus: list, repeat: int) -> None:
+    """旧版三次遍历 vs 单次 fitz 遍历 (新版还包含 Markdown 组装和清洗, 结果偏保守)。"""
+    pdfs = [(name, data) for name, ext, data in corpus if ext == ".pdf"]
+    if not pdfs:
+        return
+    service = g['DocumentParserService']()
+    print(f"\n[pdf] 每个文件重复 {repeat} 次")
+    for name, data in pdfs:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            _legacy_pdf_passes(g, data, service.PDF_MAX_PAGES)
+        legacy = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(repeat):
+            service._parse_pdf(data)
+        single = time.perf_counter() - start
+        print(f"  {name:<24} 三次遍历 {legacy / repeat * 1000:8.1f} ms  "
+              f"单次遍历 {single / repeat * 1000:8.1f} ms  加速 {legacy / single:5.2f}x")
+
+
+def bench_pdf_page_parallel(g: dict, repeat: int, pages: int = 50) -> None:
+    """大报告: 解析进程池按页范围分片并行扫描 vs 整篇交给一个 worker, 并校验两者输出一致。"""
+    try:
+        data = _make_report_pdf(pages)
+    except ImportError:
+        return
+    cache_cls = g['DocumentParseCache']
+    cache_path, cache_cls.PATH = cache_cls.PATH, ""  # 关闭解析缓存, 每次都真实解析
+    try:
+        service = g['DocumentParserService']()
+        workers = max(2, os.cpu_count() or 1)
+        print(f"\n[pdf-parallel] {pages} 页报告, 重复 {repeat} 次, 解析进程 {workers} 个")
+
+        async def _run(n: int) -> tuple:
+            engine = g['DocumentParseEngine'](service, mode="process", workers=n)
+            engine.start()
+            try:
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    payload = await engine._parse_deferred(data, ".pdf", "bench.pdf")
+                return time.perf_counter() - start, payload["markdown"]
+            finally:
+                await engine.aclose()
+
+        outputs = {}
+        for label, n in (("serial", 1), ("parallel", workers)):
+            elapsed, outputs[label] = asyncio.run(_run(n))
+            print(f"  {label:<9} {elapsed / repeat * 1000:8.1f} ms/份  {pages * repeat / elapsed:7.1f} pages/s")
+        print(f"  输出一致: {outputs['serial'] == outputs['parallel']}")
+    finally:
+        cache_cls.PATH = cache_path
+
+
+def bench_table_prescreen(g: dict, repeat: int, pages: int = 50) -> None:
+    """表格提取: 全部页面 find_tables() vs fitz 预筛后只对送检页 find_tables(), 并校验表格结果一致。"""
+    try:
+        import fitz
+        data = _make_report_pdf(pages)
+    except ImportError:
+        return
+    service = g['DocumentParserService']()
+    all_pages = list(range(pages))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        full = service._extract_pdf_tables(data, all_pages)
+    before = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            candidates = [pi for pi in all_pages if service._screen_pdf_table_page(doc.load_page(pi))[2]]
+        screened = service._extract_pdf_tables(data, candidates)
+    after = time.perf_counter() - start
+
+    print(f"\n[table-screen] {pages} 页报告, 送检 {len(candidates)} 页, 含表格 {len(full)} 页")
+    print(f"  全部页面   {pages * repeat / before:7.1f} pages/s")
+    print(f"  预筛后     {pages * repeat / after:7.1f} pages/s  加速 {before / after:5.2f}x")
+    print(f"  表格结果一致: {full == screened}")
+
+
+def bench_markitdown_input(g: dict, corpus: list, repeat: int, concurrency: int = 8) -> None:
+    """MarkItDown 输入方式: 内存流 vs memfd vs 磁盘临时文件, 并发转换吞吐量, 并校验输出一致。"""
+    from concurrent.futures import ThreadPoolExecutor
+    service = g['DocumentParserService']()
+    if not service._markitdown:
+        print("\n[markitdown-io] 未安装 MarkItDown, 跳过")
+        return
+    jobs = [(ext, data) for _ in range(repeat) for _, ext, data in corpus if ext in (".docx", ".xlsx", ".csv", ".pdf")]
+    modes = ["stream", "tempfile"] + (["memfd"] if hasattr(os, "memfd_create") else [])
+    print(f"\n[markitdown-io] {len(jobs)} 次转换, 并发 {concurrency}")
+    outputs = {}
+    for mode in modes:
+        service.MARKITDOWN_INPUT = mode
+        with ThreadPoolExecutor(concurrency) as pool:
+            start = time.perf_counter()
+            outputs[mode] = list(pool.map(lambda job: service._markitdown_convert(job[1], job[0]), jobs))
+            elapsed = time.perf_counter() - start
+        print(f"  {mode:<9} {elapsed:7.2f}s  {len(jobs) / elapsed:6.2f} docs/s")
+    print(f"  输出一致: {all(out == outputs['tempfile'] for out in outputs.values())}")
+
+
+# 旧版 DataCleaningPipeline 的逐条规则匹配, 作为清洗基准的对照
+_LEGACY_NOISY = [r'^[\-=*#_]{3,}$', r'.*\.(html|shtml|htm|php)\s*$',
+                 r'.{0,50}(搜狐|网易|腾讯|新浪|登录|注册|版权所有|版权声明).{0,50}$',
+                 r'\[\d+\]|\[下一页\]|\[上一页\]', r'\[(编辑|查看历史|讨论|阅读|来源|原标题)\]',
+                 r'^\*+\s*\[.*?\]\(.*?\)', r'^\s*(分享到|扫描二维码|返回搜狐|查看更多|责任编辑|记者|通讯员)',
+                 r'^\s*([京公网安备京网文京ICP备]|互联网新闻信息服务许可证|信息网络传播视听节目许可证)']
+_LEGACY_PAGE_NUM = (r'^\s*[-—]\s*\d+\s*[-—]\s*$|^\s*第\s*\d+\s*页\s*(共\s*\d+\s*页)?\s*$|'
+                    r'^\s*Page\s+\d+\s*(of\s+\d+)?\s*$')
+
+
+def _legacy_clean_document(g: dict, cleaner, text: str) -> str:
+    """旧版 clean_document: 全文页眉页脚统计 -> 逐条规则过滤 -> 空白规整 -> 最后截断。"""
+    import re
+    noisy = [re.compile(p, re.IGNORECASE) for p in _LEGACY_NOISY]
+    page_num = re.compile(_LEGACY_PAGE_NUM, re.IGNORECASE)
+    link = re.compile(r'\[.*?\]\(.*?\)')
+    editor = re.compile(r'(\(|\[)\s*责任编辑：.*?\s*(\)|\])')
+
+    def _is_noisy(line):
+        stripped = line.strip()
+        if not stripped or any(p.search(stripped) for p in noisy):
+            return True
+        links = link.findall(stripped)
+        return len(links) > 2 and len(stripped) / (len(links) + 1) < 30
+
+    lines = text.splitlines()
+    if len(lines) >= 20:
+        counts = {}
+        for line in lines:
+            st = line.strip()
+            if st and len(st) < 100:
+                counts[st] = counts.get(st, 0) + 1
+        repeated = {st for st, c in counts.items() if c >= 3}
+        lines = [line for line in lines if line.strip() not in repeated]
+    cleaned = []
+    for line in lines:
+        if page_num.search(line.strip()) or _is_noisy(line):
+            continue
+        line = editor.sub('', line).strip()
+        if line:
+            cleaned.append(line)
+    result = "\n".join(cleaned).strip()
+    limit = cleaner.max_content_length
+    if len(result) > limit:
+        return result[:limit] + f"\n\n...[文档内容过长，已截断至 {limit} 字符]"
+    return result
+
+
+def _make_scraped_page(seed: int, chars: int = 80000) -> str:
+    """模拟抓取页面的 Markdown: 正文段落夹杂导航链接、版权、页码、责任编辑、分页标记等噪声行。"""
+    import random
+    rnd = random.Random(seed)
+    noise = ["[首页](https://a.com) | [新闻](https://a.com/n) | [财经](https://a.com/f) | [体育](https://a.com/s)",
+             "版权所有 © 2026 搜狐公司", "责任编辑：张三", "第 3 页 共 12 页", "- 12 -", "Page 4 of 9", "---",
+             "[下一页]", "分享到：微信 微博", "京ICP备12345678号", "原文链接 https://news.example.com/a/123.html",
+             "* [相关阅读](https://a.com/r)", "(责任编辑：李四) 本文来源于网络"]
+    body = ["托育机构备案数量持续增长，各地出台普惠托育服务支持政策，从业人员培训体系逐步完善。",
+            "According to the survey, 62% of families consider cost the main barrier to childcare services.",
+            "![托育机构](https://img.example.com/p/1.jpg)",
+            "| 地区 | 机构数 | 从业人数 |", "## 三、行业发展趋势",
+            "2025 年全国每千人口拥有 3 岁以下婴幼儿托位数达到 4.5 个。"]
+    lines, size = [], 0
+    while size < chars:
+        line = rnd.choice(noise) if rnd.random() < 0.3 else rnd.choice(body) + f" ({len(lines)})"
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def bench_line_classifier(g: dict, repeat: int, pages: int = 20) -> None:
+    """清洗热循环: 旧版逐条正则 vs 单遍合并分类器 (80k 字符抓取页面), 并校验输出一致。"""
+    cleaner = g['DataCleaningPipeline'](max_content_length=10 ** 7)
+    docs = [_make_scraped_page(i) for i in range(pages)]
+    total_mb = sum(len(d.encode("utf-8")) for d in docs) * repeat / 1024 / 1024
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        legacy = [_legacy_clean_document(g, cleaner, d) for d in docs]
+    before = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fused = [cleaner.clean_document(d) for d in docs]
+    after = time.perf_counter() - start
+
+    print(f"\n[cleaning] {pages} 个抓取页面 x {repeat}, {total_mb:.1f} MB")
+    print(f"  逐条规则   {total_mb / before:7.2f} MB/s")
+    print(f"  合并分类器 {total_mb / after:7.2f} MB/s  加速 {before / after:5.2f}x")
+    print(f"  输出一致: {legacy == fused}")
+
+
+def _make_news_page(seed: int, paragraphs: int = 120) -> bytes:
+    """模拟新闻门户页面: 导航、侧栏链接、正文段落与图片、视频和嵌入播放器、页脚。"""
+    nav = "".join(f'<li><a href="/channel/{i}">频道 {i}</a></li>' for i in range(60))
+    side = "".join(f'<li><a href="/news/{seed}-{i}.html">相关新闻 {seed}-{i}: 托育机构备案与补贴政策解读</a></li>' for i in range(40))
+    body = "".join(
+        f"<p>第 {seed}-{i} 段: 托育服务行业新闻正文, 涉及普惠托位建设、从业人员培训与收费标准 {i * 37 % 1000} 元。</p>"
+        + (f'<p><img src="/img/{seed}/{i}.jpg" alt="配图 {i}"></p>' if i % 15 == 0 else "")
+        for i in range(paragraphs))
+    media = (f'<video src="/media/{seed}.mp4"><source src="/media/{seed}.webm"></video>'
+             f'<iframe src="https://www.youtube.com/embed/{seed}"></iframe><iframe src="/ads/{seed}.html"></iframe>')
+    return (f"<html><head><title>托育新闻 {seed}</title></head><body><header><ul>{nav}</ul></header>"
+            f"<main><article><h1>托育新闻 {seed}</h1>{body}{media}</article><aside><ul>{side}</ul></aside></main>"
+            f"<footer>版权所有 © 2024 新闻网 | 联系我们</footer></body></html>").encode("utf-8")
+
+
+def _legacy_extract_page(body: bytes, base_url: str) -> dict:
+    """旧版抓取路径: 每页新建 trafilatura 配置, 正文提取后再用 BeautifulSoup 解析一遍找视频。"""
+    import trafilatura
+    from trafilatura.settings import use_config
+    from bs4 import BeautifulSoup
+    from urllib.parse import urljoin
+    html = body.decode("utf-8", errors="replace")
+    cfg = use_config()
+    cfg.set("DEFAULT", "EXTRACTION_TIMEOUT", "10")
+    content = trafilatura.extract(html, config=cfg, output_format='markdown',
+                                  include_images=True, favor_recall=True) or ""
+    soup = BeautifulSoup(html, "lxml")
+    videos = []
+    for video in soup.find_all("video"):
+        if video.get("src"): videos.append(urljoin(base_url, video["src"]))
+        videos += [urljoin(base_url, s["src"]) for s in video.find_all("source") if s.get("src")]
+    videos += [urljoin(base_url, f["src"]) for f in soup.find_all("iframe")
+               if f.get("src") and any(k in f["src"] for k in ["youtube", "vimeo", "embed", ".mp4"])]
+    return {"content": content, "videos": list(dict.fromkeys(videos))}
+
+
+def bench_html_extraction(g: dict, pages: int = 50, workers: int = 0) -> None:
+    """50 个新闻页面并发提取 (正文 + 视频): 旧版线程路径 vs 解析进程池, pages/s。"""
+    engine_cls = g['DocumentParseEngine']
+    service = g['DocumentParserService']()
+    jobs = [(_make_news_page(i), f"https://news.example.com/a/{i}.html") for i in range(pages)]
+    total_mb = sum(len(body) for body, _ in jobs) / 1024 / 1024
+
+    async def _legacy() -> list:
+        return await asyncio.gather(*(asyncio.to_thread(_legacy_extract_page, body, url) for body, url in jobs))
+
+    async def _engine(mode: str) -> list:
+        engine = engine_cls(service, mode=mode, workers=workers or None)
+        engine.start()
+        try:
+            return await asyncio.gather(*(engine.extract_html(body, "utf-8", url) for body, url in jobs))
+        finally:
+            await engine.aclose()
+
+    print(f"\n[html] {pages} 个页面并发提取, {total_mb:.1f} MB, CPU 核数 {os.cpu_count()}")
+    results = {}
+    for label, run in [("legacy", _legacy), ("thread", lambda: _engine("thread")), ("process", lambda: _engine("process"))]:
+        start = time.perf_counter()
+        results[label] = asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<8} {elapsed:7.2f}s  {pages / elapsed:6.1f} pages/s")
+    print(f"  输出一致: {results['legacy'] == results['thread'] == results['process']}")
+
+
+def bench_shared_tree(g: dict, repeat: int, paragraphs: int = 1500) -> None:
+    """大门户页面单页提取: trafilatura 与 BeautifulSoup 各解析一次 vs 共用一棵 lxml 树, 并校验输出一致。"""
+    service = g['DocumentParserService']()
+    body, url = _make_news_page(0, paragraphs), "https://news.example.com/a/0.html"
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        legacy = _legacy_extract_page(body, url)
+    before = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeat):
+        shared = service.extract_web_page(body, "utf-8", url)
+    after = time.perf_counter() - start
+
+    print(f"\n[shared-tree] 门户页面 {len(body) / 1024:.0f} KB, 重复 {repeat} 次")
+    print(f"  两次解析 {before / repeat * 1000:8.1f} ms/页")
+    print(f"  共用一棵树 {after / repeat * 1000:6.1f} ms/页  加速 {before / after:5.2f}x")
+    print(f"  输出一致: {legacy == shared}")
+
+
+def _make_yearbook_xlsx(rows: int = 50_000) -> bytes:
+    """统计年鉴式大工作簿: 两个工作表, 每行带唯一文本 (共享字符串表随行数增长)。"""
+    from openpyxl import Workbook
+    from io import BytesIO
+    wb = Workbook(write_only=True)
+    for title in ("分地区", "分年份"):
+        ws = wb.create_sheet(title)
+        ws.append(["地区", "年份", "机构数", "从业人数", "托位数", "备注"])
+        for i in range(rows // 2):
+            ws.append([f"地区{i % 300}", 2000 + i % 25, i, i * 3, i * 0.5, f"{title}-样本记录-{i}"])
+    buf = BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def bench_xlsx_streaming(g: dict, rows: int = 50_000) -> None:
+    """大工作簿 (默认 5 万行) 截断到 MAX_TABLE_ROWS: MarkItDown 整表渲染 vs openpyxl 只读 vs SAX 流式, 耗时与内存峰值。"""
+    import tracemalloc
+    service = g['DocumentParserService']()
+    data = _make_yearbook_xlsx(rows)
+
+    def _sax(d):
+        service.XLSX_SAX_MIN_BYTES = 0
+        try:
+            return service._parse_xlsx(d)
+        finally:
+            service.XLSX_SAX_MIN_BYTES = type(service).XLSX_SAX_MIN_BYTES
+
+    def _openpyxl(d):
+        service.XLSX_SAX_MIN_BYTES = 1 << 62
+        try:
+            return service._parse_xlsx(d)
+        finally:
+            service.XLSX_SAX_MIN_BYTES = type(service).XLSX_SAX_MIN_BYTES
+
+    print(f"\n[xlsx-stream] {rows} 行工作簿 {len(data) / 1024 / 1024:.1f} MB -> 每表 {service.MAX_TABLE_ROWS} 行")
+    outputs = {}
+    for label, run in [("markitdown", lambda d: service._parse_markitdown(d, ctx=g['ParseContext'](d, ".xlsx"))),
+                       ("openpyxl", _openpyxl), ("sax", _sax)]:
+        tracemalloc.start()
+        start = time.perf_counter()
+        outputs[label] = run(data)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {label:<10} {elapsed:7.2f}s  峰值 {peak / 1024 / 1024:7.1f} MB  输出 {len(outputs[label])} 字符")
+    print(f"  openpyxl 与 sax 输出一致: {outputs['openpyxl'] == outputs['sax']}")
+
+
+def _legacy_parse_csv(service, data: bytes) -> str:
+    """旧版 _parse_csv: 逐个编码整体解码, splitlines 全文后再读前 MAX_TABLE_ROWS 行。"""
+    import csv
+    text = service._decode_bytes(data)
+    try:
+        reader = csv.reader(text.splitlines(), csv.Sniffer().sniff(text[:8192]))
+    except csv.Error:
+        reader = csv.reader(text.splitlines())
+    rows = []
+    for i, row in enumerate(reader):
+        if i >= service.MAX_TABLE_ROWS:
+            rows.append(["...", "[已截断]", "..."])
+            break
+        rows.append(row)
+    return service.cleaner.clean_table(service._rows_to_md_table(rows)) if rows else ""
+
+
+def bench_csv_streaming(g: dict, repeat: int, sizes_mb: tuple = (1, 10, 50)) -> None:
+    """GBK 编码的大 CSV 导出: 整体解码 + splitlines vs 前缀探测编码 + 流式读取到行数上限。"""
+    service = g['DocumentParserService']()
+    print(f"\n[csv-stream] GBK CSV -> {service.MAX_TABLE_ROWS} 行, 重复 {repeat} 次")
+    for mb in sizes_mb:
+        line = "地区{0},{1},托育机构{0},{2}\n"
+        rows, size, parts = 0, 0, ["地区,年份,机构名称,托位数\n"]
+        while size < mb * 1024 * 1024:
+            parts.append(line.format(rows % 300, 2000 + rows % 25, rows * 3))
+            size += len(parts[-1]) * 2
+            rows += 1
+        data = "".join(parts).encode("gbk")
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            legacy = _legacy_parse_csv(service, data)
+        before = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(repeat):
+            streamed = service._parse_csv(data)
+        after = time.perf_counter() - start
+        print(f"  {len(data) / 1024 / 1024:5.1f} MB  整体解码 {before / repeat * 1000:8.1f} ms  "
+              f"流式 {after / repeat * 1000:6.1f} ms  加速 {before / after:7.1f}x  输出一致: {legacy == streamed}")
+
+
+def _legacy_docx_walk(service, data: bytes, url_map: dict) -> str:
+    """旧版 python-docx 遍历: 逐段序列化 XML 判断图片, 表格统一追加在所有段落之后。"""
+    import re
+    from io import BytesIO
+    from docx import Document
+    doc = Document(BytesIO(data))
+    img_count, rId_to_url = 0, {}
+    for rel_id, rel in doc.part.rels.items():
+        if "image" in getattr(rel, 'reltype', ''):
+            target = os.path.basename(str(rel.target_ref))
+            if target.lower() in {k.lower() for k in url_map}:
+                for k, v in url_map.items():
+                    if k.lower() == target.lower():
+                        rId_to_url[rel_id] = v
+                        break
+    paragraphs = []
+    for para in doc.paragraphs:
+        para_xml = para._element.xml
+        has_image = '<w:drawing' in para_xml or '<v:imagedata' in para_xml or '<wp:inline' in para_xml
+        text = para.text.strip()
+        if text:
+            if para.style and para.style.name and 'Heading' in para.style.name:
+                level = para.style.name.replace('Heading', '').strip()
+                paragraphs.append(f"{'#' * (int(level) if level.isdigit() else 2)} {text}")
+            else:
+                paragraphs.append(text)
+        if has_image:
+            img_count += 1
+            embed_match = re.search(r'r:embed="([^"]+)"', para_xml)
+            img_url = rId_to_url.get(embed_match.group(1)) if embed_match else None
+            if img_url:
+                paragraphs.append(f"![文档图片{img_count}]({img_url})")
+    for table in doc.tables:
+        rows = [[cell.text.strip() for cell in row.cells] for row in table.rows]
+        if rows:
+            paragraphs.append(service._rows_to_md_table(rows))
+    return service.cleaner.clean_document("\n\n".join(paragraphs))
+
+
+def bench_docx_walk(g: dict, repeat: int, path: str = "") -> None:
+    """DOCX 遍历: python-docx 逐段序列化 vs 单次 iterparse 遍历 word/document.xml (图片 URL 固定, 不计上传)。"""
+    path = path or os.path.join(HERE, "data", "行业调研数据采集-20260127-简版.docx")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            data = f.read()
+        label = os.path.basename(path)
+    else:
+        data, label = _make_docx(), "survey.docx (生成)"
+    service = g['DocumentParserService']()
+    service._image_url_map = lambda images: {name: f"https://img.example.com/{name}" for name, _, _ in images}
+    url_map = service._image_url_map(g['ParseContext'](data, ".docx").media('word/media/', service.MIN_IMG_BYTES))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        legacy = _legacy_docx_walk(service, data, url_map)
+    before = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeat):
+        walked = service._parse_docx(data)
+    after = time.perf_counter() - start
+
+    def _lines(text):
+        return {line for line in text.splitlines() if line.strip()}
+    missing = _lines(legacy) - _lines(walked)
+    print(f"\n[docx-walk] {label} ({len(data) / 1024 / 1024:.1f} MB), 重复 {repeat} 次")
+    print(f"  python-docx {before / repeat * 1000:8.1f} ms/份  输出 {len(legacy)} 字符")
+    print(f"  iterparse   {after / repeat * 1000:8.1f} ms/份  输出 {len(walked)} 字符  加速 {before / after:5.2f}x")
+    print(f"  旧输出中未出现在新输出的行: {len(missing)}")
+
+
+async def _legacy_stream_download(client, url: str) -> bytes:
+    """旧版下载: 整个正文累积在 bytearray, 结束时再复制为 bytes。"""
+    async with client.stream("GET", url) as resp:
+        buf = bytearray()
+        async for chunk in resp.aiter_bytes():
+            buf += chunk
+        return bytes(buf)
+
+
+def bench_download_spooling(g: dict, downloads: int = 10, size_mb: int = 15) -> None:
+    """并发下载大文档时父进程的 Python 堆峰值: 整份 bytes vs SpooledDownload (超过阈值落盘)。"""
+    import tracemalloc
+    import httpx
+    scraper = g['SearchApiScraper']()
+    payload = b"%PDF-1.4\n" + os.urandom(size_mb * 1024 * 1024)
+
+    class _Chunked(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for i in range(0, len(payload), 64 * 1024):
+                yield payload[i:i + 64 * 1024]
+                await asyncio.sleep(0)
+
+    transport = httpx.MockTransport(lambda req: httpx.Response(
+        200, headers={"content-type": "application/pdf"}, stream=_Chunked()))
+    print(f"\n[download-spool] {downloads} 个并发下载 x {size_mb} MB, 落盘阈值 "
+          f"{scraper.SPOOL_BYTES / 1024 / 1024:.0f} MB")
+
+    async def _legacy(client):
+        return await asyncio.gather(*(_legacy_stream_download(client, f"http://bench/{i}.pdf")
+                                      for i in range(downloads)))
+
+    async def _spooled(client):
+        results = await asyncio.gather(*(scraper._stream_download(f"http://bench/{i}.pdf", client, {})
+                                         for i in range(downloads)))
+        for d in results:
+            d["body"].close()
+        return results
+
+    async def _run(fn):
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await fn(client)
+
+    for label, fn in (("bytes", _legacy), ("spooled", _spooled)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        asyncio.run(_run(fn))
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {label:<8} {elapsed:6.2f}s  峰值 {peak / 1024 / 1024:7.1f} MB")
+
+
+def bench_streaming_cleaner(g: dict, repeat: int, chars: int = 2_000_000) -> None:
+    """超长报告 (默认 2M 字符) 清洗到 80k 字符预算: 全量清洗后截断 vs 流式清洗提前停止。"""
+    cleaner = g['DataCleaningPipeline']()
+    text = _make_scraped_page(7, chars)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        full = _legacy_clean_document(g, cleaner, text)
+    before = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(repeat):
+        streamed = cleaner.clean_document(text)
+    after = time.perf_counter() - start
+
+    print(f"\n[streaming-clean] {chars / 1e6:.1f}M 字符 -> 预算 {cleaner.max_content_length} 字符, 重复 {repeat} 次")
+    print(f"  全量清洗 {before / repeat * 1000:8.1f} ms/份")
+    print(f"  流式清洗 {after / repeat * 1000:8.1f} ms/份  加速 {before / after:5.2f}x")
+    print(f"  输出一致: {full == streamed}")
+
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="DocumentParserService 性能基准")
+    ap.add_argument("sample_dir", nargs="?", default="", help="样本目录, 缺省时生成混合语料")
+    ap.add_argument("--repeat", type=int, default=4, help="语料重复份数")
+    opts = ap.parse_args()
+
+    print("=" * 60)
+    print("DocumentParserService 性能基准")
+    print("=" * 60)
+    pipeline = load_pipeline()
+    docs = build_corpus(opts.sample_dir)
+    if not docs:
+        sys.exit("没有可用的基准语料")
+    print("语料: " + ", ".join(f"{n} ({len(d) / 1024:.0f} KB)" for n, _, d in docs))
+    bench_engine_modes(pipeline, docs, opts.repeat)
+    bench_pdf_single_pass(pipeline, docs, opts.repeat)
+    bench_pdf_page_parallel(pipeline, opts.repeat)
+    bench_table_prescreen(pipeline, opts.repeat)
+    bench_markitdown_input(pipeline, docs, opts.repeat)
+    bench_line_classifier(pipeline, opts.repeat)
+    bench_streaming_cleaner(pipeline, opts.repeat)
+    bench_html_extraction(pipeline)
+    bench_shared_tree(pipeline, opts.repeat)
+    bench_xlsx_streaming(pipeline)
+    bench_csv_streaming(pipeline, opts.repeat)
+    bench_docx_walk(pipeline, opts.repeat)
+    bench_download_spooling(pipeline)
@@ -5,6 +5,9 @@ import httpx
 import os
 import pprint
 import re
+import sqlite3
+import threading
+import time
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Set, Tuple
 from collections import defaultdict
@@ -20,6 +23,17 @@ class Config:
     RERANK_MODEL = "BAAI/bge-reranker-v2-m3"
     IS_DEBUG = True
     TIMEOUT = 90
+    # 上下文打包 (ContextPacker): 合并相邻切片、去重重叠文本、上提公共元数据
+    PACK_ENABLED = os.getenv("RETRIEVE_PACK_ENABLED", "false").lower() == "true"
+    # 每页 (slide) 的 retrieve_data 预算，0 表示不限制；单位为 char 或 token
+    PACK_SLIDE_BUDGET = int(os.getenv("RETRIEVE_PACK_SLIDE_BUDGET", "0"))
+    PACK_BUDGET_UNIT = os.getenv("RETRIEVE_PACK_BUDGET_UNIT", "char")
+    # 本地数据集镜像 (DatasetMirror): 为空表示不启用，文档详情与分段优先读本地
+    MIRROR_PATH = os.getenv("DIFY_MIRROR_PATH", "")
+    # 镜像最长可用时间 (小时)：数据集上次完整同步早于此时限时改为请求 Dify，0 表示不限制
+    MIRROR_MAX_AGE_HOURS = float(os.getenv("DIFY_MIRROR_MAX_AGE_HOURS", "24"))
+    # 需要同步的数据集 ID，逗号分隔 (供 sync_dify_mirror.py 使用)
+    MIRROR_DATASETS = [d.strip() for d in os.getenv("DIFY_MIRROR_DATASETS", "").split(",") if d.strip()]
 
 
 # --- 调试辅助 ---
@@ -35,19 +49,40 @@ def debug_print(data: Any, label: str = "DEBUG"):
 class DifyApiClient:
     """负责与 Dify Dataset 服务通信，并清洗数据"""
 
-    def __init__(self):
+    def __init__(self, mirror: Optional["DatasetMirror"] = None):
         self.base_url = f"http://{Config.BASE_IP}/v1/datasets"
         self.headers = {
             'Authorization': f'Bearer {Config.AUTH_TOKEN}',
             'Content-Type': 'application/json'
         }
         self.client = httpx.AsyncClient(headers=self.headers, timeout=Config.TIMEOUT)
+        # 本地镜像：命中时直接读本地，不再请求 Dify
+        self.mirror = mirror
 
     async def close(self):
         if not self.client.is_closed:
             await self.client.aclose()
 
+    async def list_documents(self, database_id: str) -> List[Dict]:
+        """分页获取数据集下的文档列表"""
+        all_docs = []
+        page = 1
+        url = f"{self.base_url}/{database_id}/documents"
+        while True:
+            resp = await self.client.get(url, params={'limit': 100, 'page': page})
+            resp.raise_for_status()
+            data = resp.json()
+            all_docs.extend(data.get("data", []))
+            if not data.get("has_more", False) or not data.get("data"):
+                break
+            page += 1
+        return all_docs
+
     async def fetch_document_detail(self, database_id: str, document_id: str) -> Dict[str, Any]:
+        if self.mirror:
+            detail = await asyncio.to_thread(self.mirror.get_document_detail, database_id, document_id)
+            if detail is not None:
+                return detail
         url = f"{self.base_url}/{database_id}/documents/{document_id}"
         try:
             resp = await self.client.get(url)
@@ -57,8 +92,15 @@ class DifyApiClient:
             print(f"⚠️ [Meta Error] DB: {database_id}, Doc: {document_id} - {e}")
             return {}
 
-    async def fetch_all_segments(self, database_id: str, document_id: str) -> List[Dict]:
-        """通过分页循环，获取一个文档下的所有切片"""
+    async def fetch_all_segments(self, database_id: str, document_id: str, strict: bool = False) -> List[Dict]:
+        """
+        通过分页循环，获取一个文档下的所有切片。
+        某页重试 3 次仍失败时默认返回已取到的部分；strict=True 时抛出 RuntimeError (镜像同步不能写入不完整的文档)。
+        """
+        if self.mirror:
+            segments = await asyncio.to_thread(self.mirror.get_segments, database_id, document_id)
+            if segments is not None:
+                return segments
         all_segments = []
         page = 1
         # 注意：这里的 URL 需要根据您的 Dify 版本确认。
@@ -94,8 +136,10 @@ class DifyApiClient:
                     print(f"⚠️ [Fetch Segments Error] DB:{database_id} Doc:{document_id} Page:{page} - {type(e).__name__}: {e}")
             
             if not success:
+                if strict:
+                    raise RuntimeError(f"segments page {page} failed for document {document_id}")
                 break
-            
+
             if not data.get("has_more", False):
                 break
             page += 1
@@ -148,6 +192,167 @@ class DifyApiClient:
             return []
 
 
+# --- 模块一 (扩展)：Dify 数据集本地镜像 ---
+class DatasetMirror:
+    """
+    Dify 数据集的本地只读镜像 (SQLite)。
+    保存文档列表、文档详情 (含元数据) 和全部分段，供检索节点直接读取，
+    减少 Tuoyu 模式下逐文档拉取详情/分段带来的大量 HTTP 请求。
+    读取在 asyncio.to_thread 中执行 (共用一个连接，按锁串行)；
+    数据集上次完整同步早于 max_age 秒前时视为未镜像，由调用方回退到 Dify API。
+    """
+
+    def __init__(self, path: str, max_age: float = 0.0):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS datasets (
+                dataset_id TEXT PRIMARY KEY,
+                synced_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS documents (
+                dataset_id TEXT,
+                document_id TEXT,
+                name TEXT,
+                version TEXT,
+                detail_json TEXT,
+                PRIMARY KEY (dataset_id, document_id)
+            );
+            CREATE TABLE IF NOT EXISTS segments (
+                dataset_id TEXT,
+                document_id TEXT,
+                segment_id TEXT,
+                position INTEGER,
+                content TEXT,
+                segment_json TEXT,
+                PRIMARY KEY (dataset_id, segment_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_segments_doc ON segments (dataset_id, document_id, position);
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    # ── 读取 ─────────────────────────────────────────────────
+    def _fresh_detail_row(self, database_id: str, document_id: str) -> Optional[sqlite3.Row]:
+        """文档详情行；文档未镜像或所属数据集已过期 (或从未完整同步) 时返回 None"""
+        fresh_after = time.time() - self.max_age if self.max_age > 0 else 0
+        return self.conn.execute(
+            "SELECT d.detail_json FROM documents d JOIN datasets s ON s.dataset_id = d.dataset_id "
+            "WHERE d.dataset_id = ? AND d.document_id = ? AND s.synced_at >= ?",
+            (database_id, document_id, fresh_after)).fetchone()
+
+    def get_document_detail(self, database_id: str, document_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._fresh_detail_row(database_id, document_id)
+        return json.loads(row["detail_json"]) if row else None
+
+    def get_segments(self, database_id: str, document_id: str) -> Optional[List[Dict]]:
+        """返回按 position 排序的全部分段；文档未镜像或镜像已过期时返回 None"""
+        with self._lock:
+            if self._fresh_detail_row(database_id, document_id) is None:
+                return None
+            rows = self.conn.execute(
+                "SELECT segment_json FROM segments WHERE dataset_id = ? AND document_id = ? ORDER BY position",
+                (database_id, document_id)).fetchall()
+        return [json.loads(r["segment_json"]) for r in rows]
+
+    def document_versions(self, database_id: str) -> Dict[str, str]:
+        rows = self.conn.execute(
+            "SELECT document_id, version FROM documents WHERE dataset_id = ?", (database_id,)).fetchall()
+        return {r["document_id"]: r["version"] for r in rows}
+
+    # ── 写入 ─────────────────────────────────────────────────
+    def upsert_document(self, database_id: str, detail: Dict, version: str, segments: List[Dict]):
+        doc_id = detail.get("id")
+        with self.conn:
+            self.conn.execute("DELETE FROM segments WHERE dataset_id = ? AND document_id = ?", (database_id, doc_id))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO documents (dataset_id, document_id, name, version, detail_json) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (database_id, doc_id, detail.get("name"), version, json.dumps(detail, ensure_ascii=False)))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO segments (dataset_id, document_id, segment_id, position, content, segment_json) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(database_id, doc_id, s.get("id"), s.get("position"), s.get("content", ""),
+                  json.dumps(s, ensure_ascii=False)) for s in segments])
+
+    def delete_documents(self, database_id: str, document_ids: List[str]):
+        with self.conn:
+            for doc_id in document_ids:
+                self.conn.execute("DELETE FROM segments WHERE dataset_id = ? AND document_id = ?", (database_id, doc_id))
+                self.conn.execute("DELETE FROM documents WHERE dataset_id = ? AND document_id = ?", (database_id, doc_id))
+
+    def mark_synced(self, database_id: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO datasets (dataset_id, synced_at) VALUES (?, ?)",
+                              (database_id, time.time()))
+
+
+class DatasetMirrorSync:
+    """按文档更新时间增量同步 Dify 数据集到本地镜像。"""
+
+    def __init__(self, mirror: DatasetMirror, concurrency: int = 8):
+        # 同步时必须直连 Dify，不能读取镜像本身
+        self.api = DifyApiClient(mirror=None)
+        self.mirror = mirror
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def close(self):
+        await self.api.close()
+
+    @staticmethod
+    def _version(doc: Dict) -> str:
+        """文档版本标识：更新时间 (缺失时用创建时间) + 字数，分段编辑也会改变字数"""
+        ts = doc.get("updated_at") or doc.get("created_at") or ""
+        return f"{ts}:{doc.get('word_count', '')}"
+
+    async def _sync_document(self, db_id: str, doc: Dict) -> bool:
+        async with self.semaphore:
+            detail = await self.api.fetch_document_detail(db_id, doc["id"])
+            if not detail:
+                return False
+            segments = await self.api.fetch_all_segments(db_id, doc["id"], strict=True)
+            expected = doc.get("segment_count")
+            if isinstance(expected, int) and len(segments) < expected:
+                print(f"⚠️ [Mirror] {db_id} document {doc['id']}: got {len(segments)}/{expected} segments, skipped")
+                return False
+            segments.sort(key=lambda x: x.get("position", 0))
+            self.mirror.upsert_document(db_id, detail, self._version(doc), segments)
+            return True
+
+    async def sync_dataset(self, db_id: str) -> Dict[str, int]:
+        print(f"🔄 [Mirror] Syncing dataset {db_id} ...")
+        remote_docs = await self.api.list_documents(db_id)
+        local_versions = self.mirror.document_versions(db_id)
+
+        # 只镜像已完成索引的文档；仍在索引中的文档保留旧版本，下次再同步
+        ready = [d for d in remote_docs if d.get("indexing_status", "completed") == "completed"]
+        changed = [d for d in ready if local_versions.get(d["id"]) != self._version(d)]
+        removed = [doc_id for doc_id in local_versions if doc_id not in {d["id"] for d in remote_docs}]
+
+        results = await asyncio.gather(*(self._sync_document(db_id, d) for d in changed), return_exceptions=True)
+        updated = sum(1 for r in results if r is True)
+        failed = len(results) - updated
+        for r in results:
+            if isinstance(r, Exception):
+                print(f"⚠️ [Mirror] {db_id} document sync error: {r}")
+
+        self.mirror.delete_documents(db_id, removed)
+        if not failed:
+            self.mirror.mark_synced(db_id)
+        stats = {"remote": len(remote_docs), "updated": updated, "failed": failed,
+                 "removed": len(removed), "unchanged": len(ready) - len(changed)}
+        print(f"✅ [Mirror] {db_id}: {stats}")
+        return stats
+
+    async def sync(self, dataset_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        return {db_id: await self.sync_dataset(db_id) for db_id in dataset_ids}
+
+
 # --- 模块二：RAG 服务 (算法核心) ---
 class RagService:
     @staticmethod
@@ -1679,6 +1884,8 @@ class TuoyuProcessor:
 
         # 构造最终输出，保留 query_groups 中的 ID 等信息
         packaged_data = self._package_results(final_results_list)
+        if Config.PACK_ENABLED:
+            packaged_data = ContextPacker().pack(packaged_data)
         
         final_output_list = []
         if query_groups:
@@ -1709,12 +1916,253 @@ class TuoyuProcessor:
             })
         return output
 
+
+# --- 模块六：上下文打包器 (缩减 retrieve_data 体积) ---
+class ContextPacker:
+    """
+    对 retrieve_data 做可选的“打包”压缩，减少下游 LLM 节点的输入体积：
+    1. 合并同一文档中位置连续的切片 (position 相邻)，并裁掉切片之间的重叠文本；
+    2. 去除被其他切片完整包含的切片 (父子切片重叠)；
+    3. 将 content_blocks 中重复的 doc_metadata 上提到文档级 shared_block_metadata；
+    4. 按每页预算 (字符或 token) 在各文档之间轮询选取切片，超出预算的部分截断。
+    """
+
+    MIN_OVERLAP = 20  # 相邻切片首尾重叠的最小判定长度
+    MAX_OVERLAP_SCAN = 1000  # 重叠检测的最大扫描长度
+    MIN_TAIL_CHARS = 200  # 预算剩余不足此值时不再截断补齐
+    _CJK_PATTERN = re.compile(r'[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]')
+
+    def __init__(self, budget: int = None, unit: str = None):
+        self.budget = Config.PACK_SLIDE_BUDGET if budget is None else budget
+        self.unit = (unit or Config.PACK_BUDGET_UNIT or "char").lower()
+
+    # ── 计量 ─────────────────────────────────────────────────
+    def measure(self, text: str) -> int:
+        """按配置单位计量文本长度。token 为粗略估算：中文按 1 字 1 token，其余按 4 字符 1 token。"""
+        if not text:
+            return 0
+        if self.unit != "token":
+            return len(text)
+        cjk = len(self._CJK_PATTERN.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def _cut(self, text: str, limit: int) -> str:
+        """截取不超过 limit 单位的前缀。"""
+        if self.measure(text) <= limit:
+            return text
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.measure(text[:mid]) <= limit:
+                lo = mid
+            else:
+                hi = mid - 1
+        return text[:lo]
+
+    # ── 文本合并与去重 ───────────────────────────────────────
+    @classmethod
+    def _merge_text(cls, head: str, tail: str) -> str:
+        """拼接相邻切片，若 head 的结尾与 tail 的开头重叠则只保留一份。"""
+        if not head:
+            return tail
+        if not tail or tail in head:
+            return head
+        max_len = min(len(head), len(tail), cls.MAX_OVERLAP_SCAN)
+        for size in range(max_len, cls.MIN_OVERLAP - 1, -1):
+            if head.endswith(tail[:size]):
+                return head + tail[size:]
+        return f"{head}\n{tail}"
+
+    @staticmethod
+    def _block_metadata(block: Dict) -> Optional[Dict]:
+        """块级 doc_metadata (Tuoyu)，不含由 content 派生的 raw_text；没有块级元数据时返回 None。"""
+        meta = block.get("doc_metadata")
+        if not isinstance(meta, dict):
+            return meta
+        return {k: v for k, v in meta.items() if k != "raw_text"}
+
+    @classmethod
+    def _merge_contiguous(cls, blocks: List[Dict]) -> List[Dict]:
+        """合并 position 连续的切片。块级 doc_metadata (Tuoyu) 不同的切片保持独立。"""
+        ordered = sorted(blocks, key=lambda b: (b.get("position") is None, b.get("position") or 0))
+        merged: List[Dict] = []
+        for block in ordered:
+            prev = merged[-1] if merged else None
+            pos = block.get("position")
+            if (prev is not None and isinstance(pos, int) and isinstance(prev.get("_last_position"), int)
+                    and pos == prev["_last_position"] + 1
+                    and cls._block_metadata(prev) == cls._block_metadata(block)):
+                if "doc_metadata" in prev:
+                    # 合并后 raw_text 不再等于 content，只保留其余元数据
+                    prev["doc_metadata"] = cls._block_metadata(prev)
+                prev["content"] = cls._merge_text(prev["content"], block.get("content") or "")
+                prev["positions"].append(pos)
+                prev["_last_position"] = pos
+                if block.get("score") is not None:
+                    prev["score"] = max(prev.get("score") or 0, block["score"])
+                continue
+            new_block = dict(block)
+            new_block["content"] = block.get("content") or ""
+            new_block["positions"] = [pos]
+            new_block["_last_position"] = pos
+            merged.append(new_block)
+
+        for block in merged:
+            block.pop("_last_position", None)
+            if len(block["positions"]) < 2:
+                block.pop("positions")
+        return merged
+
+    @classmethod
+    def _drop_contained(cls, blocks: List[Dict]) -> List[Dict]:
+        """
+        去掉内容被其他切片完整包含的切片 (父子切片/重复切片)。
+        带块级 doc_metadata 的切片 (Tuoyu) 只在被元数据相同的切片包含时去掉，元数据不同则保留。
+        """
+        by_length = sorted(range(len(blocks)), key=lambda i: len(blocks[i]["content"]), reverse=True)
+        kept_idx: List[int] = []
+        for i in by_length:
+            meta = cls._block_metadata(blocks[i])
+            text = blocks[i]["content"].strip()
+            if not text:
+                if meta is not None:
+                    kept_idx.append(i)
+                continue
+            if any(text in blocks[k]["content"] and (meta is None or cls._block_metadata(blocks[k]) == meta)
+                   for k in kept_idx):
+                continue
+            kept_idx.append(i)
+        kept = set(kept_idx)
+        return [b for i, b in enumerate(blocks) if i in kept]
+
+    # ── 元数据上提 ───────────────────────────────────────────
+    @classmethod
+    def _common_items(cls, dicts: List[Dict]) -> Dict[str, Any]:
+        """求多个字典中取值完全相同的键 (嵌套字典递归求交集)。"""
+        if len(dicts) < 2:
+            return {}
+        common = {}
+        for key, value in dicts[0].items():
+            if not all(key in d for d in dicts[1:]):
+                continue
+            values = [d[key] for d in dicts]
+            if all(isinstance(v, dict) for v in values):
+                sub = cls._common_items(values)
+                if sub:
+                    common[key] = sub
+            elif all(v == value for v in values[1:]):
+                common[key] = value
+        return common
+
+    @classmethod
+    def _subtract(cls, data: Dict, common: Dict) -> Dict:
+        result = {}
+        for key, value in data.items():
+            if key not in common:
+                result[key] = value
+            elif isinstance(value, dict) and isinstance(common[key], dict):
+                rest = cls._subtract(value, common[key])
+                if rest:
+                    result[key] = rest
+        return result
+
+    @classmethod
+    def _hoist_block_metadata(cls, doc: Dict) -> None:
+        blocks = doc.get("content_blocks", [])
+        metas = [b.get("doc_metadata") for b in blocks if isinstance(b.get("doc_metadata"), dict)]
+        if not metas:
+            return
+        for block in blocks:
+            meta = block.get("doc_metadata")
+            # raw_text 与 content 完全重复，无需再携带一份
+            if isinstance(meta, dict) and meta.get("raw_text") == block.get("content"):
+                block["doc_metadata"] = {k: v for k, v in meta.items() if k != "raw_text"}
+        if len(metas) != len(blocks):
+            return
+        common = cls._common_items([b["doc_metadata"] for b in blocks])
+        if not common:
+            return
+        doc["shared_block_metadata"] = common
+        for block in blocks:
+            rest = cls._subtract(block["doc_metadata"], common)
+            if rest:
+                block["doc_metadata"] = rest
+            else:
+                block.pop("doc_metadata")
+
+    # ── 主流程 ───────────────────────────────────────────────
+    def pack_document(self, doc: Dict) -> Dict:
+        if doc.get("source_type") in ("video", "error"):
+            return doc
+        packed = dict(doc)
+        if not doc.get("content_blocks"):
+            return packed
+        blocks = self._merge_contiguous(doc["content_blocks"])
+        blocks = self._drop_contained(blocks)
+        if doc.get("source_type") == "excerpt":
+            blocks.sort(key=lambda b: b.get("score") or 0, reverse=True)
+        packed["content_blocks"] = blocks
+        self._hoist_block_metadata(packed)
+        return packed
+
+    def _apply_budget(self, retrieve_data: List[Dict]) -> None:
+        """按文档轮询分配预算，保证每个文档都能先拿到排名最靠前的切片。"""
+        docs = [doc for db in retrieve_data for doc in db.get("document_infos", [])]
+        text_docs = [d for d in docs if d.get("source_type") not in ("video", "error")]
+        # 视频等结构化文档不参与截断，但其体积计入预算
+        remaining = self.budget - sum(
+            self.measure(json.dumps(d.get("content_blocks", []), ensure_ascii=False))
+            for d in docs if d.get("source_type") in ("video", "error")
+        )
+        queues = [list(d.get("content_blocks", [])) for d in text_docs]
+        picked: List[List[Dict]] = [[] for _ in text_docs]
+        while remaining > 0 and any(queues):
+            for i, queue in enumerate(queues):
+                if not queue or remaining <= 0:
+                    continue
+                block = queue.pop(0)
+                cost = self.measure(block.get("content", ""))
+                if cost <= remaining:
+                    picked[i].append(block)
+                    remaining -= cost
+                elif remaining >= self.MIN_TAIL_CHARS:
+                    picked[i].append({**block, "content": self._cut(block["content"], remaining) + "...",
+                                      "truncated": True})
+                    remaining = 0
+                else:
+                    remaining = 0
+        for doc, blocks in zip(text_docs, picked):
+            doc["content_blocks"] = blocks
+        for db in retrieve_data:
+            db["document_infos"] = [d for d in db.get("document_infos", [])
+                                    if d.get("content_blocks") or d.get("source_type") == "error"]
+
+    def pack(self, retrieve_data: List[Dict]) -> List[Dict]:
+        if not retrieve_data:
+            return retrieve_data
+        before = len(json.dumps(retrieve_data, ensure_ascii=False))
+        packed_data = []
+        for db in retrieve_data:
+            packed_data.append({
+                **db,
+                "document_infos": [self.pack_document(d) for d in db.get("document_infos", [])]
+            })
+        if self.budget > 0:
+            self._apply_budget(packed_data)
+        packed_data = [db for db in packed_data if db.get("document_infos")]
+        after = len(json.dumps(packed_data, ensure_ascii=False))
+        print(f"📦 [Pack] retrieve_data {before} -> {after} chars")
+        return packed_data
+
+
 # --- 主程序入口 ---
 async def async_main(tasks: List[Dict], query_groups: List[Dict] = None, 
                      regional_rules: Any = None, time_filter: Any = None, run_mode: str = "X-Pilot") -> Dict[str, Any]:
     if not tasks: return {"result": []}
     
-    client = DifyApiClient()
+    mirror = (DatasetMirror(Config.MIRROR_PATH, max_age=Config.MIRROR_MAX_AGE_HOURS * 3600)
+              if Config.MIRROR_PATH and os.path.exists(Config.MIRROR_PATH) else None)
+    client = DifyApiClient(mirror=mirror)
     
     try:
         # --- Tuoyu Mode Branch ---
@@ -1805,10 +2253,18 @@ async def async_main(tasks: List[Dict], query_groups: List[Dict] = None,
                     else:
                         # 如果是新的 Database，直接添加
                         slide["retrieve_data"].append(res)
+
+        # --- Stage 5: 可选的上下文打包 (合并/去重/预算裁剪) ---
+        if Config.PACK_ENABLED:
+            packer = ContextPacker()
+            for slide in slide_results:
+                slide["retrieve_data"] = packer.pack(slide["retrieve_data"])
         return {"result": slide_results}
 
     finally:
         await client.close()
+        if mirror:
+            mirror.close()
 
 
 def main(tasks: List[Dict], query_groups: List[Dict] = None, 
@@ -0,0 +1,34 @@
+# coding: utf-8
+"""
+将配置的 Dify 数据集增量同步到本地 SQLite 镜像，供 retrieve.py 读取。
+
+用法:
+    DIFY_MIRROR_PATH=./dify_mirror.db python sync_dify_mirror.py <dataset_id> [<dataset_id> ...]
+不传 dataset_id 时使用环境变量 DIFY_MIRROR_DATASETS (逗号分隔)。
+"""
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from retrieve import Config, DatasetMirror, DatasetMirrorSync
+
+
+async def run(dataset_ids):
+    mirror = DatasetMirror(Config.MIRROR_PATH)
+    syncer = DatasetMirrorSync(mirror)
+    try:
+        return await syncer.sync(dataset_ids)
+    finally:
+        await syncer.close()
+        mirror.close()
+
+
+if __name__ == "__main__":
+    ids = sys.argv[1:] or Config.MIRROR_DATASETS
+    if not Config.MIRROR_PATH:
+        sys.exit("请先设置环境变量 DIFY_MIRROR_PATH")
+    if not ids:
+        sys.exit("未指定需要同步的数据集 (参数或 DIFY_MIRROR_DATASETS)")
+    print(asyncio.run(run(ids)))
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from _bench_parser import load_pipeline
+
+
+class StubParserService:
+    """只实现 DocumentParseEngine 用到的接口; 解析结果带上执行所在的进程号。"""
+
+    def __init__(self):
+        self.trails = []
+        self.screens = []
+
+    @staticmethod
+    def _normalize_ext(ext: str) -> str:
+        return ext.lower()
+
+    def parse_deferred(self, data: bytes, ext: str, source_url: str) -> dict:
+        if data.startswith(b"sleep:"):
+            time.sleep(float(data[6:]))
+        return {"markdown": f"{os.getpid()}:{data.decode()}", "pending": {}, "digest": "", "ext": ext,
+                "trail": [{"strategy": "stub", "ok": True, "ms": 0.0}],
+                "table_screen": [{"source": source_url, "page": 1, "candidate": True, "tables": 1}]}
+
+    def extract_web_page(self, body: bytes, encoding: str, base_url: str) -> dict:
+        return {"content": f"{os.getpid()}:{body.decode(encoding)}", "videos": []}
+
+    def absorb_trail(self, ext: str, source_url: str, trail: list) -> None:
+        self.trails.append((ext, source_url, trail))
+
+    def absorb_table_screen(self, entries: list) -> None:
+        self.screens.extend(entries)
+
+    async def resolve_deferred(self, parsed: dict, client) -> str:
+        return parsed["markdown"]
+
+
+def setUpModule():
+    global DocumentParseEngine
+    DocumentParseEngine = load_pipeline()["DocumentParseEngine"]
+
+
+def pid_of(markdown: str) -> int:
+    return int(markdown.split(":", 1)[0])
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "需要 fork")
+class TestDocumentParseEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.service = StubParserService()
+
+    def run_engine(self, coro_fn, **kwargs):
+        async def _run():
+            engine = DocumentParseEngine(self.service, **kwargs)
+            try:
+                return engine, await coro_fn(engine)
+            finally:
+                await engine.aclose()
+        return asyncio.run(_run())
+
+    def test_pool_forked_lazily_and_parses_in_worker(self):
+        async def _go(engine):
+            self.assertEqual(engine._idle, [])
+            return await asyncio.gather(engine.parse(b"a", ".txt", "u1"), engine.parse(b"b", ".txt", "u2"),
+                                        engine.extract_html(b"page", "utf-8", "u3"))
+        engine, (a, b, page) = self.run_engine(_go, mode="process", workers=2, timeout=10)
+        self.assertNotEqual(pid_of(a), os.getpid())
+        self.assertNotEqual(pid_of(b), os.getpid())
+        self.assertTrue(a.endswith(":a") and b.endswith(":b"))
+        self.assertNotEqual(pid_of(page["content"]), os.getpid())
+        self.assertEqual((engine.stats["process"], engine.stats["web"], engine.stats["thread"]), (2, 1, 0))
+        self.assertEqual(len(self.service.trails), 2)
+        self.assertEqual(sorted(e["source"] for e in self.service.screens), ["u1", "u2"])
+
+    def test_unused_engine_forks_nothing(self):
+        async def _go(engine):
+            return None
+        engine, _ = self.run_engine(_go, mode="process", workers=2)
+        self.assertIsNone(engine._executor)
+        self.assertEqual(engine._idle, [])
+
+    def test_timeout_kills_worker_then_falls_back_to_thread(self):
+        async def _go(engine):
+            with self.assertRaises(TimeoutError):
+                await engine.parse(b"sleep:30", ".txt", "slow")
+            killed = not engine._idle
+            return killed, await engine.parse(b"c", ".txt", "after")
+        engine, (killed, after) = self.run_engine(_go, mode="process", workers=1, timeout=0.5)
+        self.assertTrue(killed)
+        self.assertEqual(engine.stats["timeout"], 1)
+        self.assertEqual(pid_of(after), os.getpid())
+        self.assertEqual(engine.stats["thread"], 1)
+
+    def test_cancelled_wait_drains_worker_instead_of_killing_it(self):
+        async def _go(engine):
+            slow = asyncio.create_task(engine.parse(b"sleep:0.5", ".txt", "slow"))
+            await asyncio.sleep(0.2)
+            slow.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await slow
+            worker_pid = next(iter(engine._draining))[0].pid
+            # 子进程完成被取消的任务之前, 名额仍被占用, 新任务排队等待同一个子进程
+            after = await engine.parse(b"e", ".txt", "after")
+            return worker_pid, after
+        engine, (worker_pid, after) = self.run_engine(_go, mode="process", workers=1, timeout=10)
+        self.assertEqual(pid_of(after), worker_pid)
+        self.assertEqual((engine.stats["drained"], engine.stats["thread"]), (1, 0))
+
+    def test_thread_mode(self):
+        async def _go(engine):
+            return await engine.parse(b"d", ".txt", "u")
+        engine, out = self.run_engine(_go, mode="thread")
+        self.assertEqual(pid_of(out), os.getpid())
+        self.assertIsNone(engine._executor)
+        self.assertEqual(engine.stats["thread"], 1)
+
+    def test_waiting_for_workers_leaves_default_executor_free(self):
+        async def _go(engine):
+            loop = asyncio.get_running_loop()
+            # 默认线程池只有一个线程: 等待子进程回复若占用它, to_thread 调用要等解析结束才能执行
+            from concurrent.futures import ThreadPoolExecutor
+            loop.set_default_executor(ThreadPoolExecutor(max_workers=1))
+            parse = asyncio.create_task(engine.parse(b"sleep:1.5", ".txt", "slow"))
+            await asyncio.sleep(0.3)
+            start = time.perf_counter()
+            await asyncio.to_thread(threading.get_ident)
+            waited = time.perf_counter() - start
+            await parse
+            return waited
+        _, waited = self.run_engine(_go, mode="process", workers=1, timeout=10)
+        self.assertLess(waited, 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
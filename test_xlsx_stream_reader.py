@@ -0,0 +1,124 @@
+import io
+import os
+import sys
+import unittest
+import zipfile
+from datetime import datetime, time, timedelta
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from _bench_parser import load_pipeline
+
+NS = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+REL_NS = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+
+
+def make_xlsx(rows_xml: str, shared_strings=(), date1904: bool = False, dimension: str = "") -> bytes:
+    """生成只含一个工作表的最小 xlsx; 样式 1 为内置日期格式 14, 样式 2 为自定义时长格式 [h]:mm:ss。"""
+    workbook_pr = '<workbookPr date1904="1"/>' if date1904 else '<workbookPr/>'
+    sst = "".join(f"<si><t>{s}</t></si>" for s in shared_strings)
+    files = {
+        "[Content_Types].xml":
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            '</Types>',
+        "_rels/.rels":
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="xl/workbook.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+            '</Relationships>',
+        "xl/workbook.xml":
+            f'<workbook {NS} {REL_NS}>{workbook_pr}'
+            '<sheets><sheet name="数据" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        "xl/_rels/workbook.xml.rels":
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="worksheets/sheet1.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+            '<Relationship Id="rId2" Target="sharedStrings.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"/>'
+            '<Relationship Id="rId3" Target="styles.xml" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>'
+            '</Relationships>',
+        "xl/styles.xml":
+            f'<styleSheet {NS}><numFmts count="1"><numFmt numFmtId="164" formatCode="[h]:mm:ss"/></numFmts>'
+            '<cellXfs count="3"><xf numFmtId="0"/><xf numFmtId="14"/><xf numFmtId="164"/></cellXfs></styleSheet>',
+        "xl/sharedStrings.xml": f'<sst {NS}>{sst}</sst>',
+        "xl/worksheets/sheet1.xml":
+            f'<worksheet {NS}>' + (f'<dimension ref="{dimension}"/>' if dimension else "")
+            + f'<sheetData>{rows_xml}</sheetData></worksheet>',
+    }
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, content in files.items():
+            zf.writestr(name, content)
+    return buf.getvalue()
+
+
+def setUpModule():
+    global XlsxStreamReader
+    XlsxStreamReader = load_pipeline()["XlsxStreamReader"]
+
+
+def read_xlsx(data: bytes, max_rows: int = 100) -> list:
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        return XlsxStreamReader(zf).read(max_rows)
+
+
+class TestXlsxStreamReader(unittest.TestCase):
+
+    def test_shared_and_inline_strings(self):
+        data = make_xlsx(
+            '<row r="1"><c r="A1" t="s"><v>1</v></c><c r="B1" t="inlineStr"><is><t>内联</t></is></c>'
+            '<c r="D1" t="s"><v>0</v></c></row>'
+            '<row r="2"><c r="A2" t="inlineStr"><is><r><t>富</t></r><r><t>文本</t></r></is></c>'
+            '<c r="B2"><v>3.5</v></c><c r="C2" t="b"><v>1</v></c></row>',
+            shared_strings=["第一", "第二"], dimension="A1:D2")
+        [(name, rows, total, truncated)] = read_xlsx(data)
+        self.assertEqual(name, "数据")
+        self.assertEqual(rows, [["第二", "内联", None, "第一"], ["富文本", 3.5, True, None]])
+        self.assertEqual((total, truncated), (2, False))
+
+    def test_dates_1900_system(self):
+        data = make_xlsx(
+            '<row r="1"><c r="A1" s="1"><v>45292</v></c><c r="B1" s="1"><v>59</v></c>'
+            '<c r="C1" s="1"><v>61</v></c><c r="D1" s="1"><v>0.5</v></c><c r="E1" s="2"><v>1.25</v></c></row>')
+        [(_, rows, _, _)] = read_xlsx(data)
+        self.assertEqual(rows[0], [datetime(2024, 1, 1), datetime(1900, 2, 28), datetime(1900, 3, 1),
+                                   time(12, 0), timedelta(days=1, hours=6)])
+
+    def test_dates_1904_system(self):
+        data = make_xlsx('<row r="1"><c r="A1" s="1"><v>43830</v></c><c r="B1" s="1"><v>59</v></c></row>',
+                         date1904=True)
+        [(_, rows, _, _)] = read_xlsx(data)
+        self.assertEqual(rows[0], [datetime(2024, 1, 1), datetime(1904, 2, 29)])
+
+    def test_row_budget_and_missing_rows(self):
+        rows_xml = "".join(f'<row r="{r}"><c r="A{r}"><v>{r}</v></c></row>' for r in (1, 2, 4, 5, 6))
+        [(_, rows, total, truncated)] = read_xlsx(make_xlsx(rows_xml, dimension="A1:A6"), max_rows=4)
+        self.assertEqual(rows, [[1], [2], [None], [4]])
+        self.assertEqual((total, truncated), (6, True))
+
+    @unittest.skipUnless(__import__("importlib").util.find_spec("openpyxl"), "openpyxl 未安装")
+    def test_matches_openpyxl(self):
+        import openpyxl
+        data = make_xlsx(
+            '<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" s="1"><v>43830.75</v></c><c r="C1"><v>7</v></c></row>',
+            shared_strings=["名称"], date1904=True, dimension="A1:C1")
+        wb = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+        expected = [list(row) for row in wb.worksheets[0].iter_rows(values_only=True)]
+        wb.close()
+        [(_, rows, _, _)] = read_xlsx(data)
+        self.assertEqual(rows, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
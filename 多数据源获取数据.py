@@ -1,4 +1,4 @@
-# Dify 依赖管理: markitdown-no-magika, httpx, trafilatura, beautifulsoup4, lxml, PyMuPDF, pdfplumber, python-pptx, python-docx, openpyxl, xlrd, Pillow
+# Dify 依赖管理: markitdown-no-magika, httpx, trafilatura, lxml, PyMuPDF, pdfplumber, python-pptx, openpyxl, xlrd, Pillow
 import asyncio
 import httpx
 import re
@@ -6,13 +6,31 @@ import os
 import json
 import time
 import traceback
-from typing import Any, Dict, List, Literal, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Literal, Optional
 from abc import ABC, abstractmethod
-from io import BytesIO
-from urllib.parse import urljoin
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from io import BytesIO, TextIOWrapper
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
 import tempfile
+import posixpath
 import base64
+import codecs
 import hashlib
+import itertools
+import struct
+import multiprocessing
+import sqlite3
+import threading
+import contextlib
+import contextvars
+import mmap
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
 
 try:
     from markitdown import MarkItDown  # pip install markitdown-no-magika (无 onnxruntime 依赖)
@@ -31,18 +49,11 @@ from trafilatura.settings import use_config
 # PyPDF2 用于解析PDF
 import pdfplumber
 import fitz
-# BeautifulSoup 用于辅助解析HTML（例如提取视频）
-from bs4 import BeautifulSoup
 import csv
 import zipfile
 import xml.etree.ElementTree as ET
 
 # --- 文件解析增强依赖 (可选, 缺失时自动降级到 MarkItDown) ---
-try:
-    from docx import Document as DocxDocument
-except ImportError:
-    DocxDocument = None
-
 try:
     from pptx import Presentation as PptxPresentation
     from pptx.enum.shapes import MSO_SHAPE_TYPE as PptxShapeType
@@ -104,10 +115,49 @@ def _dify_debug_return(data: Dict[str, Any], label: str = "Final Return") -> Dic
     return data
 
 
+# URL 规范化: 去除的跟踪参数 (精确匹配或前缀匹配);
+# "from" 不在其中: 部分国内站点用它选择正文内容, 去掉后会把不同页面误判为重复
+TRACKING_PARAMS = {"spm", "scm", "fbclid", "gclid", "msclkid", "yclid", "isappinstalled",
+                   "share_source", "share_medium", "share_from", "share_token", "vd_source", "wfr", "wxshare_count"}
+TRACKING_PARAM_PREFIXES = ("utm_", "spm_", "share_")
+# 移动版/桌面版镜像的主机名前缀与已知镜像域名
+MOBILE_HOST_PREFIXES = ("m.", "wap.", "3g.", "mobile.", "touch.")
+HOST_MIRRORS = {"news.sina.cn": "news.sina.com.cn", "sina.cn": "sina.com.cn", "m.thepaper.cn": "thepaper.cn",
+                "xw.qq.com": "news.qq.com", "m.gmw.cn": "gmw.cn"}
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    返回用于判重的规范化 URL (不用于请求): 统一 https、主机名小写并去掉 www. 与移动版前缀、
+    去掉默认端口、跟踪参数、片段与末尾斜杠, 其余查询参数按名称排序。
+    """
+    try:
+        parts = urlsplit(url.strip())
+        host = (parts.hostname or "").lower()
+    except ValueError:
+        return url.strip()
+    if not host:
+        return url.strip()
+    host = HOST_MIRRORS.get(host, host)
+    for prefix in ("www.",) + MOBILE_HOST_PREFIXES:
+        if host.startswith(prefix) and host.count(".") >= 2:
+            host = host[len(prefix):]
+            break
+    host = HOST_MIRRORS.get(host, host)
+    port = parts.port if parts.port not in (None, 80, 443) else None
+    netloc = f"{host}:{port}" if port else host
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+                   if k.lower() not in TRACKING_PARAMS and not k.lower().startswith(TRACKING_PARAM_PREFIXES))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(("https", netloc, path, urlencode(query), ""))
+
+
 def _parse_input_data(raw_input: Any) -> Dict[str, Any]:
     """
     健壮地解析上一个节点的输出，能同时处理带 "datas" 包装和不带包装的两种结构。
     并分离出不同来源的网页搜索URL、视频URL、招聘查询参数和企业名称，同时保留元数据。
+    网页 URL 按 canonicalize_url 去重, 每个规范 URL 只抓取一次; 所有引用它的 origin_key / 查询
+    记录在 references 中, 输出时再分发回各自的分组。
     """
     print(
         f"============== 步骤 1: 接收到原始输入 ==============\nTYPE: {type(raw_input)}\nVALUE: {raw_input}\n=======================================================")
@@ -152,9 +202,12 @@ def _parse_input_data(raw_input: Any) -> Dict[str, Any]:
 
     web_url_info_list = []
     video_url_info_list = []
+    web_by_canonical: Dict[str, Dict[str, Any]] = {}
+    web_reference_count = 0
 
     def _extract_urls(source_data, origin_key):
         """Helper to extract URLs from a list of query results."""
+        nonlocal web_reference_count
         if not isinstance(source_data, list): return
         for query_result in source_data:
             if not isinstance(query_result, dict): continue
@@ -198,8 +251,21 @@ def _parse_input_data(raw_input: Any) -> Dict[str, Any]:
                             "thumbnail_url": res.get(f"{provider}_thumbnail_url"),
                         })
                         video_url_info_list.append(info)
-                    else:
+                        continue
+
+                    web_reference_count += 1
+                    reference = {k: info[k] for k in ("origin_key", "query", "provider", "title", "source", "snippet")}
+                    canonical = canonicalize_url(info["url"])
+                    existing = web_by_canonical.get(canonical)
+                    if existing is None:
+                        info["canonical_url"] = canonical
+                        info["references"] = [reference]
+                        web_by_canonical[canonical] = info
                         web_url_info_list.append(info)
+                    else:
+                        existing["references"].append(reference)
+                        if info["url"].startswith("https://") and not existing["url"].startswith("https://"):
+                            existing["url"] = info["url"]
 
     # Process all sources
     _extract_urls(comprehensive_data, "comprehensive_data")
@@ -234,7 +300,7 @@ def _parse_input_data(raw_input: Any) -> Dict[str, Any]:
     }
 
     print(
-        f"============== 步骤 2: 输入解析完毕 ==============\n模式: {mode}\n网页URL数量: {len(web_url_info_list)}\n视频URL数量: {len(video_url_info_list)}\n招聘负载: {career_payload}\n企业名称列表: {enterprise_names} (共 {len(enterprise_names)} 个)\n=======================================================")
+        f"============== 步骤 2: 输入解析完毕 ==============\n模式: {mode}\n网页URL数量: {len(web_url_info_list)} (去重前 {web_reference_count})\n视频URL数量: {len(video_url_info_list)}\n招聘负载: {career_payload}\n企业名称列表: {enterprise_names} (共 {len(enterprise_names)} 个)\n=======================================================")
 
     return parsed_result
 
@@ -364,40 +430,243 @@ class EmbeddedImageUploader:
         '.tiff': 'image/tiff', '.tif': 'image/tiff', '.svg': 'image/svg+xml',
     }
 
+    UPLOAD_CONCURRENCY = int(os.environ.get("IMAGE_UPLOAD_CONCURRENCY", "4"))
+    # 延迟上传时正文中的图片占位: docimg://<图片内容 SHA-256>
+    PLACEHOLDER_PREFIX = "docimg://"
+    PLACEHOLDER_PATTERN = re.compile(r'!\[([^\]]*)\]\(docimg://([0-9a-f]{64})\)')
+    _url_cache = None
+
+    @classmethod
+    def url_cache(cls) -> "DocumentParseCache":
+        """图片内容哈希 -> URL 的持久化去重缓存 (与解析缓存同库)。"""
+        if cls._url_cache is None:
+            cls._url_cache = DocumentParseCache()
+        return cls._url_cache
+
+    @staticmethod
+    def _read_upload_response(resp_data: dict) -> Dict[str, str]:
+        url_map = {}
+        if resp_data.get("status") and resp_data.get("data"):
+            for item in resp_data["data"]:
+                orig = item.get("originalname", "")
+                url = item.get("url", "")
+                if orig and url:
+                    url_map[orig] = url
+                    print(f"    📤 已上传: {orig} -> {url}")
+        return url_map
+
     @classmethod
     def upload_images(cls, images: List[tuple]) -> Dict[str, str]:
         """
         批量上传图片，返回 {原始文件名: 可访问URL} 映射。
         images: [(filename, binary_data, mime_type), ...]
+        内容相同的图片只上传一次, 历史上传过的直接复用缓存中的 URL。
         """
         if not images:
             return {}
-        url_map: Dict[str, str] = {}
-        for i in range(0, len(images), cls.MAX_BATCH):
-            batch = images[i:i + cls.MAX_BATCH]
-            files_payload = [('files', (fname, data, mime)) for fname, data, mime in batch]
-            try:
-                with httpx.Client(timeout=60, verify=False) as client:
-                    resp = client.post(cls.UPLOAD_URL, files=files_payload)
+        cache = cls.url_cache()
+        digests = {fname: hashlib.sha256(data).hexdigest() for fname, data, _ in images}
+        known = cache.get_image_urls(list(set(digests.values())))
+        url_map: Dict[str, str] = {fname: known[d] for fname, d in digests.items() if d in known}
+        todo = [img for img in images if img[0] not in url_map]
+        if url_map:
+            print(f"    ♻️ {len(url_map)} 张图片命中上传缓存")
+        if todo:
+            with httpx.Client(timeout=60, verify=False) as client:
+                for i in range(0, len(todo), cls.MAX_BATCH):
+                    batch = todo[i:i + cls.MAX_BATCH]
+                    files_payload = [('files', (fname, data, mime)) for fname, data, mime in batch]
+                    try:
+                        resp = client.post(cls.UPLOAD_URL, files=files_payload)
+                        resp.raise_for_status()
+                        url_map.update(cls._read_upload_response(resp.json()))
+                    except Exception as e:
+                        print(f"⚠️ 图片批次上传失败: {e}")
+            cache.put_image_urls({digests[f]: url_map[f] for f, _, _ in todo if f in url_map})
+        return url_map
+
+    @classmethod
+    async def upload_pending(cls, pending: Dict[str, tuple], client: httpx.AsyncClient) -> Dict[str, str]:
+        """
+        异步上传待处理图片, 返回 {图片内容 SHA-256: URL}。
+        pending: {sha256: (filename, binary_data, mime_type)}, 已按内容去重;
+        先查持久化缓存, 其余按 MAX_BATCH 分批, 最多 UPLOAD_CONCURRENCY 个批次并发上传。
+        上传时以哈希前缀命名, 避免不同文档的同名图片 (如 pdf_image_1.png) 在同一批次内冲突。
+        """
+        if not pending:
+            return {}
+        cache = cls.url_cache()
+        url_by_digest = await asyncio.to_thread(cache.get_image_urls, list(pending))
+        todo = []
+        for digest, (fname, data, mime) in pending.items():
+            if digest not in url_by_digest:
+                todo.append((f"{digest[:24]}{os.path.splitext(fname)[1]}", data, mime, digest))
+        if url_by_digest:
+            print(f"    ♻️ {len(url_by_digest)}/{len(pending)} 张图片命中上传缓存")
+        if not todo:
+            return url_by_digest
+
+        slots = asyncio.Semaphore(cls.UPLOAD_CONCURRENCY)
+
+        async def _post(batch: List[tuple]) -> Dict[str, str]:
+            async with slots:
+                try:
+                    resp = await client.post(cls.UPLOAD_URL, timeout=60,
+                                             files=[('files', (name, data, mime)) for name, data, mime, _ in batch])
                     resp.raise_for_status()
-                    resp_data = resp.json()
-                    if resp_data.get("status") and resp_data.get("data"):
-                        for item in resp_data["data"]:
-                            orig = item.get("originalname", "")
-                            url = item.get("url", "")
-                            if orig and url:
-                                url_map[orig] = url
-                                print(f"    📤 已上传: {orig} -> {url}")
-            except Exception as e:
-                print(f"⚠️ 图片批次上传失败: {e}")
+                    uploaded = cls._read_upload_response(resp.json())
+                    return {digest: uploaded[name] for name, _, _, digest in batch if name in uploaded}
+                except Exception as e:
+                    print(f"⚠️ 图片批次上传失败: {e}")
+                    return {}
+
+        batches = [todo[i:i + cls.MAX_BATCH] for i in range(0, len(todo), cls.MAX_BATCH)]
+        fresh: Dict[str, str] = {}
+        for result in await asyncio.gather(*(_post(b) for b in batches)):
+            fresh.update(result)
+        if fresh:
+            await asyncio.to_thread(cache.put_image_urls, fresh)
+        url_by_digest.update(fresh)
+        return url_by_digest
+
+    @classmethod
+    def resolve_placeholders(cls, md_text: str, url_by_digest: Dict[str, str]) -> str:
+        """把 docimg:// 占位替换为真实 URL; 上传失败的图片只保留 ![alt], 与同步上传失败时一致。"""
+        def _sub(m: re.Match) -> str:
+            url = url_by_digest.get(m.group(2))
+            return f"![{m.group(1)}]({url})" if url else f"![{m.group(1) or '图片'}]"
+        return cls.PLACEHOLDER_PATTERN.sub(_sub, md_text)
+
+    # ── 上传前规范化: 缩放 / 重新编码 / 近似重复去除 ─────────
+    MAX_DIM = int(os.environ.get("IMAGE_MAX_DIM", "1600"))
+    TARGET_FORMAT = os.environ.get("IMAGE_TARGET_FORMAT", "webp").lower()  # webp | jpeg
+    TARGET_QUALITY = int(os.environ.get("IMAGE_TARGET_QUALITY", "80"))
+    # 内容完全相同的图片总是只上传一张; dHash 汉明距离不超过该值且尺寸相同的视为近似重复,
+    # 默认 -1 关闭 (同一版式、不同数字的表格/表单截图 dHash 几乎相同, 合并会显示错误的数据)
+    DEDUP_DISTANCE = int(os.environ.get("IMAGE_DEDUP_DISTANCE", "-1"))
+    LOSSLESS_FORMATS = {"PNG", "BMP", "TIFF"}
+    # 浏览器无法直接展示的格式, 即使重新编码后不更小也要转换
+    NON_WEB_FORMATS = {"BMP", "TIFF"}
+
+    @staticmethod
+    def _dhash(img) -> int:
+        """64 位差值哈希 (dHash): 9x8 灰度缩略图中相邻像素的明暗关系。"""
+        small = img.convert("L").resize((9, 8), PILImage.BILINEAR)
+        px = list(small.getdata())
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+        return bits
+
+    @classmethod
+    def _encode(cls, img) -> tuple:
+        """按目标格式编码, 返回 (字节, 扩展名, MIME)。JPEG 不支持透明, 透明背景铺白。"""
+        has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+        buf = BytesIO()
+        if cls.TARGET_FORMAT == "jpeg":
+            if has_alpha:
+                rgba = img.convert("RGBA")
+                img = PILImage.new("RGB", rgba.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.split()[3])
+            elif img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.save(buf, format="JPEG", quality=cls.TARGET_QUALITY, optimize=True)
+            return buf.getvalue(), ".jpg", "image/jpeg"
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if has_alpha else "RGB")
+        img.save(buf, format="WEBP", quality=cls.TARGET_QUALITY, method=4)
+        return buf.getvalue(), ".webp", "image/webp"
+
+    @classmethod
+    def _normalize_one(cls, data: bytes, mime: str) -> tuple:
+        """返回 (字节, 新扩展名或 None, MIME, (dHash, 原尺寸) 或 None); 无法识别的图片原样返回。"""
+        try:
+            with PILImage.open(BytesIO(data)) as img:
+                fmt = (img.format or "").upper()
+                if getattr(img, "n_frames", 1) > 1 and fmt != "TIFF":  # 动图保持原样, 多页 TIFF 取首页
+                    return data, None, mime, None
+                img.load()
+                dhash = (cls._dhash(img), img.size) if cls.DEDUP_DISTANCE >= 0 else None
+                resized = max(img.size) > cls.MAX_DIM
+                if resized:
+                    img.thumbnail((cls.MAX_DIM, cls.MAX_DIM), PILImage.LANCZOS)
+                if not (resized or fmt in cls.LOSSLESS_FORMATS):
+                    return data, None, mime, dhash
+                new_data, new_ext, new_mime = cls._encode(img)
+                if len(new_data) < len(data) or fmt in cls.NON_WEB_FORMATS:
+                    return new_data, new_ext, new_mime, dhash
+                return data, None, mime, dhash
+        except Exception:
+            return data, None, mime, None
+
+    @classmethod
+    def normalize_images(cls, images: List[tuple]) -> tuple:
+        """
+        上传前的图片规范化 (在解析 worker 中执行):
+        - 长边超过 MAX_DIM 的等比缩小;
+        - PNG/BMP/TIFF 及缩小过的图片重新编码为 WebP/JPEG, 仅在体积变小 (或原格式无法在网页展示) 时采用;
+        - 内容完全相同的图片只上传第一张; DEDUP_DISTANCE ≥ 0 时, 尺寸相同且 dHash 汉明距离 ≤ DEDUP_DISTANCE
+          的近似重复图片也只上传第一张。
+        返回 (待上传图片, {原文件名: 待上传图片的文件名}), 后者用于把改名/去重的图片映射到同一个 URL。
+        """
+        if PILImage is None or not images:
+            return images, {}
+        kept: List[tuple] = []
+        aliases: Dict[str, str] = {}
+        hashes: List[tuple] = []
+        exact: Dict[str, str] = {}
+        used_names = {fname for fname, _, _ in images}
+        before = after = dropped = 0
+        for fname, data, mime in images:
+            before += len(data)
+            digest = hashlib.sha256(data).hexdigest()
+            if digest in exact:
+                aliases[fname] = exact[digest]
+                dropped += 1
+                continue
+            new_data, new_ext, new_mime, dhash = cls._normalize_one(data, mime)
+            if dhash is not None:
+                twin = next((name for (h, size), name in hashes
+                             if size == dhash[1] and bin(h ^ dhash[0]).count("1") <= cls.DEDUP_DISTANCE), None)
+                if twin:
+                    aliases[fname] = twin
+                    dropped += 1
+                    continue
+            new_name = fname
+            if new_ext and not fname.lower().endswith(new_ext):
+                base = os.path.splitext(fname)[0]
+                new_name, n = f"{base}{new_ext}", 1
+                while new_name in used_names:
+                    new_name, n = f"{base}_{n}{new_ext}", n + 1
+                used_names.add(new_name)
+                aliases[fname] = new_name
+            exact[digest] = new_name
+            if dhash is not None:
+                hashes.append((dhash, new_name))
+            kept.append((new_name, new_data, new_mime))
+            after += len(new_data)
+        if before:
+            print(f"  🗜️ 图片规范化: {len(images)} 张 -> {len(kept)} 张 (重复 {dropped} 张), "
+                  f"{before / 1024:.0f} KB -> {after / 1024:.0f} KB, 节省 {(before - after) / 1024:.0f} KB "
+                  f"({(before - after) / before:.0%})")
+        return kept, aliases
+
+    @staticmethod
+    def apply_aliases(url_map: Dict[str, str], aliases: Dict[str, str]) -> Dict[str, str]:
+        """让改名/被去重的原文件名指向实际上传图片的 URL。"""
+        for orig, target in aliases.items():
+            if target in url_map:
+                url_map[orig] = url_map[target]
         return url_map
 
     @classmethod
-    def extract_from_zip(cls, data: bytes, media_prefix: str, min_size: int = 5120) -> List[tuple]:
-        """从 ZIP 格式文档 (docx/pptx) 中提取 media 目录下的图片。"""
+    def extract_from_zip(cls, data: bytes, media_prefix: str, min_size: int = 5120,
+                         zf: Optional[zipfile.ZipFile] = None) -> List[tuple]:
+        """从 ZIP 格式文档 (docx/pptx) 中提取 media 目录下的图片; zf 为已打开的 ZipFile 时直接复用。"""
         images = []
         try:
-            with zipfile.ZipFile(BytesIO(data)) as zf:
+            with (contextlib.nullcontext(zf) if zf is not None else zipfile.ZipFile(BytesIO(data))) as zf:
                 for name in zf.namelist():
                     if not name.startswith(media_prefix):
                         continue
@@ -414,6 +683,12 @@ class EmbeddedImageUploader:
             print(f"⚠️ ZIP 图片提取失败: {e}")
         return images
 
+    @staticmethod
+    def pdf_image_entry(img_idx: int, img_bytes: bytes) -> tuple:
+        """PDF 图片命名规则: pdf_image_{序号}.{png|jpg}, 与正文中的 (pdf_image_{序号}) 占位一一对应。"""
+        ext = "jpg" if img_bytes[:3] == b'\xff\xd8\xff' else "png"
+        return f"pdf_image_{img_idx}.{ext}", img_bytes, f"image/{ext}"
+
     @classmethod
     def extract_from_pdf(cls, data: bytes, max_pages: int = 50, min_size: int = 5120, min_dim: int = 50) -> List[tuple]:
         """从 PDF 中提取嵌入图片 (fitz)，按页面顺序返回。"""
@@ -435,11 +710,7 @@ class EmbeddedImageUploader:
                         if len(img_bytes) < min_size:
                             continue
                         img_idx += 1
-                        ext = "png"
-                        if img_bytes[:3] == b'\xff\xd8\xff':
-                            ext = "jpg"
-                        fname = f"pdf_image_{img_idx}.{ext}"
-                        images.append((fname, img_bytes, f"image/{ext}"))
+                        images.append(cls.pdf_image_entry(img_idx, img_bytes))
         except Exception as e:
             print(f"⚠️ PDF 图片提取失败: {e}")
         return images
@@ -449,159 +720,886 @@ class EmbeddedImageUploader:
 # ================ 数据清洗管道 (DataCleaningPipeline) ================
 # ==============================================================================
 
-class DataCleaningPipeline:
-    """LLM 友好的多阶段数据清洗管道，所有输出均为干净的 Markdown 字符串。"""
-
-    _NOISY_PATTERNS = [re.compile(p, re.IGNORECASE) for p in [
+class NoiseLineClassifier:
+    """
+    单遍噪声行分类器: 所有噪声规则合并为一个交替正则, 每行一次 search 完成判定;
+    链接密度规则先用 "](" 计数做字面量预筛, 只有可能超过阈值的行才执行 findall,
+    责任编辑替换同样先检查字面量。DataCleaningPipeline 与 SearchApiScraper 共用。
+    """
+    # 规则与原逐条匹配的版本等价 (search 语义下去掉了可为空的前缀 .* / .{0,50})
+    NOISY_RULES = [
         r'^[\-=*#_]{3,}$',
-        r'.*\.(html|shtml|htm|php)\s*$',
-        r'.{0,50}(搜狐|网易|腾讯|新浪|登录|注册|版权所有|版权声明).{0,50}$',
+        r'\.(?:html|shtml|htm|php)\s*$',
+        r'(?:搜狐|网易|腾讯|新浪|登录|注册|版权所有|版权声明).{0,50}$',
         r'\[\d+\]|\[下一页\]|\[上一页\]',
-        r'\[(编辑|查看历史|讨论|阅读|来源|原标题)\]',
+        r'\[(?:编辑|查看历史|讨论|阅读|来源|原标题)\]',
         r'^\*+\s*\[.*?\]\(.*?\)',
-        r'^\s*(分享到|扫描二维码|返回搜狐|查看更多|责任编辑|记者|通讯员)',
-        r'^\s*([京公网安备京网文京ICP备]|互联网新闻信息服务许可证|信息网络传播视听节目许可证)',
-    ]]
-    _IMG_PATTERN = re.compile(r'(!\[(.*?)\]\((.*?)\))')
-    _LINK_PATTERN = re.compile(r'\[.*?\]\(.*?\)')
-    _EDITOR_PATTERN = re.compile(r'(\(|\[)\s*责任编辑：.*?\s*(\)|\])')
-    _PAGE_NUM_PATTERN = re.compile(
-        r'^\s*[-—]\s*\d+\s*[-—]\s*$|'
-        r'^\s*第\s*\d+\s*页\s*(共\s*\d+\s*页)?\s*$|'
-        r'^\s*Page\s+\d+\s*(of\s+\d+)?\s*$',
-        re.IGNORECASE
-    )
+        r'^\s*(?:分享到|扫描二维码|返回搜狐|查看更多|责任编辑|记者|通讯员)',
+        r'^\s*(?:[京公网安备京网文京ICP备]|互联网新闻信息服务许可证|信息网络传播视听节目许可证)',
+    ]
+    PAGE_NUM_RULES = [
+        r'^\s*[-—]\s*\d+\s*[-—]\s*$',
+        r'^\s*第\s*\d+\s*页\s*(?:共\s*\d+\s*页)?\s*$',
+        r'^\s*Page\s+\d+\s*(?:of\s+\d+)?\s*$',
+    ]
+    LINK_PATTERN = re.compile(r'\[.*?\]\(.*?\)')
+    EDITOR_PATTERN = re.compile(r'(\(|\[)\s*责任编辑：.*?\s*(\)|\])')
+    EDITOR_LITERAL = "责任编辑："
+
+    def __init__(self, include_page_numbers: bool = False):
+        rules = self.NOISY_RULES + (self.PAGE_NUM_RULES if include_page_numbers else [])
+        self._search = re.compile("|".join(f"(?:{r})" for r in rules), re.IGNORECASE).search
+
+    def is_noisy(self, stripped: str) -> bool:
+        """stripped 为已去除首尾空白的行。"""
+        if not stripped or self._search(stripped):
+            return True
+        # 每个链接都包含 "](", 出现次数不足 3 时不可能超过链接数阈值
+        if stripped.count("](") > 2:
+            links = self.LINK_PATTERN.findall(stripped)
+            if len(links) > 2 and len(stripped) / (len(links) + 1) < 30:
+                return True
+        return False
+
+    def iter_clean(self, lines: Iterable[str]) -> Iterator[str]:
+        """惰性去掉噪声行与责任编辑标注, 逐个产出非空的行 (已去除首尾空白)。"""
+        is_noisy, editor = self.is_noisy, self.EDITOR_LITERAL
+        for line in lines:
+            stripped = line.strip()
+            if is_noisy(stripped):
+                continue
+            if editor in stripped:
+                stripped = self.EDITOR_PATTERN.sub('', stripped).strip()
+            if stripped:
+                yield stripped
+
+
+class DataCleaningPipeline:
+    """
+    LLM 友好的多阶段数据清洗管道，所有输出均为干净的 Markdown 字符串。
+    各阶段 (页眉页脚 -> 噪声行 -> 空白折叠) 都是逐行生成器, 输出达到 max_content_length 后
+    立即停止, 超长文档不会为了被截掉的部分做完整清洗。
+    """
+
+    _NOISE = NoiseLineClassifier()
+    # 文档额外过滤页码行
+    _DOC_NOISE = NoiseLineClassifier(include_page_numbers=True)
+    # 与 str.splitlines 相同的换行符集合
+    _LINE_BREAK = re.compile(r'\r\n|[\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]')
     _REPEATED_LINE_THRESHOLD = 3
+    # 页眉页脚只在文档开头的若干行内统计
+    HEADER_SAMPLE_LINES = 3000
 
     def __init__(self, max_content_length: int = 80000):
         self.max_content_length = max_content_length
 
     @classmethod
     def _is_noisy_line(cls, line: str) -> bool:
-        stripped = line.strip()
-        if not stripped:
-            return True
-        for pat in cls._NOISY_PATTERNS:
-            if pat.search(stripped):
-                return True
-        links = cls._LINK_PATTERN.findall(stripped)
-        if len(links) > 2 and len(stripped) / (len(links) + 1) < 30:
-            return True
-        return False
+        return cls._NOISE.is_noisy(line.strip())
+
+    @classmethod
+    def _iter_lines(cls, text: str) -> Iterator[str]:
+        """与 text.splitlines() 结果相同, 但不一次性切分整个文本。"""
+        pos = 0
+        for m in cls._LINE_BREAK.finditer(text):
+            yield text[pos:m.start()]
+            pos = m.end()
+        if pos < len(text):
+            yield text[pos:]
 
     @staticmethod
-    def _normalize_whitespace(text: str) -> str:
-        lines = text.splitlines()
-        out, prev_empty = [], False
+    def _iter_normalized(lines: Iterable[str]) -> Iterator[str]:
+        """去除每行首尾空白, 连续空行折叠为一行, 不产出首尾空行。"""
+        started, pending_empty = False, False
         for line in lines:
             stripped = line.strip()
             if not stripped:
-                if not prev_empty:
-                    out.append("")
-                prev_empty = True
-            else:
-                out.append(stripped)
-                prev_empty = False
-        return "\n".join(out).strip()
+                pending_empty = started
+                continue
+            if pending_empty:
+                yield ""
+                pending_empty = False
+            started = True
+            yield stripped
 
     @classmethod
-    def _remove_repeated_headers_footers(cls, text: str) -> str:
-        lines = text.splitlines()
-        if len(lines) < 20:
-            return text
+    def _iter_without_headers_footers(cls, lines: Iterator[str]) -> Iterator[str]:
+        """在前 HEADER_SAMPLE_LINES 行中统计出现 >= 阈值次的短行, 视为页眉页脚并在全文中去除。"""
+        sample = list(itertools.islice(lines, cls.HEADER_SAMPLE_LINES))
+        if len(sample) < 20:
+            yield from sample
+            return
         line_counts: Dict[str, int] = {}
-        for line in lines:
+        for line in sample:
             s = line.strip()
             if s and len(s) < 100:
                 line_counts[s] = line_counts.get(s, 0) + 1
         repeated = {s for s, c in line_counts.items() if c >= cls._REPEATED_LINE_THRESHOLD}
+        rest = itertools.chain(sample, lines)
         if not repeated:
-            return text
-        return "\n".join(l for l in lines if l.strip() not in repeated)
-
-    def _truncate(self, text: str, label: str = "内容") -> str:
-        if len(text) > self.max_content_length:
-            return text[:self.max_content_length] + f"\n\n...[{label}过长，已截断至 {self.max_content_length} 字符]"
-        return text
+            yield from rest
+            return
+        for line in rest:
+            if line.strip() not in repeated:
+                yield line
+
+    def _join_within_budget(self, lines: Iterable[str], label: str = "内容") -> str:
+        """拼接生成器产出的行; 长度超过 max_content_length 时截断并停止消费上游。"""
+        limit = self.max_content_length
+        parts, size = [], -1
+        for line in lines:
+            parts.append(line)
+            size += len(line) + 1
+            if size > limit:
+                return "\n".join(parts)[:limit] + f"\n\n...[{label}过长，已截断至 {limit} 字符]"
+        return "\n".join(parts)
 
     def clean_document(self, text: str) -> str:
         if not text:
             return ""
-        text = self._remove_repeated_headers_footers(text)
-        lines = text.splitlines()
-        cleaned = []
-        for line in lines:
-            if self._PAGE_NUM_PATTERN.search(line.strip()):
-                continue
-            if self._is_noisy_line(line):
-                continue
-            line = self._EDITOR_PATTERN.sub('', line).strip()
-            if line:
-                cleaned.append(line)
-        result = self._normalize_whitespace("\n".join(cleaned))
-        return self._truncate(result, "文档内容")
+        lines = self._iter_without_headers_footers(self._iter_lines(text))
+        return self._join_within_budget(self._DOC_NOISE.iter_clean(lines), "文档内容")
 
     def clean_html(self, text: str) -> str:
         if not text:
             return ""
-        lines = text.splitlines()
-        cleaned = []
-        for line in lines:
-            if self._is_noisy_line(line):
-                continue
-            line = self._EDITOR_PATTERN.sub('', line).strip()
-            if line:
-                cleaned.append(line)
-        result = self._normalize_whitespace("\n".join(cleaned))
-        return self._truncate(result, "网页内容")
+        return self._join_within_budget(self._NOISE.iter_clean(self._iter_lines(text)), "网页内容")
 
     def clean_table(self, text: str) -> str:
         if not text:
             return ""
-        text = self._normalize_whitespace(text)
-        return self._truncate(text, "表格内容")
+        return self._join_within_budget(self._iter_normalized(self._iter_lines(text)), "表格内容")
 
     def clean_text(self, text: str) -> str:
         if not text:
             return ""
-        text = self._normalize_whitespace(text)
-        return self._truncate(text)
+        return self._join_within_budget(self._iter_normalized(self._iter_lines(text)))
 
     async def validate_image_urls(self, md_text: str, client: httpx.AsyncClient) -> str:
-        MAX_TO_VALIDATE = 25
-        matches = list(self._IMG_PATTERN.finditer(md_text))
-        if not matches:
-            return md_text
-        urls_all = {m.group(3).strip() for m in matches}
-        urls_to_check = set(list(urls_all)[:MAX_TO_VALIDATE])
+        return await ImageUrlValidator.shared().filter_markdown(md_text, client)
+
+
+# ==============================================================================
+# ============ 文档解析缓存 (DocumentParseCache, 内容寻址) ============
+# ==============================================================================
 
-        async def _check(u):
-            if not u or not u.startswith(('http://', 'https://')):
-                return u, False
+class DocumentParseCache:
+    """
+    内容寻址的文档解析缓存 (SQLite)。
+    键: (文档字节 SHA-256, 扩展名, 解析器版本); 值: 清洗后的 Markdown + 图片上传 URL 映射。
+    同一份政策 PDF / Excel 被不同搜索源或多次运行命中时, 直接复用结果, 不再重复解析和上传图片。
+    同库另有两张表:
+    - image_urls: 图片内容 SHA-256 -> 已上传 URL, 供 EmbeddedImageUploader 跨文档/跨运行去重;
+    - image_checks: 网页图片 URL 的 HEAD 校验结果, 供 ImageUrlValidator 在 TTL 内复用;
+    - parser_stats: 各格式候选解析器的尝试/成功次数与累计耗时, 供解析策略排序。
+    每次读写单独建连接, 线程与 fork 出的解析子进程可以安全共用同一个库文件。
+    DOC_PARSE_CACHE_PATH 置空即关闭缓存。
+    """
+    PATH = os.environ.get("DOC_PARSE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "doc_parse_cache.db"))
+    # 上传图片的 URL 复用期限 (天), 超期后重新上传; 含图片 URL 的解析结果同样在该期限后失效
+    IMAGE_URL_TTL_DAYS = float(os.environ.get("IMAGE_URL_CACHE_TTL_DAYS", "30"))
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = self.PATH if path is None else path
+        self.enabled = bool(self.path)
+        self.stats = {"hit": 0, "miss": 0, "store": 0}
+        if self.enabled:
             try:
-                resp = await client.head(u, timeout=5, follow_redirects=True)
-                ct = resp.headers.get('content-type', '').lower()
-                return u, resp.is_success and 'image' in ct
-            except Exception:
-                return u, False
+                self._execute(
+                    "CREATE TABLE IF NOT EXISTS parse_cache ("
+                    " digest TEXT NOT NULL, ext TEXT NOT NULL, version TEXT NOT NULL,"
+                    " markdown TEXT NOT NULL, image_urls TEXT NOT NULL DEFAULT '{}',"
+                    " created_at REAL NOT NULL, PRIMARY KEY (digest, ext, version))"
+                )
+                self._execute(
+                    "CREATE TABLE IF NOT EXISTS image_urls ("
+                    " digest TEXT PRIMARY KEY, url TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._execute(
+                    "CREATE TABLE IF NOT EXISTS image_checks ("
+                    " url TEXT PRIMARY KEY, valid INTEGER NOT NULL, content_type TEXT NOT NULL,"
+                    " size INTEGER, checked_at REAL NOT NULL)"
+                )
+                self._execute(
+                    "CREATE TABLE IF NOT EXISTS parser_stats ("
+                    " ext TEXT NOT NULL, strategy TEXT NOT NULL, attempts INTEGER NOT NULL,"
+                    " successes INTEGER NOT NULL, total_ms REAL NOT NULL, PRIMARY KEY (ext, strategy))"
+                )
+            except Exception as e:
+                print(f"⚠️ 解析缓存不可用 ({self.path}): {e}")
+                self.enabled = False
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def _execute(self, sql: str, params: tuple = ()) -> list:
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            rows = conn.execute(sql, params).fetchall()
+            conn.commit()
+            return rows
+        finally:
+            conn.close()
+
+    _LIVE_ROW = "digest = ? AND ext = ? AND version = ? AND (image_urls = '{}' OR created_at >= ?)"
+
+    def get(self, digest: str, ext: str, version: str) -> Optional[tuple]:
+        """
+        命中返回 (markdown, {图片文件名: URL}), 未命中返回 None。
+        Markdown 中的图片链接与 image_urls 表一样会过期, 含图片的结果超过 IMAGE_URL_TTL_DAYS 视为未命中。
+        """
+        if not self.enabled:
+            return None
+        min_created = time.time() - self.IMAGE_URL_TTL_DAYS * 86400
+        try:
+            rows = self._execute(f"SELECT markdown, image_urls FROM parse_cache WHERE {self._LIVE_ROW}",
+                                 (digest, ext, version, min_created))
+        except Exception as e:
+            print(f"⚠️ 解析缓存读取失败: {e}")
+            return None
+        if not rows:
+            self.stats["miss"] += 1
+            return None
+        self.stats["hit"] += 1
+        markdown, image_urls = rows[0]
+        return markdown, json.loads(image_urls or "{}")
+
+    def contains(self, digest: str, ext: str, version: str) -> bool:
+        """与 get 的命中条件相同, 但不读取内容、不计入命中统计。"""
+        if not self.enabled:
+            return False
+        min_created = time.time() - self.IMAGE_URL_TTL_DAYS * 86400
+        try:
+            return bool(self._execute(f"SELECT 1 FROM parse_cache WHERE {self._LIVE_ROW}",
+                                      (digest, ext, version, min_created)))
+        except Exception:
+            return False
+
+    def get_image_urls(self, digests: List[str]) -> Dict[str, str]:
+        """按图片内容 SHA-256 批量查询已上传 URL。"""
+        if not self.enabled or not digests:
+            return {}
+        found: Dict[str, str] = {}
+        min_created = time.time() - self.IMAGE_URL_TTL_DAYS * 86400
+        try:
+            for i in range(0, len(digests), 500):
+                chunk = digests[i:i + 500]
+                rows = self._execute(
+                    f"SELECT digest, url FROM image_urls WHERE created_at >= ? "
+                    f"AND digest IN ({','.join('?' * len(chunk))})", (min_created, *chunk))
+                found.update(rows)
+        except Exception as e:
+            print(f"⚠️ 图片 URL 缓存读取失败: {e}")
+        return found
+
+    def put_image_urls(self, url_by_digest: Dict[str, str]) -> None:
+        if not self.enabled or not url_by_digest:
+            return
+        now = time.time()
+        try:
+            conn = sqlite3.connect(self.path, timeout=10)
+            try:
+                conn.executemany("INSERT OR REPLACE INTO image_urls (digest, url, created_at) VALUES (?, ?, ?)",
+                                 [(d, u, now) for d, u in url_by_digest.items()])
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️ 图片 URL 缓存写入失败: {e}")
+
+    def get_image_checks(self, urls: List[str], min_checked_at: float) -> Dict[str, tuple]:
+        """批量查询 min_checked_at 之后的图片校验结果: {URL: (是否有效, content-type, 大小, 校验时间)}。"""
+        if not self.enabled or not urls:
+            return {}
+        found: Dict[str, tuple] = {}
+        try:
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i + 500]
+                rows = self._execute(
+                    f"SELECT url, valid, content_type, size, checked_at FROM image_checks WHERE checked_at >= ? "
+                    f"AND url IN ({','.join('?' * len(chunk))})", (min_checked_at, *chunk))
+                found.update((url, (bool(valid), ct, size, at)) for url, valid, ct, size, at in rows)
+        except Exception as e:
+            print(f"⚠️ 图片校验缓存读取失败: {e}")
+        return found
+
+    def put_image_checks(self, checks: Dict[str, tuple]) -> None:
+        if not self.enabled or not checks:
+            return
+        try:
+            conn = sqlite3.connect(self.path, timeout=10)
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO image_checks (url, valid, content_type, size, checked_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    [(u, int(v), ct, size, at) for u, (v, ct, size, at) in checks.items()])
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"⚠️ 图片校验缓存写入失败: {e}")
+
+    def load_parser_stats(self) -> Dict[tuple, list]:
+        """返回 {(扩展名, 解析器): [尝试次数, 成功次数, 累计耗时 ms]}"""
+        if not self.enabled:
+            return {}
+        try:
+            rows = self._execute("SELECT ext, strategy, attempts, successes, total_ms FROM parser_stats")
+        except Exception as e:
+            print(f"⚠️ 解析器统计读取失败: {e}")
+            return {}
+        return {(ext, name): [att, succ, ms] for ext, name, att, succ, ms in rows}
+
+    def record_parser_attempt(self, ext: str, strategy: str, ok: bool, elapsed_ms: float) -> None:
+        if not self.enabled:
+            return
+        try:
+            self._execute(
+                "INSERT INTO parser_stats (ext, strategy, attempts, successes, total_ms) VALUES (?, ?, 1, ?, ?)"
+                " ON CONFLICT (ext, strategy) DO UPDATE SET attempts = attempts + 1,"
+                " successes = successes + excluded.successes, total_ms = total_ms + excluded.total_ms",
+                (ext, strategy, int(ok), elapsed_ms))
+        except Exception as e:
+            print(f"⚠️ 解析器统计写入失败: {e}")
+
+    def put(self, digest: str, ext: str, version: str, markdown: str, image_urls: Dict[str, str]) -> None:
+        if not self.enabled:
+            return
+        try:
+            self._execute(
+                "INSERT OR REPLACE INTO parse_cache (digest, ext, version, markdown, image_urls, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, ext, version, markdown, json.dumps(image_urls, ensure_ascii=False), time.time()))
+            self.stats["store"] += 1
+        except Exception as e:
+            print(f"⚠️ 解析缓存写入失败: {e}")
 
-        results = await asyncio.gather(*[_check(u) for u in urls_to_check], return_exceptions=True)
-        valid = set()
-        for r in results:
-            if isinstance(r, tuple) and r[1]:
-                valid.add(r[0])
-        valid.update(urls_all - urls_to_check)
 
-        def _replacer(m):
-            return m.group(0) if m.group(3).strip() in valid else ""
+# ==============================================================================
+# ============ 图片 URL 校验服务 (ImageUrlValidator) ============
+# ==============================================================================
+
+class ImageUrlValidator:
+    """
+    网页 Markdown 中图片 URL 的有效性校验, DataCleaningPipeline 与 SearchApiScraper 共用一个进程级实例:
+    - URL -> (是否有效, content-type, 大小) 缓存在内存并写入解析缓存库, TTL 内跨页面、跨运行复用;
+      无效结果可能是临时故障, 使用较短的 TTL;
+    - 同一 URL 的并发校验合并为一次 HEAD, 每个域名同时进行的 HEAD 数受限;
+    - 一页的全部图片在 TIME_BUDGET 秒内校验, 超出预算仍未完成的视为有效 (不写缓存, 校验在后台继续),
+      后台校验使用抓取方的连接池, 由 aclose 在连接池关闭前取消;
+    - 只缓存确定的结论 (2xx 图片 / 4xx / 非图片), 网络错误与 5xx 只影响本次结果, 不写缓存。
+    """
+    TTL = float(os.environ.get("IMAGE_CHECK_TTL_HOURS", "24")) * 3600
+    NEGATIVE_TTL = float(os.environ.get("IMAGE_CHECK_NEGATIVE_TTL_HOURS", "1")) * 3600
+    PER_HOST_CONCURRENCY = int(os.environ.get("IMAGE_CHECK_PER_HOST", "4"))
+    TIME_BUDGET = float(os.environ.get("IMAGE_CHECK_BUDGET", "8"))
+    HEAD_TIMEOUT = 5
+    IMG_PATTERN = re.compile(r'(!\[(.*?)\]\((.*?)\))')
+
+    _shared: Optional["ImageUrlValidator"] = None
+
+    @classmethod
+    def shared(cls) -> "ImageUrlValidator":
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def __init__(self, cache: Optional[DocumentParseCache] = None):
+        self.cache = cache if cache is not None else DocumentParseCache()
+        self._memo: Dict[str, tuple] = {}
+        # 信号量与进行中的任务都绑定事件循环, 循环变化时重建
+        self._loop = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {"memo_hit": 0, "db_hit": 0, "checked": 0, "over_budget": 0}
+
+    def _fresh(self, entry: Optional[tuple], now: float) -> bool:
+        return entry is not None and now - entry[3] < (self.TTL if entry[0] else self.NEGATIVE_TTL)
+
+    async def _head(self, url: str, client: httpx.AsyncClient) -> tuple:
+        host = urlsplit(url).hostname or ""
+        slots = self._host_slots.get(host)
+        if slots is None:
+            slots = self._host_slots[host] = asyncio.Semaphore(self.PER_HOST_CONCURRENCY)
+        try:
+            async with slots:
+                resp = await client.head(url, timeout=self.HEAD_TIMEOUT, follow_redirects=True)
+            content_type = resp.headers.get('content-type', '').lower()
+            size = resp.headers.get('content-length')
+            entry = (resp.is_success and 'image' in content_type, content_type,
+                     int(size) if size and size.isdigit() else None, time.time())
+            definitive = resp.status_code < 500
+        except Exception:
+            entry, definitive = (False, "", None, time.time()), False
+        finally:
+            self._inflight.pop(url, None)
+        self.stats["checked"] += 1
+        if definitive:
+            self._memo[url] = entry
+            await asyncio.to_thread(self.cache.put_image_checks, {url: entry})
+        return entry
+
+    async def aclose(self) -> None:
+        """取消当前事件循环中仍在后台进行的校验 (它们使用的连接池即将关闭), 结果不写缓存。"""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        pending = list(self._inflight.values())
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._inflight.clear()
+
+    async def check(self, urls, client: httpx.AsyncClient) -> Dict[str, bool]:
+        """返回 {URL: 是否保留}; 非 http(s) URL 直接判为无效。"""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop, self._host_slots, self._inflight = loop, {}, {}
+        now = time.time()
+        verdict: Dict[str, bool] = {}
+        missing = []
+        for url in set(urls):
+            if not url or not url.startswith(('http://', 'https://')):
+                verdict[url] = False
+            elif self._fresh(self._memo.get(url), now):
+                self.stats["memo_hit"] += 1
+                verdict[url] = self._memo[url][0]
+            else:
+                missing.append(url)
+
+        if missing:
+            stored = await asyncio.to_thread(self.cache.get_image_checks, missing,
+                                             now - max(self.TTL, self.NEGATIVE_TTL))
+            for url, entry in stored.items():
+                if self._fresh(entry, now):
+                    self.stats["db_hit"] += 1
+                    self._memo[url] = entry
+                    verdict[url] = entry[0]
+            missing = [u for u in missing if u not in verdict]
+
+        if missing:
+            tasks = {}
+            for url in missing:
+                task = self._inflight.get(url)
+                if task is None:
+                    task = self._inflight[url] = asyncio.ensure_future(self._head(url, client))
+                tasks[url] = task
+            await asyncio.wait(tasks.values(), timeout=self.TIME_BUDGET)
+            for url, task in tasks.items():
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    verdict[url] = task.result()[0]
+                else:
+                    self.stats["over_budget"] += 1
+                    verdict[url] = True
+        return verdict
 
-        return self._IMG_PATTERN.sub(_replacer, md_text)
+    async def filter_markdown(self, md: str, client: httpx.AsyncClient) -> str:
+        """删除 Markdown 中失效的图片引用。"""
+        matches = list(self.IMG_PATTERN.finditer(md))
+        if not matches:
+            return md
+        verdict = await self.check((m.group(3).strip() for m in matches), client)
+        return self.IMG_PATTERN.sub(lambda m: m.group(0) if verdict.get(m.group(3).strip()) else "", md)
 
 
 # ==============================================================================
 # ============ 统一文件解析服务 (DocumentParserService) ============
 # ==============================================================================
 
+class ParseContext:
+    """
+    单个文档的解析上下文: 同一文档的多个候选解析器共享已打开的 ZIP、已提取的图片、
+    已解码的文本、已加载的工作簿等中间对象, 并记录每次尝试的决策轨迹。
+    """
+
+    def __init__(self, data: bytes, ext: str, source_url: str = ""):
+        self.data = data
+        self.ext = ext
+        self.source_url = source_url
+        self.trail: List[dict] = []
+        self._shared: Dict[str, Any] = {}
+
+    def shared(self, key: str, factory):
+        """按 key 惰性创建并缓存中间对象; 创建失败的异常原样抛出, 下次调用会重试。"""
+        if key not in self._shared:
+            self._shared[key] = factory()
+        return self._shared[key]
+
+    @property
+    def zip(self) -> zipfile.ZipFile:
+        return self.shared("zip", lambda: zipfile.ZipFile(BytesIO(self.data)))
+
+    @property
+    def text(self) -> str:
+        return self.shared("text", lambda: DocumentParserService._decode_bytes(self.data))
+
+    def media(self, prefix: str, min_size: int) -> List[tuple]:
+        """ZIP 文档 media 目录下的图片 (按文件名排序), 多个解析器之间只提取一次。"""
+        def _extract():
+            try:
+                zf = self.zip
+            except zipfile.BadZipFile:
+                return []
+            images = EmbeddedImageUploader.extract_from_zip(self.data, prefix, min_size=min_size, zf=zf)
+            return sorted(images, key=lambda x: x[0])
+        return self.shared(f"media:{prefix}", _extract)
+
+    def close(self) -> None:
+        for obj in self._shared.values():
+            close = getattr(obj, "close", None)
+            if callable(close):
+                try:
+                    close()
+                except Exception:
+                    pass
+        self._shared.clear()
+
+
+class XlsxStreamReader:
+    """
+    不依赖 openpyxl 的 xlsx 流式读取器: 用 ElementTree.iterparse 直接读 ZIP 中的工作表 XML,
+    每个工作表读到行数上限即停止, 共享字符串表也只读到用到的最大序号,
+    内存占用只取决于行数上限, 与工作簿大小无关。
+    单元格取缓存值, 数字/日期/布尔的转换规则与 openpyxl (data_only=True) 一致。
+    """
+    _NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+    _REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+    _PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+    # 内置数字格式中的日期格式 -> 是否为时长 ([h]:mm:ss)
+    _BUILTIN_DATE_FORMATS = {**{i: False for i in range(14, 23)}, 45: False, 46: True, 47: False}
+    _FORMAT_LITERALS = re.compile(r'".*?"|\[(?!hh?\]|mm?\]|ss?\])[^\]]*\]')
+    _FORMAT_DATE_TOKEN = re.compile(r"(?<![_\\])[dmhysDMHYS]")
+    _FORMAT_TIMEDELTA = re.compile(r"\[hh?\](:mm(:ss(\.0*)?)?)?|\[mm?\](:ss(\.0*)?)?|\[ss?\](\.0*)?", re.I)
+    _CELL_REF = re.compile(r"([A-Z]+)(\d+)")
+    # 序列值 0 对应的日期: 1900 日期系统 (Windows) / 1904 日期系统 (workbookPr/@date1904, 旧版 Mac Excel)
+    EPOCH_1900 = datetime(1899, 12, 30)
+    EPOCH_1904 = datetime(1904, 1, 1)
+
+    def __init__(self, zf: zipfile.ZipFile):
+        self.zf = zf
+        self.epoch = self.EPOCH_1900
+        self._date_styles: Optional[Dict[int, bool]] = None
+        # 待替换的共享字符串: (行, 列, 序号)
+        self._pending: List[tuple] = []
+
+    @staticmethod
+    def _column_index(letters: str) -> int:
+        index = 0
+        for ch in letters:
+            index = index * 26 + ord(ch) - 64
+        return index
+
+    def sheets(self) -> List[tuple]:
+        """[(工作表名, ZIP 内路径)], 按工作簿中的顺序; 同时读取工作簿的日期系统。"""
+        targets = {}
+        with self.zf.open("xl/_rels/workbook.xml.rels") as f:
+            for rel in ET.parse(f).getroot().iter(self._PKG_REL):
+                target = rel.get("Target", "")
+                targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") \
+                    else posixpath.normpath(posixpath.join("xl", target))
+        with self.zf.open("xl/workbook.xml") as f:
+            root = ET.parse(f).getroot()
+        props = root.find(f"{self._NS}workbookPr")
+        date1904 = props is not None and props.get("date1904", "").lower() in ("1", "true")
+        self.epoch = self.EPOCH_1904 if date1904 else self.EPOCH_1900
+        return [(sheet.get("name"), targets.get(sheet.get(self._REL_ID)))
+                for sheet in root.iter(f"{self._NS}sheet")]
+
+    @property
+    def date_styles(self) -> Dict[int, bool]:
+        """cellXfs 中数字格式为日期的样式序号 -> 是否为时长格式。"""
+        if self._date_styles is None:
+            self._date_styles = {}
+            try:
+                with self.zf.open("xl/styles.xml") as f:
+                    root = ET.parse(f).getroot()
+            except KeyError:
+                return self._date_styles
+            custom = {int(fmt.get("numFmtId", -1)): fmt.get("formatCode", "") for fmt in root.iter(f"{self._NS}numFmt")}
+            xfs = root.find(f"{self._NS}cellXfs")
+            for i, xf in enumerate(xfs if xfs is not None else []):
+                fmt_id = int(xf.get("numFmtId", 0))
+                if fmt_id in custom:
+                    code = custom[fmt_id].split(";")[0]
+                    if self._FORMAT_DATE_TOKEN.search(self._FORMAT_LITERALS.sub("", code)):
+                        self._date_styles[i] = self._FORMAT_TIMEDELTA.search(code) is not None
+                elif fmt_id in self._BUILTIN_DATE_FORMATS:
+                    self._date_styles[i] = self._BUILTIN_DATE_FORMATS[fmt_id]
+        return self._date_styles
+
+    @classmethod
+    def _from_excel(cls, serial, is_timedelta: bool, epoch: datetime = EPOCH_1900):
+        """Excel 序列值 -> datetime / time (小于 1) / timedelta (时长格式)。"""
+        if is_timedelta:
+            td = timedelta(days=serial)
+            if td.microseconds:
+                td = timedelta(seconds=td.total_seconds() // 1, microseconds=round(td.microseconds, -3))
+            return td
+        days, fraction = divmod(serial, 1)
+        delta = timedelta(milliseconds=round(fraction * 86400000))
+        if 0 <= serial < 1 and delta.days == 0:
+            return (datetime.min + delta).time()
+        # 1900 日期系统把 1900-02-29 计为存在的日期
+        if 0 < serial < 60 and epoch == cls.EPOCH_1900:
+            days += 1
+        return epoch + timedelta(days=days) + delta
+
+    def _text(self, node) -> str:
+        """<si> / <is> 的纯文本: 直接的 <t> 与富文本 <r><t>, 忽略注音 <rPh>。"""
+        parts = []
+        for child in node:
+            if child.tag == f"{self._NS}t":
+                parts.append(child.text or "")
+            elif child.tag == f"{self._NS}r":
+                t = child.find(f"{self._NS}t")
+                if t is not None:
+                    parts.append(t.text or "")
+        return "".join(parts)
+
+    def _row_values(self, row_el, width: Optional[int]) -> list:
+        cells: list = []
+        for c in row_el.iter(f"{self._NS}c"):
+            ref = c.get("r")
+            col = self._column_index(self._CELL_REF.match(ref).group(1)) if ref else len(cells) + 1
+            if width and col > width:
+                break
+            cells.extend([None] * (col - 1 - len(cells)))
+            t = c.get("t", "n")
+            if t == "inlineStr":
+                node = c.find(f"{self._NS}is")
+                cells.append(self._text(node) if node is not None else None)
+                continue
+            value = c.findtext(f"{self._NS}v") or None
+            if value is None:
+                cells.append(None)
+            elif t == "s":
+                self._pending.append((cells, len(cells), int(value)))
+                cells.append(None)
+            elif t == "b":
+                cells.append(bool(int(value)))
+            elif t in ("str", "e"):
+                cells.append(value)
+            elif t == "d":
+                try:
+                    cells.append(datetime.fromisoformat(value))
+                except ValueError:
+                    cells.append(value)
+            else:
+                number = float(value) if any(ch in value for ch in ".eE") else int(value)
+                style = int(c.get("s") or 0)
+                if style in self.date_styles:
+                    try:
+                        number = self._from_excel(number, self.date_styles[style], self.epoch)
+                    except (OverflowError, ValueError):
+                        number = "#VALUE!"
+                cells.append(number)
+        if width:
+            cells.extend([None] * (width - len(cells)))
+        return cells
+
+    def _read_sheet(self, path: str, max_rows: int) -> tuple:
+        """读取工作表前 max_rows 行: (行列表, 声明的总行数, 是否截断)。"""
+        rows: list = []
+        total, width, expected = None, None, 1
+        with self.zf.open(path) as f:
+            for _, el in ET.iterparse(f, events=("end",)):
+                if el.tag == f"{self._NS}dimension":
+                    m = self._CELL_REF.match(el.get("ref", "").split(":")[-1])
+                    if m:
+                        width, total = self._column_index(m.group(1)), int(m.group(2))
+                elif el.tag == f"{self._NS}row":
+                    r = int(el.get("r") or expected)
+                    # 中间缺失的行按空行补齐
+                    while expected < r and len(rows) < max_rows:
+                        rows.append([None] * (width or 0))
+                        expected += 1
+                    if len(rows) >= max_rows:
+                        return rows, total, True
+                    rows.append(self._row_values(el, width))
+                    expected = r + 1
+                    el.clear()
+        return rows, total, False
+
+    def _resolve_shared_strings(self) -> None:
+        wanted = {idx for _, _, idx in self._pending}
+        if not wanted:
+            return
+        found, last = {}, max(wanted)
+        try:
+            f = self.zf.open("xl/sharedStrings.xml")
+        except KeyError:
+            return
+        with f:
+            idx = 0
+            for _, el in ET.iterparse(f, events=("end",)):
+                if el.tag != f"{self._NS}si":
+                    continue
+                if idx in wanted:
+                    found[idx] = self._text(el)
+                el.clear()
+                if idx >= last:
+                    break
+                idx += 1
+        for cells, col, idx in self._pending:
+            cells[col] = found.get(idx)
+        self._pending.clear()
+
+    def read(self, max_rows: int) -> List[tuple]:
+        """[(工作表名, 行列表, 声明的总行数, 是否截断)]"""
+        sheets = [(name, *self._read_sheet(path, max_rows)) for name, path in self.sheets() if path]
+        self._resolve_shared_strings()
+        return sheets
+
+
+class DocxStreamReader:
+    """
+    直接遍历 word/document.xml 的 DOCX 读取器: iterparse 单次遍历正文, 按文档顺序产出
+    ("paragraph", (标题级别或 0, 文本)) / ("image", 关系 ID) / ("table", 行列表)。
+    每个顶层块处理完即从树上移除, 内存只与单个段落/表格的大小有关。
+    段落文本、单元格合并的取值规则与 python-docx 一致。
+    """
+    _W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+    _R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+    _PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+    _BLIP = "{http://schemas.openxmlformats.org/drawingml/2006/main}blip"
+    _VML_IMAGE = "{urn:schemas-microsoft-com:vml}imagedata"
+    _RUN_TEXT = {f"{_W}tab": "\t", f"{_W}ptab": "\t", f"{_W}cr": "\n", f"{_W}noBreakHyphen": "-"}
+
+    def __init__(self, zf: zipfile.ZipFile):
+        self.zf = zf
+        self._heading_levels: Optional[Dict[Optional[str], int]] = None
+
+    def image_targets(self) -> Dict[str, str]:
+        """{关系 ID: 图片文件名}"""
+        targets = {}
+        try:
+            with self.zf.open("word/_rels/document.xml.rels") as f:
+                root = ET.parse(f).getroot()
+        except KeyError:
+            return targets
+        for rel in root.iter(self._PKG_REL):
+            if "image" in rel.get("Type", "") and rel.get("TargetMode") != "External":
+                targets[rel.get("Id")] = posixpath.basename(rel.get("Target", ""))
+        return targets
+
+    @property
+    def heading_levels(self) -> Dict[Optional[str], int]:
+        """{段落样式 ID: 标题级别}; 键 None 对应未指定样式的段落 (默认段落样式)。"""
+        if self._heading_levels is None:
+            self._heading_levels = {}
+            try:
+                with self.zf.open("word/styles.xml") as f:
+                    root = ET.parse(f).getroot()
+            except KeyError:
+                return self._heading_levels
+            for style in root.iter(f"{self._W}style"):
+                if style.get(f"{self._W}type") != "paragraph":
+                    continue
+                name_el = style.find(f"{self._W}name")
+                name = name_el.get(f"{self._W}val", "") if name_el is not None else ""
+                # 内置样式名为小写 (heading 1), 界面名为 Heading 1
+                m = re.fullmatch(r"heading ([1-9])", name)
+                ui_name = f"Heading {m.group(1)}" if m else name
+                if "Heading" not in ui_name:
+                    continue
+                level = ui_name.replace("Heading", "").strip()
+                level = int(level) if level.isdigit() else 2
+                self._heading_levels[style.get(f"{self._W}styleId")] = level
+                if style.get(f"{self._W}default") in ("1", "true"):
+                    self._heading_levels[None] = level
+        return self._heading_levels
+
+    def _run_text(self, run) -> str:
+        parts = []
+        for child in run:
+            if child.tag == f"{self._W}t":
+                parts.append(child.text or "")
+            elif child.tag == f"{self._W}br":
+                if child.get(f"{self._W}type", "textWrapping") == "textWrapping":
+                    parts.append("\n")
+            else:
+                parts.append(self._RUN_TEXT.get(child.tag, ""))
+        return "".join(parts)
+
+    def _paragraph_text(self, p) -> str:
+        """段落直接包含的 run 与超链接中的 run (不含文本框、修订插入等嵌套内容)。"""
+        parts = []
+        for child in p:
+            if child.tag == f"{self._W}r":
+                parts.append(self._run_text(child))
+            elif child.tag == f"{self._W}hyperlink":
+                parts.extend(self._run_text(r) for r in child.iter(f"{self._W}r"))
+        return "".join(parts)
+
+    def _paragraph_style(self, p) -> Optional[str]:
+        style = p.find(f"{self._W}pPr/{self._W}pStyle")
+        return style.get(f"{self._W}val") if style is not None else None
+
+    def _paragraph_images(self, p) -> List[str]:
+        rids = []
+        for el in p.iter():
+            if el.tag == self._BLIP:
+                rid = el.get(f"{self._R}embed")
+            elif el.tag == self._VML_IMAGE:
+                rid = el.get(f"{self._R}id")
+            else:
+                continue
+            if rid:
+                rids.append(rid)
+        return rids
+
+    def _table_rows(self, tbl) -> List[list]:
+        """每行按网格列展开: 横向合并的单元格重复, 纵向合并的后续单元格取合并起始单元格的文本。"""
+        rows, above = [], {}
+        for tr in tbl.findall(f"{self._W}tr"):
+            before = tr.find(f"{self._W}trPr/{self._W}gridBefore")
+            offset = int(before.get(f"{self._W}val", 0)) if before is not None else 0
+            cells, grid = [], {}
+            for tc in tr.findall(f"{self._W}tc"):
+                props = tc.find(f"{self._W}tcPr")
+                span_el = props.find(f"{self._W}gridSpan") if props is not None else None
+                span = int(span_el.get(f"{self._W}val", 1)) if span_el is not None else 1
+                merge = props.find(f"{self._W}vMerge") if props is not None else None
+                if merge is not None and merge.get(f"{self._W}val", "continue") == "continue":
+                    text = above.get(offset, "")
+                else:
+                    text = "\n".join(self._paragraph_text(p) for p in tc.findall(f"{self._W}p")).strip()
+                for _ in range(span):
+                    grid[offset] = text
+                    cells.append(text)
+                    offset += 1
+            rows.append(cells)
+            above = grid
+        return rows
+
+    def blocks(self) -> Iterator[tuple]:
+        levels = self.heading_levels
+        body, depth = None, 0
+        with self.zf.open("word/document.xml") as f:
+            for event, el in ET.iterparse(f, events=("start", "end")):
+                if event == "start":
+                    depth += 1
+                    if depth == 2 and el.tag == f"{self._W}body":
+                        body = el
+                    continue
+                depth -= 1
+                if depth != 2 or body is None:
+                    continue
+                if el.tag == f"{self._W}p":
+                    text = self._paragraph_text(el).strip()
+                    if text:
+                        yield "paragraph", (levels.get(self._paragraph_style(el), 0), text)
+                    for rid in self._paragraph_images(el):
+                        yield "image", rid
+                elif el.tag == f"{self._W}tbl":
+                    rows = self._table_rows(el)
+                    if rows:
+                        yield "table", rows
+                body.remove(el)
+
+
 class DocumentParserService:
     """
     统一文件解析服务，替代原 ResourceParser。
@@ -611,15 +1609,79 @@ class DocumentParserService:
     所有输出均为 LLM 友好的 Markdown 字符串。
     """
 
+    # 解析输出格式变化时递增, 使旧的解析缓存失效
+    PARSER_VERSION = "2026.10.7"
     PDF_MAX_PAGES = 50
+    # 分页并行: 页数达到阈值时由 DocumentParseEngine 按页范围分片提交到解析进程池
+    PDF_PARALLEL_MIN_PAGES = int(os.environ.get("DOC_PDF_PARALLEL_MIN_PAGES", "16"))
+    PDF_MIN_SHARD_PAGES = 4
+    TABLE_SCREEN_LOG_SIZE = 1000
     MAX_TABLE_ROWS = 500
+    # 流式读取的文本格式只用开头这么多字节探测编码
+    ENCODING_SAMPLE_BYTES = 64 * 1024
+    TEXT_ENCODINGS = ('utf-8', 'utf-8-sig', 'gbk', 'gb2312', 'gb18030', 'big5', 'latin-1')
+    # 超过该大小的 xlsx 用 XlsxStreamReader 读取 (openpyxl 只读模式仍会整体加载共享字符串表,
+    # 工作表缺少 dimension 时还会在打开时扫描全表计算尺寸)
+    XLSX_SAX_MIN_BYTES = int(os.environ.get("DOC_XLSX_SAX_MIN_BYTES", str(1024 * 1024)))
     MAX_TEXT_CHARS = 100000
     MAX_JSON_CHARS = 50000
     MIN_IMG_BYTES = 5 * 1024
     MIN_IMG_DIM = 50
 
-    def __init__(self):
+    # 候选解析器: 扩展名 -> [(名称, 方法名)]
+    # 列表顺序即输出质量顺序, 固定不变 (不同解析器的输出不同, 且结果会写入解析缓存);
+    # 实测样本只用于把有持续失败记录的解析器移到最后
+    _MARKITDOWN_STRATEGY = ("markitdown", "_parse_markitdown")
+    PARSE_STRATEGIES = {
+        ".pdf": [("fitz", "_parse_pdf"), _MARKITDOWN_STRATEGY],
+        # docx 流式 XML 解析保留表格与图片, 且不整篇载入; MarkItDown 仅作兜底
+        ".docx": [("docx-xml", "_parse_docx"), _MARKITDOWN_STRATEGY],
+        ".pptx": [("python-pptx", "_parse_pptx"), _MARKITDOWN_STRATEGY],
+        # 表格优先用按行数上限停止的流式读取, MarkItDown (整表载入 pandas) 仅作兜底
+        ".xlsx": [("openpyxl", "_parse_xlsx"), ("xlrd", "_parse_xls"), _MARKITDOWN_STRATEGY],
+        ".xls": [("xlrd", "_parse_xls"), ("openpyxl", "_parse_xlsx"), _MARKITDOWN_STRATEGY],
+        ".csv": [("csv", "_parse_csv"), _MARKITDOWN_STRATEGY],
+        ".xml": [("markitdown", "_parse_markitdown"), ("raw-xml", "_parse_xml")],
+        ".html": [("trafilatura", "_parse_html_file"), _MARKITDOWN_STRATEGY],
+        ".htm": [("trafilatura", "_parse_html_file"), _MARKITDOWN_STRATEGY],
+        ".json": [("json", "_parse_json"), _MARKITDOWN_STRATEGY],
+        ".txt": [("text", "_parse_plain_text"), _MARKITDOWN_STRATEGY],
+        ".md": [("markdown", "_parse_markdown"), _MARKITDOWN_STRATEGY],
+        ".markdown": [("markdown", "_parse_markdown"), _MARKITDOWN_STRATEGY],
+        ".jpg": [("image", "_parse_image"), _MARKITDOWN_STRATEGY],
+        ".jpeg": [("image", "_parse_image"), _MARKITDOWN_STRATEGY],
+        ".png": [("image", "_parse_image"), _MARKITDOWN_STRATEGY],
+        ".gif": [("image", "_parse_image"), _MARKITDOWN_STRATEGY],
+        ".webp": [("image", "_parse_image"), _MARKITDOWN_STRATEGY],
+        ".bmp": [("image", "_parse_image"), _MARKITDOWN_STRATEGY],
+    }
+    # 先验相当于 STRATEGY_PRIOR_WEIGHT 次观测, 避免少量样本导致顺序抖动
+    STRATEGY_PRIOR_WEIGHT = 3
+    STRATEGY_PRIOR_SUCCESS = 0.9
+    # 至少 STRATEGY_MIN_SAMPLES 次尝试且成功率低于 STRATEGY_FAILING_RATE 的解析器移到最后 (仍作兜底)
+    STRATEGY_MIN_SAMPLES = 10
+    STRATEGY_FAILING_RATE = float(os.environ.get("DOC_PARSER_FAILING_RATE", "0.2"))
+    # MarkItDown 输入方式: auto (内存流优先, 失败时 memfd/临时文件路径) | stream | memfd | tempfile
+    MARKITDOWN_INPUT = os.environ.get("DOC_MARKITDOWN_INPUT", "auto").lower()
+
+    def __init__(self, cache: Optional[DocumentParseCache] = None):
         self.cleaner = DataCleaningPipeline()
+        self.cache = cache if cache is not None else DocumentParseCache()
+        # trafilatura 配置只构建一次 (解析子进程中即每个 worker 一份), 只读, 可跨线程共用
+        self.trafilatura_config = use_config()
+        self.trafilatura_config.set("DEFAULT", "EXTRACTION_TIMEOUT", "10")
+        # 当前线程本次解析上传的图片 {文件名: URL}, 随解析结果一起写入缓存
+        self._uploaded = threading.local()
+        self.table_screen_log: deque = deque(maxlen=self.TABLE_SCREEN_LOG_SIZE)
+        self.table_screen_stats = {"pages": 0, "candidates": 0, "with_tables": 0}
+        # 当前线程本次 parse_deferred 的表格预筛决策, 随结果返回 (解析子进程中的统计由父进程合并)
+        self._screened = threading.local()
+        # {(扩展名, 解析器): [尝试次数, 成功次数, 累计耗时 ms]}, 跨运行的统计从缓存库加载
+        self.parser_stats: Dict[tuple, list] = self.cache.load_parser_stats()
+        self._stats_lock = threading.Lock()
+        self.parse_trail_log: deque = deque(maxlen=self.TABLE_SCREEN_LOG_SIZE)
+        # 流式转换失败、需要文件路径的扩展名
+        self._markitdown_path_only: set = set()
         self._markitdown = None
         if MarkItDown:
             try:
@@ -628,21 +1690,25 @@ class DocumentParserService:
                 print(f"⚠️ MarkItDown 初始化失败: {e}")
 
     # ── MarkItDown 通用转换 ──────────────────────────────────
-    def _markitdown_convert(self, data: bytes, suffix: str) -> str:
-        if not self._markitdown:
-            return ""
-        if not suffix.startswith("."):
-            suffix = f".{suffix}"
+    @staticmethod
+    @contextlib.contextmanager
+    def _materialize(data: bytes, suffix: str, mode: str):
+        """为需要文件路径的转换器提供路径: memfd 为 Linux 匿名内存文件 (不落盘), tempfile 为原有的磁盘临时文件。"""
+        if mode == "memfd":
+            fd = os.memfd_create(f"markitdown{suffix}", getattr(os, "MFD_CLOEXEC", 0))
+            try:
+                with os.fdopen(fd, "wb", closefd=False) as f:
+                    f.write(data)
+                yield f"/proc/self/fd/{fd}"
+            finally:
+                os.close(fd)
+            return
         tmp_path = None
         try:
             with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as f:
                 f.write(data)
                 tmp_path = f.name
-            result = self._markitdown.convert(tmp_path)
-            return result.text_content if result and result.text_content else ""
-        except Exception as e:
-            print(f"⚠️ MarkItDown ({suffix}) 失败: {e}")
-            return ""
+            yield tmp_path
         finally:
             if tmp_path and os.path.exists(tmp_path):
                 try:
@@ -650,6 +1716,59 @@ class DocumentParserService:
                 except OSError:
                     pass
 
+    def _markitdown_convert(self, data: bytes, suffix: str) -> str:
+        """
+        MarkItDown 转换: 优先 convert_stream(BytesIO) 全程在内存中完成;
+        流式转换失败时再给转换器一个文件路径 (memfd, 不支持时用临时文件),
+        路径方式成功过的扩展名之后直接走路径, 不再重复尝试流式转换。
+        """
+        if not self._markitdown:
+            return ""
+        if not suffix.startswith("."):
+            suffix = f".{suffix}"
+        mode = self.MARKITDOWN_INPUT
+        if mode == "auto":
+            modes = [] if suffix in self._markitdown_path_only else ["stream"]
+            modes.append("memfd" if hasattr(os, "memfd_create") and os.path.isdir("/proc/self/fd") else "tempfile")
+        else:
+            modes = [mode]
+
+        error = None
+        for i, m in enumerate(modes):
+            try:
+                if m == "stream":
+                    result = self._markitdown.convert_stream(BytesIO(data), file_extension=suffix)
+                else:
+                    with self._materialize(data, suffix, m) as path:
+                        result = self._markitdown.convert_local(path, file_extension=suffix)
+            except Exception as e:
+                error = e
+                continue
+            if i > 0 and modes[0] == "stream":
+                self._markitdown_path_only.add(suffix)
+            return result.text_content if result and result.text_content else ""
+        print(f"⚠️ MarkItDown ({suffix}) 失败: {error}")
+        return ""
+
+    _MARKITDOWN_CLEANERS = {".xlsx": "clean_table", ".xls": "clean_table", ".csv": "clean_table", ".xml": "clean_text"}
+    _MEDIA_PREFIXES = {".docx": "word/media/", ".doc": "word/media/", ".pptx": "ppt/media/", ".ppt": "ppt/media/"}
+
+    def _parse_markitdown(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        """MarkItDown 候选解析器: 按格式上传内嵌图片并选择对应的清洗方法。"""
+        ext = ctx.ext if ctx else ""
+        suffix = ext
+        if ext in (".xlsx", ".xls"):
+            suffix = ".xlsx" if data[:4] == b'PK\x03\x04' else ".xls"
+        md_text = self._markitdown_convert(data, suffix or ".bin")
+        if not (md_text and md_text.strip()):
+            return ""
+        if ext == ".pdf":
+            md_text = self._upload_embedded_images(data, ext, md_text)
+        elif ext in self._MEDIA_PREFIXES:
+            images = ctx.media(self._MEDIA_PREFIXES[ext], self.MIN_IMG_BYTES) if ctx else None
+            md_text = self._upload_embedded_images(data, ext, md_text, images=images)
+        return getattr(self.cleaner, self._MARKITDOWN_CLEANERS.get(ext, "clean_document"))(md_text)
+
     # ── PDF ──────────────────────────────────────────────────
     @staticmethod
     def _bbox_overlap(bbox_a, bbox_b, tolerance=2.0) -> bool:
@@ -664,173 +1783,264 @@ class DocumentParserService:
         width_a = ax1 - ax0
         return width_a > 0 and (overlap_x / width_a) > 0.5
 
-    def _parse_pdf(self, data: bytes, source_url: str = "") -> str:
-        parts = []
-        img_count = 0
-        table_bboxes_per_page: Dict[int, list] = {}
+    @staticmethod
+    def _screen_pdf_table_page(page) -> tuple:
+        """
+        表格预筛: 统计页面矢量路径可形成的水平/垂直边 (矩形计 2 横 2 竖)。
+        pdfplumber 默认 lines 策略只用线段/矩形/曲线的边构造单元格, 横边或竖边少于 2 条时
+        find_tables() 必然为空; 与 pdfplumber 一致, 非水平的线段一律按竖边计, 保证不漏检。
+        返回 (横边数, 竖边数, 是否送检)。
+        """
+        try:
+            drawings = page.get_drawings()
+        except Exception:
+            return -1, -1, True
+        h = v = 0
+        for path in drawings:
+            for item in path.get("items", ()):
+                op = item[0]
+                if op in ("re", "qu"):
+                    h, v = h + 2, v + 2
+                elif op in ("l", "c"):
+                    p1, p2 = item[1], item[-1]
+                    if abs(p2.y - p1.y) < 0.01:
+                        h += 1
+                    else:
+                        v += 1
+            if h >= 2 and v >= 2:
+                break
+        return h, v, h >= 2 and v >= 2
 
-        plumber_tables_per_page: Dict[int, list] = {}
+    def _extract_pdf_tables(self, data: bytes, page_indices: List[int]) -> Dict[int, list]:
+        """只在标记页上运行 pdfplumber 表格提取, 返回 {页码: [(y0, rows, bbox), ...]}"""
+        tables_per_page: Dict[int, list] = {}
+        if not page_indices:
+            return tables_per_page
         try:
             with pdfplumber.open(BytesIO(data)) as plumber_pdf:
-                page_limit = min(len(plumber_pdf.pages), self.PDF_MAX_PAGES)
-                for pi in range(page_limit):
-                    pp = plumber_pdf.pages[pi]
-                    tables = pp.find_tables()
-                    if not tables:
-                        continue
+                for pi in page_indices:
+                    tables = plumber_pdf.pages[pi].find_tables()
                     page_tables = []
-                    page_bboxes = []
                     for tbl in tables:
                         rows = tbl.extract()
                         if not rows:
                             continue
-                        cleaned = []
-                        for row in rows:
-                            cleaned.append([(c or "").strip() for c in row])
+                        cleaned = [[(c or "").strip() for c in row] for row in rows]
                         if any(any(cell for cell in r) for r in cleaned):
-                            page_tables.append((tbl.bbox[1], cleaned))
-                            page_bboxes.append(tbl.bbox)
+                            page_tables.append((tbl.bbox[1], cleaned, tbl.bbox))
                     if page_tables:
-                        plumber_tables_per_page[pi] = page_tables
-                        table_bboxes_per_page[pi] = page_bboxes
+                        tables_per_page[pi] = page_tables
         except Exception as e:
             print(f"  ⚠️ pdfplumber 表格提取异常 (不影响正文): {e}")
+        return tables_per_page
 
+    def _scan_pdf_pages(self, doc, data: bytes, start: int, end: int) -> List[tuple]:
+        """
+        扫描 [start, end) 页, 返回每页 (blocks, tables, screen):
+        blocks 为 [(y0, bbox, 文本)] 或图片 [(y0, None, (w, h, 字节))], 图片的全局编号在合并时分配;
+        tables 为 pdfplumber 在候选页上提取到的 [(y0, rows, bbox)];
+        screen 为表格预筛结果 (横边数, 竖边数, 是否送检)。
+        """
+        page_blocks: List[list] = []
+        screens: List[tuple] = []
+        table_pages: List[int] = []
+        for pi in range(start, end):
+            page = doc.load_page(pi)
+            page_dict = page.get_text("dict", sort=True)
+            blocks = []
+            for block in page_dict.get("blocks", []):
+                b_bbox = block.get("bbox", [0, 0, 0, 0])
+                y0 = b_bbox[1]
+
+                if block["type"] == 0:
+                    lines_text = []
+                    for ln in block.get("lines", []):
+                        span_txt = "".join(s.get("text", "") for s in ln.get("spans", []))
+                        if span_txt.strip():
+                            lines_text.append(span_txt.strip())
+                    if lines_text:
+                        blocks.append((y0, b_bbox, "\n".join(lines_text)))
+
+                elif block["type"] == 1:
+                    w, h = b_bbox[2] - b_bbox[0], b_bbox[3] - b_bbox[1]
+                    if w < self.MIN_IMG_DIM or h < self.MIN_IMG_DIM:
+                        continue
+                    img_bytes = block.get("image", b"")
+                    if len(img_bytes) < self.MIN_IMG_BYTES:
+                        continue
+                    blocks.append((y0, None, (w, h, img_bytes)))
+            page_blocks.append(blocks)
+            screen = self._screen_pdf_table_page(page)
+            screens.append(screen)
+            if screen[2]:
+                table_pages.append(pi)
+
+        tables_per_page = self._extract_pdf_tables(data, table_pages)
+        return [(blocks, tables_per_page.get(pi, []), screen)
+                for pi, blocks, screen in zip(range(start, end), page_blocks, screens)]
+
+    def _record_table_screen(self, source_url: str, pages: List[tuple]) -> None:
+        """记录每页预筛决策 (供排查漏检/误检), 并打印本文档的汇总。"""
+        entries = [{"source": source_url, "page": pi + 1, "h_edges": h, "v_edges": v,
+                    "candidate": candidate, "tables": len(page_tables)}
+                   for pi, (_, page_tables, (h, v, candidate)) in enumerate(pages)]
+        self.absorb_table_screen(entries)
+        captured = getattr(self._screened, "entries", None)
+        if captured is not None:
+            captured.extend(entries)
+        if entries:
+            sent = sum(e["candidate"] for e in entries)
+            hit = sum(bool(e["tables"]) for e in entries)
+            print(f"  🔎 表格预筛: {sent}/{len(entries)} 页送检 pdfplumber, {hit} 页含表格")
+
+    def absorb_table_screen(self, entries: List[dict]) -> None:
+        """合并每页预筛决策到日志与统计; 解析子进程的决策随 parse_deferred 结果返回, 由父进程调用。"""
+        self.table_screen_log.extend(entries)
+        self.table_screen_stats["pages"] += len(entries)
+        self.table_screen_stats["candidates"] += sum(e["candidate"] for e in entries)
+        self.table_screen_stats["with_tables"] += sum(bool(e["tables"]) for e in entries)
+
+    # ── PDF 分页并行 (DocumentParseEngine: 父进程规划与合并, 解析进程池扫描页范围) ──
+    def pdf_shard_plan(self, data, workers: int) -> Optional[dict]:
+        """
+        在父进程中规划分片, data 为文档字节或其零拷贝视图 (bytearray / mmap)。
+        页数足够多、fitz 未被降级且解析缓存未命中时返回 {"digest", "total", "bounds": [0, b1, ..., limit]};
+        否则返回 None (整篇交给一个 worker)。
+        """
+        if workers < 2 or self._ordered_strategies(".pdf")[0][1] != "_parse_pdf":
+            return None
+        try:
+            with fitz.open(stream=memoryview(data), filetype="pdf") as doc:
+                total = len(doc)
+        except Exception:
+            return None
+        limit = min(total, self.PDF_MAX_PAGES)
+        shards = min(workers, limit // self.PDF_MIN_SHARD_PAGES)
+        if limit < self.PDF_PARALLEL_MIN_PAGES or shards < 2:
+            return None
+        digest = DocumentParseCache.digest(data) if self.cache.enabled else ""
+        if digest and self.cache.contains(digest, ".pdf", self.PARSER_VERSION):
+            return None
+        return {"digest": digest, "total": total, "bounds": [limit * i // shards for i in range(shards + 1)]}
+
+    def scan_pdf_range(self, data: bytes, start: int, end: int) -> List[tuple]:
+        """在解析子进程中扫描 [start, end) 页; 各分片结果由 merge_pdf_shards 在父进程按页序合并。"""
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            return self._scan_pdf_pages(doc, data, start, end)
+
+    def merge_pdf_shards(self, plan: dict, shards: List[List[tuple]], source_url: str = "",
+                         started: Optional[float] = None) -> Optional[dict]:
+        """
+        父进程合并分片扫描结果 (与 _parse_pdf 相同的组装, 输出一致; 图片字节不再回传 worker),
+        返回与 parse_deferred 相同结构的结果; 合并结果为空时返回 None, 由调用方整篇解析。
+        """
+        start = time.perf_counter() if started is None else started
+        self._uploaded.pending = {}
+        try:
+            try:
+                result = self._assemble_pdf([page for pages in shards for page in pages], plan["total"], source_url)
+            except Exception as e:
+                print(f"⚠️ PDF 分片合并失败: {e}")
+                result = ""
+            pending = self._uploaded.pending
+        finally:
+            self._uploaded.pending = None
+        if not (result and result.strip()):
+            return None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._record_attempt(".pdf", "fitz", True, elapsed_ms)
+        trail = [{"strategy": "fitz", "ok": True, "ms": round(elapsed_ms, 1)}]
+        self.log_trail(".pdf", source_url, trail)
+        return {"markdown": result, "pending": pending, "digest": plan["digest"], "ext": ".pdf", "trail": trail}
+
+    def _parse_pdf(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        """
+        单次 fitz 遍历: 同时产出文本块、图片块(含字节)和表格候选页;
+        pdfplumber 只在候选页上找表格, 提取到的图片直接交给上传步骤, 不再重新打开 PDF。
+        """
         try:
             with fitz.open(stream=data, filetype="pdf") as doc:
                 total = len(doc)
-                limit = min(total, self.PDF_MAX_PAGES)
-                if total > self.PDF_MAX_PAGES:
-                    print(f"  📄 PDF 共 {total} 页，只处理前 {limit} 页")
-
-                for pi in range(limit):
-                    page = doc.load_page(pi)
-                    page_dict = page.get_text("dict", sort=True)
-                    tbl_bboxes = table_bboxes_per_page.get(pi, [])
-                    elements = []
-
-                    for block in page_dict.get("blocks", []):
-                        b_bbox = block.get("bbox", [0, 0, 0, 0])
-                        y0 = b_bbox[1]
-
-                        if block["type"] == 0:
-                            if tbl_bboxes and any(self._bbox_overlap(b_bbox, tb) for tb in tbl_bboxes):
-                                continue
-                            lines_text = []
-                            for ln in block.get("lines", []):
-                                span_txt = "".join(s.get("text", "") for s in ln.get("spans", []))
-                                if span_txt.strip():
-                                    lines_text.append(span_txt.strip())
-                            if lines_text:
-                                elements.append((y0, "\n".join(lines_text)))
-
-                        elif block["type"] == 1:
-                            w, h = b_bbox[2] - b_bbox[0], b_bbox[3] - b_bbox[1]
-                            if w < self.MIN_IMG_DIM or h < self.MIN_IMG_DIM:
-                                continue
-                            img_bytes = block.get("image", b"")
-                            if len(img_bytes) < self.MIN_IMG_BYTES:
-                                continue
-                            img_count += 1
-                            elements.append(
-                                (y0, f"![图片{img_count} (第{pi + 1}页, {int(w)}x{int(h)})](pdf_image_{img_count})"))
-
-                    for tbl_y0, tbl_rows in plumber_tables_per_page.get(pi, []):
-                        elements.append((tbl_y0, self._rows_to_md_table(tbl_rows)))
+                pages = self._scan_pdf_pages(doc, data, 0, min(total, self.PDF_MAX_PAGES))
+            return self._assemble_pdf(pages, total, source_url)
+        except Exception as e:
+            print(f"⚠️ PDF fitz 解析失败: {e}")
+        return ""
 
-                    elements.sort(key=lambda x: x[0])
-                    page_content = "\n\n".join(e[1] for e in elements)
-                    if page_content.strip():
-                        if limit > 1:
-                            parts.append(f"<!-- 第 {pi + 1} 页 -->\n\n{page_content}")
-                        else:
-                            parts.append(page_content)
+    def _assemble_pdf(self, pages: List[tuple], total: int, source_url: str = "") -> str:
+        """按页序组装 _scan_pdf_pages 的结果 (图片在这里统一编号), 替换图片引用后清洗。"""
+        parts = []
+        img_count = 0
+        images: List[tuple] = []
+        limit = len(pages)
+        if total > limit:
+            print(f"  📄 PDF 共 {total} 页，只处理前 {limit} 页")
+
+        self._record_table_screen(source_url, pages)
+        for pi, (blocks, page_tables, _) in enumerate(pages):
+            tbl_bboxes = [tb for _, _, tb in page_tables]
+            elements = []
+            for y0, b_bbox, content in blocks:
+                if b_bbox is None:
+                    w, h, img_bytes = content
+                    img_count += 1
+                    images.append(EmbeddedImageUploader.pdf_image_entry(img_count, img_bytes))
+                    elements.append(
+                        (y0, f"![图片{img_count} (第{pi + 1}页, {int(w)}x{int(h)})](pdf_image_{img_count})"))
+                elif not (tbl_bboxes and any(self._bbox_overlap(b_bbox, tb) for tb in tbl_bboxes)):
+                    elements.append((y0, content))
+            for tbl_y0, tbl_rows, _ in page_tables:
+                elements.append((tbl_y0, self._rows_to_md_table(tbl_rows)))
+
+            elements.sort(key=lambda x: x[0])
+            page_content = "\n\n".join(e[1] for e in elements)
+            if page_content.strip():
+                if limit > 1:
+                    parts.append(f"<!-- 第 {pi + 1} 页 -->\n\n{page_content}")
+                else:
+                    parts.append(page_content)
 
-                if total > self.PDF_MAX_PAGES:
-                    parts.append(f"\n\n> PDF 共 {total} 页，已处理前 {limit} 页")
+        if total > limit:
+            parts.append(f"\n\n> PDF 共 {total} 页，已处理前 {limit} 页")
 
-            result = "\n\n".join(parts).strip()
-            if result:
-                result = self._upload_embedded_images(data, '.pdf', result)
-                return self.cleaner.clean_document(result)
-        except Exception as e:
-            print(f"⚠️ PDF fitz 解析失败, 回退 MarkItDown: {e}")
-        fb = self._markitdown_convert(data, ".pdf")
-        if not fb:
+        result = "\n\n".join(parts).strip()
+        if not result:
             return ""
-        fb = self._upload_embedded_images(data, '.pdf', fb)
-        return self.cleaner.clean_document(fb)
+        result = self._upload_embedded_images(b"", '.pdf', result, images=images)
+        return self.cleaner.clean_document(result)
 
     # ── DOCX ─────────────────────────────────────────────────
-    def _parse_docx(self, data: bytes, source_url: str = "") -> str:
-        """DOCX: MarkItDown 优先 -> python-docx 回退(含图片) -> 清洗"""
-        md_text = self._markitdown_convert(data, ".docx")
-        if md_text:
-            md_text = self._upload_embedded_images(data, '.docx', md_text)
-            return self.cleaner.clean_document(md_text)
-
-        if DocxDocument is None:
+    def _parse_docx(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        """DOCX (DocxStreamReader 遍历 word/document.xml, 含图片) -> 清洗; 标题、段落、图片、表格按文档顺序输出。"""
+        if data[:4] != b'PK\x03\x04':
             return ""
+        ctx = ctx or ParseContext(data, ".docx", source_url)
         try:
-            doc = DocxDocument(BytesIO(data))
-
-            images = EmbeddedImageUploader.extract_from_zip(data, 'word/media/', min_size=self.MIN_IMG_BYTES)
-            url_map: Dict[str, str] = {}
-            if images:
-                images.sort(key=lambda x: x[0])
-                print(f"  📷 python-docx 回退: 从 DOCX 提取到 {len(images)} 张图片，正在上传...")
-                url_map = EmbeddedImageUploader.upload_images(images)
-                if url_map:
-                    print(f"  ✅ 成功上传 {len(url_map)}/{len(images)} 张")
-
-            img_count = 0
-            rId_to_url: Dict[str, str] = {}
-            for rel_id, rel in doc.part.rels.items():
-                if "image" in getattr(rel, 'reltype', ''):
-                    target = os.path.basename(str(rel.target_ref))
-                    if target.lower() in {k.lower() for k in url_map}:
-                        for k, v in url_map.items():
-                            if k.lower() == target.lower():
-                                rId_to_url[rel_id] = v
-                                break
+            reader = DocxStreamReader(ctx.zip)
+            images = ctx.media('word/media/', self.MIN_IMG_BYTES)
+            url_map: Dict[str, str] = self._image_url_map(images) if images else {}
+            by_name = {name.lower(): url for name, url in url_map.items()}
+            rId_to_url = {rid: by_name[target.lower()] for rid, target in reader.image_targets().items()
+                          if target.lower() in by_name}
 
             paragraphs = []
-            for para in doc.paragraphs:
-                para_xml = para._element.xml
-                has_image = '<w:drawing' in para_xml or '<v:imagedata' in para_xml or '<wp:inline' in para_xml
-                text = para.text.strip()
-                if text:
-                    if para.style and para.style.name and 'Heading' in para.style.name:
-                        level = para.style.name.replace('Heading', '').strip()
-                        prefix = '#' * (int(level) if level.isdigit() else 2)
-                        paragraphs.append(f"{prefix} {text}")
-                    else:
-                        paragraphs.append(text)
-                if has_image:
+            img_count = 0
+            for kind, value in reader.blocks():
+                if kind == "paragraph":
+                    level, text = value
+                    paragraphs.append(f"{'#' * level} {text}" if level else text)
+                elif kind == "image":
                     img_count += 1
-                    img_url = None
-                    embed_match = re.search(r'r:embed="([^"]+)"', para_xml)
-                    if embed_match:
-                        img_url = rId_to_url.get(embed_match.group(1))
-                    if not img_url and url_map:
-                        ordered = sorted(url_map.values())
-                        idx = img_count - 1
-                        if idx < len(ordered):
-                            img_url = ordered[idx]
+                    img_url = rId_to_url.get(value)
                     if img_url:
                         paragraphs.append(f"![文档图片{img_count}]({img_url})")
-
-            for table in doc.tables:
-                rows = []
-                for row in table.rows:
-                    rows.append([cell.text.strip() for cell in row.cells])
-                if rows:
-                    paragraphs.append(self._rows_to_md_table(rows))
+                else:
+                    paragraphs.append(self._rows_to_md_table(value))
 
             md_text = "\n\n".join(paragraphs)
-            print(f"  📄 MarkItDown 失败, python-docx 回退成功 ({len(md_text)} chars)")
+            print(f"  📄 DOCX XML 解析完成 ({len(md_text)} chars)")
         except Exception as e:
-            print(f"⚠️ python-docx 回退也失败: {e}")
+            print(f"⚠️ DOCX XML 解析失败: {e}")
             return ""
 
         if not md_text:
@@ -838,7 +2048,7 @@ class DocumentParserService:
         return self.cleaner.clean_document(md_text)
 
     # ── PPTX ─────────────────────────────────────────────────
-    def _parse_pptx(self, data: bytes, source_url: str = "") -> str:
+    def _parse_pptx(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
         if PptxPresentation is not None:
             try:
                 prs = PptxPresentation(BytesIO(data))
@@ -894,80 +2104,91 @@ class DocumentParserService:
                     md_text = "\n\n---\n\n".join(parts)
                     if images_to_upload:
                         upload_list = [(fn, bl, mi) for _, fn, bl, mi in images_to_upload]
-                        print(f"  📷 从 PPTX 幻灯片提取到 {len(upload_list)} 张图片，正在上传...")
-                        url_map = EmbeddedImageUploader.upload_images(upload_list)
-                        if url_map:
-                            print(f"  ✅ 成功上传 {len(url_map)}/{len(upload_list)} 张")
-                            for ph, fn, _, _ in images_to_upload:
-                                if fn in url_map:
-                                    md_text = md_text.replace(f"]({ph})", f"]({url_map[fn]})")
+                        url_map = self._image_url_map(upload_list)
+                        for ph, fn, _, _ in images_to_upload:
+                            if fn in url_map:
+                                md_text = md_text.replace(f"]({ph})", f"]({url_map[fn]})")
                     return self.cleaner.clean_document(md_text)
             except Exception as e:
-                print(f"⚠️ python-pptx 解析失败, 回退 MarkItDown: {e}")
-        fb = self._markitdown_convert(data, ".pptx")
-        if not fb:
-            return ""
-        fb = self._upload_embedded_images(data, '.pptx', fb)
-        return self.cleaner.clean_document(fb)
+                print(f"⚠️ python-pptx 解析失败: {e}")
+        return ""
 
     # ── Excel (xlsx / xls) ───────────────────────────────────
-    def _parse_excel(self, data: bytes, source_url: str = "") -> str:
-        is_xls = not data[:4] == b'PK\x03\x04'
-        suffix = ".xls" if is_xls else ".xlsx"
-        md_text = self._markitdown_convert(data, suffix)
-        if md_text and md_text.strip():
-            return self.cleaner.clean_table(md_text)
-        if not is_xls and openpyxl_load_workbook is not None:
-            try:
-                wb = openpyxl_load_workbook(BytesIO(data), read_only=True, data_only=True)
-                parts = []
-                for name in wb.sheetnames:
-                    ws = wb[name]
-                    rows = []
-                    for ri, row in enumerate(ws.iter_rows(values_only=True)):
-                        if ri >= self.MAX_TABLE_ROWS:
-                            rows.append(["...", f"共 {ws.max_row} 行，已截断", "..."])
-                            break
-                        rows.append([str(c) if c is not None else "" for c in row])
-                    if rows:
-                        parts.append(f"### 工作表: {name}\n\n{self._rows_to_md_table(rows)}")
-                wb.close()
-                if parts:
-                    return self.cleaner.clean_table("\n\n".join(parts))
-            except Exception as e:
-                print(f"⚠️ openpyxl 失败: {e}")
-        if is_xls and xlrd is not None:
-            try:
-                wb = xlrd.open_workbook(file_contents=data)
-                parts = []
-                for name in wb.sheet_names():
-                    ws = wb.sheet_by_name(name)
-                    rows = []
-                    for ri in range(min(ws.nrows, self.MAX_TABLE_ROWS)):
-                        rows.append([str(ws.cell_value(ri, ci)) for ci in range(ws.ncols)])
-                    if ws.nrows > self.MAX_TABLE_ROWS:
-                        rows.append(["...", f"共 {ws.nrows} 行，已截断", "..."])
-                    if rows:
-                        parts.append(f"### 工作表: {name}\n\n{self._rows_to_md_table(rows)}")
-                if parts:
-                    return self.cleaner.clean_table("\n\n".join(parts))
-            except Exception as e:
-                print(f"⚠️ xlrd 失败: {e}")
+    def _parse_xlsx(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        """
+        按行流式读取, 每个工作表读到 MAX_TABLE_ROWS 行即停止: openpyxl 只读模式;
+        文件超过 XLSX_SAX_MIN_BYTES 或未安装 openpyxl 时用 XlsxStreamReader。非 ZIP 容器 (真实格式为 xls) 直接跳过。
+        """
+        if data[:4] != b'PK\x03\x04':
+            return ""
+        ctx = ctx or ParseContext(data, ".xlsx", source_url)
+        use_sax = openpyxl_load_workbook is None or len(data) >= self.XLSX_SAX_MIN_BYTES
+        try:
+            sheets = XlsxStreamReader(ctx.zip).read(self.MAX_TABLE_ROWS) if use_sax else self._read_xlsx_openpyxl(ctx)
+            parts = []
+            for name, rows, total, truncated in sheets:
+                rows = [[str(c) if c is not None else "" for c in row] for row in rows]
+                if truncated:
+                    rows.append(["...", f"共 {total} 行，已截断" if total else "[已截断]", "..."])
+                if rows:
+                    parts.append(f"### 工作表: {name}\n\n{self._rows_to_md_table(rows)}")
+            if parts:
+                return self.cleaner.clean_table("\n\n".join(parts))
+        except Exception as e:
+            print(f"⚠️ {'xlsx 流式读取' if use_sax else 'openpyxl'} 失败: {e}")
+        return ""
+
+    def _read_xlsx_openpyxl(self, ctx: ParseContext) -> List[tuple]:
+        """[(工作表名, 行列表, 声明的总行数, 是否截断)], 与 XlsxStreamReader.read 相同。"""
+        wb = ctx.shared("workbook", lambda: openpyxl_load_workbook(BytesIO(ctx.data), read_only=True, data_only=True))
+        sheets = []
+        for name in wb.sheetnames:
+            ws = wb[name]
+            rows = list(itertools.islice(ws.iter_rows(values_only=True), self.MAX_TABLE_ROWS + 1))
+            truncated = len(rows) > self.MAX_TABLE_ROWS
+            # 工作表缺少 dimension 时 max_row 需要扫描全表, 只在截断时读取
+            sheets.append((name, rows[:self.MAX_TABLE_ROWS], ws.max_row if truncated else None, truncated))
+        return sheets
+
+    def _parse_xls(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        """xlrd (旧版 BIFF 格式); ZIP 容器 (真实格式为 xlsx) 直接跳过。"""
+        if data[:4] == b'PK\x03\x04' or xlrd is None:
+            return ""
+        try:
+            # on_demand: 工作表逐个加载, 读完即释放
+            wb = xlrd.open_workbook(file_contents=data, on_demand=True)
+            parts = []
+            for name in wb.sheet_names():
+                ws = wb.sheet_by_name(name)
+                rows = []
+                for ri in range(min(ws.nrows, self.MAX_TABLE_ROWS)):
+                    rows.append([str(ws.cell_value(ri, ci)) for ci in range(ws.ncols)])
+                if ws.nrows > self.MAX_TABLE_ROWS:
+                    rows.append(["...", f"共 {ws.nrows} 行，已截断", "..."])
+                wb.unload_sheet(name)
+                if rows:
+                    parts.append(f"### 工作表: {name}\n\n{self._rows_to_md_table(rows)}")
+            if parts:
+                return self.cleaner.clean_table("\n\n".join(parts))
+        except Exception as e:
+            print(f"⚠️ xlrd 失败: {e}")
         return ""
 
     # ── CSV ──────────────────────────────────────────────────
-    def _parse_csv(self, data: bytes, source_url: str = "") -> str:
-        md_text = self._markitdown_convert(data, ".csv")
-        if md_text and md_text.strip():
-            return self.cleaner.clean_table(md_text)
-        text = self._decode_bytes(data)
-        if not text:
+    def _parse_csv(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        """
+        按行流式读取: 编码只按开头样本探测, 增量解码, 读到 MAX_TABLE_ROWS 行即停止,
+        耗时取决于行数上限而不是文件大小。
+        """
+        if not data:
             return ""
+        stream = TextIOWrapper(BytesIO(data), encoding=self._detect_encoding(data), errors="replace", newline="")
+        sample = stream.read(8192)
+        stream.seek(0)
         try:
-            dialect = csv.Sniffer().sniff(text[:8192])
-            reader = csv.reader(text.splitlines(), dialect)
+            reader = csv.reader(stream, csv.Sniffer().sniff(sample))
         except csv.Error:
-            reader = csv.reader(text.splitlines())
+            reader = csv.reader(stream)
         rows = []
         for i, row in enumerate(reader):
             if i >= self.MAX_TABLE_ROWS:
@@ -977,21 +2198,16 @@ class DocumentParserService:
         return self.cleaner.clean_table(self._rows_to_md_table(rows)) if rows else ""
 
     # ── HTML (文件) ──────────────────────────────────────────
-    def _parse_html_file(self, data: bytes, source_url: str = "") -> str:
-        text = self._decode_bytes(data)
+    def _parse_html_file(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        text = ctx.text if ctx else self._decode_bytes(data)
         if not text:
             return ""
-        cfg = use_config()
-        cfg.set("DEFAULT", "EXTRACTION_TIMEOUT", "10")
-        result = trafilatura.extract(
-            text, config=cfg, output_format='markdown',
-            include_images=True, favor_recall=True
-        )
+        result = self._extract_main_content(text)
         return self.cleaner.clean_html(result) if result else ""
 
     # ── JSON ─────────────────────────────────────────────────
-    def _parse_json(self, data: bytes, source_url: str = "") -> str:
-        text = self._decode_bytes(data)
+    def _parse_json(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        text = ctx.text if ctx else self._decode_bytes(data)
         if not text:
             return ""
         try:
@@ -1004,11 +2220,8 @@ class DocumentParserService:
         return f"```json\n{formatted}\n```"
 
     # ── XML ──────────────────────────────────────────────────
-    def _parse_xml(self, data: bytes, source_url: str = "") -> str:
-        md_text = self._markitdown_convert(data, ".xml")
-        if md_text and md_text.strip():
-            return self.cleaner.clean_text(md_text)
-        text = self._decode_bytes(data)
+    def _parse_xml(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        text = ctx.text if ctx else self._decode_bytes(data)
         if not text:
             return ""
         if len(text) > self.MAX_TEXT_CHARS:
@@ -1016,17 +2229,17 @@ class DocumentParserService:
         return f"```xml\n{text}\n```"
 
     # ── Plain Text ───────────────────────────────────────────
-    def _parse_plain_text(self, data: bytes, source_url: str = "") -> str:
-        text = self._decode_bytes(data)
+    def _parse_plain_text(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        text = ctx.text if ctx else self._decode_bytes(data)
         return self.cleaner.clean_text(text) if text else ""
 
     # ── Markdown ─────────────────────────────────────────────
-    def _parse_markdown(self, data: bytes, source_url: str = "") -> str:
-        text = self._decode_bytes(data)
+    def _parse_markdown(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
+        text = ctx.text if ctx else self._decode_bytes(data)
         return self.cleaner.clean_text(text) if text else ""
 
     # ── Image ────────────────────────────────────────────────
-    def _parse_image(self, data: bytes, source_url: str = "") -> str:
+    def _parse_image(self, data: bytes, source_url: str = "", ctx: Optional[ParseContext] = None) -> str:
         parts = []
         if source_url:
             parts.append(f"![image]({source_url})")
@@ -1050,9 +2263,23 @@ class DocumentParserService:
         return "\n\n".join(parts)
 
     # ── 工具方法 ─────────────────────────────────────────────
+    @classmethod
+    def _detect_encoding(cls, data: bytes) -> str:
+        """按 _decode_bytes 的候选顺序, 只对开头样本做增量解码 (样本末尾被截断的多字节字符不算失败)。"""
+        if data.startswith(codecs.BOM_UTF8):
+            return "utf-8-sig"
+        sample = data[:cls.ENCODING_SAMPLE_BYTES]
+        for enc in cls.TEXT_ENCODINGS:
+            try:
+                codecs.getincrementaldecoder(enc)().decode(sample, final=len(sample) == len(data))
+                return enc
+            except (UnicodeDecodeError, LookupError):
+                continue
+        return "utf-8"
+
     @staticmethod
     def _decode_bytes(data: bytes) -> str:
-        for enc in ('utf-8', 'utf-8-sig', 'gbk', 'gb2312', 'gb18030', 'big5', 'latin-1'):
+        for enc in DocumentParserService.TEXT_ENCODINGS:
             try:
                 return data.decode(enc)
             except (UnicodeDecodeError, LookupError):
@@ -1073,7 +2300,7 @@ class DocumentParserService:
         return "\n".join([header, sep] + body)
 
     # ── 嵌入图片: 提取 + 上传 + 替换 ─────────────────────────
-    _IMG_LOCAL_REF = re.compile(r'(!\[[^\]]*\])\((?!https?://|data:)([^)]+)\)')
+    _IMG_LOCAL_REF = re.compile(r'(!\[[^\]]*\])\((?!https?://|data:|docimg://)([^)]+)\)')
 
     def _strip_and_replace_data_uris(self, md_text: str, ordered_urls: List[tuple]) -> str:
         """
@@ -1113,18 +2340,21 @@ class DocumentParserService:
             pos = paren_close + 1
         return ''.join(parts)
 
-    def _upload_embedded_images(self, data: bytes, ext: str, md_text: str) -> str:
+    def _upload_embedded_images(self, data: bytes, ext: str, md_text: str,
+                                images: Optional[List[tuple]] = None) -> str:
         """
         核心逻辑: 从文档二进制直接提取图片 -> 上传到服务器获取真实 URL ->
         替换 markdown 中所有 data:image base64 引用和本地文件名引用。
         绝不解码 base64, 图片来源是文档 ZIP/PDF 二进制本身。
+        images: 解析阶段已提取好的图片 (如 _parse_pdf 的单次遍历结果), 传入时不再重新提取。
         """
         if not md_text:
             return md_text
 
         # ── Step 1: 从文档二进制提取真实图片文件 ──────────────────
-        images: List[tuple] = []
-        if ext == '.pdf':
+        if images is not None:
+            images = list(images)
+        elif ext == '.pdf':
             images = EmbeddedImageUploader.extract_from_pdf(
                 data, max_pages=self.PDF_MAX_PAGES,
                 min_size=self.MIN_IMG_BYTES, min_dim=self.MIN_IMG_DIM
@@ -1139,15 +2369,43 @@ class DocumentParserService:
 
         images.sort(key=lambda x: x[0])
 
-        # ── Step 2: 批量上传到服务器 ─────────────────────────────
-        print(f"  📷 从文档提取到 {len(images)} 张图片，正在上传...")
-        url_map = EmbeddedImageUploader.upload_images(images)
+        # ── Step 2: 规范化 + 上传 ─────────────────────────────────
+        url_map = self._image_url_map(images)
         if not url_map:
             print(f"  ⚠️ 图片上传失败，移除 base64 噪音")
             return self._strip_and_replace_data_uris(md_text, [])
+        return self._replace_image_refs(md_text, images, url_map)
+
+    def _image_url_map(self, images: List[tuple]) -> Dict[str, str]:
+        """
+        规范化 (缩放/重新编码/近似去重) 并上传图片, 返回 {原文件名: URL};
+        延迟上传模式下 URL 为 docimg:// 占位, 上传失败的图片不在结果中。
+        """
+        to_upload, aliases = EmbeddedImageUploader.normalize_images(images)
+        pending = getattr(self._uploaded, "pending", None)
+        if pending is not None:
+            url_map = {}
+            for fname, img_data, mime in to_upload:
+                digest = hashlib.sha256(img_data).hexdigest()
+                pending.setdefault(digest, (fname, img_data, mime))
+                url_map[fname] = EmbeddedImageUploader.PLACEHOLDER_PREFIX + digest
+            print(f"  📷 从文档提取到 {len(images)} 张图片，解析结束后统一上传")
+            return EmbeddedImageUploader.apply_aliases(url_map, aliases)
+
+        print(f"  📷 从文档提取到 {len(images)} 张图片，正在上传...")
+        url_map = EmbeddedImageUploader.upload_images(to_upload)
+        collected = getattr(self._uploaded, "urls", None)
+        if collected is not None:
+            collected.update(url_map)
+            if any(fname not in url_map for fname, _, _ in to_upload):
+                self._uploaded.incomplete = True
+        EmbeddedImageUploader.apply_aliases(url_map, aliases)
+        if url_map:
+            print(f"  ✅ 成功上传 {sum(fname in url_map for fname, _, _ in images)}/{len(images)} 张图片")
+        return url_map
 
+    def _replace_image_refs(self, md_text: str, images: List[tuple], url_map: Dict[str, str]) -> str:
         ordered_urls = [(fname, url_map[fname]) for fname, _, _ in images if fname in url_map]
-        print(f"  ✅ 成功上传 {len(ordered_urls)}/{len(images)} 张图片")
 
         # ── Step 3: 替换 data:image base64 引用 (按顺序匹配) ────
         md_text = self._strip_and_replace_data_uris(md_text, ordered_urls)
@@ -1178,66 +2436,628 @@ class DocumentParserService:
         return md_text
 
     # ── 主入口 (同步, 在 asyncio.to_thread 中调用) ───────────
-    def parse(self, binary_content: bytes, file_extension: str, source_url: str = "") -> str:
+    @staticmethod
+    def _normalize_ext(file_extension: str) -> str:
         ext = file_extension.lower().strip()
-        if not ext.startswith("."):
-            ext = f".{ext}"
+        return ext if ext.startswith(".") else f".{ext}"
+
+    def _cache_lookup(self, binary_content: bytes, ext: str, source_url: str) -> tuple:
+        """返回 (文档 SHA-256, 命中的 Markdown 或 None); 缓存关闭时 SHA-256 为空串。"""
+        if not self.cache.enabled:
+            return "", None
+        digest = DocumentParseCache.digest(binary_content)
+        hit = self.cache.get(digest, ext, self.PARSER_VERSION)
+        if hit is None:
+            return digest, None
+        print(f"  ♻️ 解析缓存命中 ({ext}, {digest[:12]}, 图片 {len(hit[1])} 张): {source_url}")
+        return digest, hit[0]
+
+    def _cache_store(self, digest: str, ext: str, result: str, image_urls: Dict[str, str]) -> None:
+        if digest and not result.startswith("[无法解析"):
+            self.cache.put(digest, ext, self.PARSER_VERSION, result, image_urls)
 
-        result = ""
-        if ext == '.pdf':
-            result = self._parse_pdf(binary_content, source_url)
-        elif ext == '.docx':
-            result = self._parse_docx(binary_content, source_url)
-        elif ext == '.pptx':
-            result = self._parse_pptx(binary_content, source_url)
-        elif ext in ('.xlsx', '.xls'):
-            result = self._parse_excel(binary_content, source_url)
-        elif ext == '.csv':
-            result = self._parse_csv(binary_content, source_url)
-        elif ext in ('.html', '.htm'):
-            result = self._parse_html_file(binary_content, source_url)
-        elif ext == '.json':
-            result = self._parse_json(binary_content, source_url)
-        elif ext == '.xml':
-            result = self._parse_xml(binary_content, source_url)
-        elif ext == '.txt':
-            result = self._parse_plain_text(binary_content, source_url)
-        elif ext in ('.md', '.markdown'):
-            result = self._parse_markdown(binary_content, source_url)
-        elif ext in ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'):
-            result = self._parse_image(binary_content, source_url)
-        elif ext in ('.doc', '.ppt'):
-            fb = self._markitdown_convert(binary_content, ext)
-            if fb:
-                fb = self._upload_embedded_images(binary_content, ext, fb)
-                result = self.cleaner.clean_document(fb)
+    def parse(self, binary_content: bytes, file_extension: str, source_url: str = "") -> str:
+        ext = self._normalize_ext(file_extension)
+        digest, hit = self._cache_lookup(binary_content, ext, source_url)
+        if hit is not None:
+            return hit
 
-        if not (result and result.strip()):
-            print(f"⚠️ 格式 {ext} 专用解析无结果，尝试 MarkItDown 兜底")
-            fb = self._markitdown_convert(binary_content, ext)
-            if fb:
-                if ext in ('.pdf', '.docx', '.doc', '.pptx', '.ppt'):
-                    fb = self._upload_embedded_images(binary_content, ext, fb)
-                result = self.cleaner.clean_document(fb)
-            else:
-                result = f"[无法解析 {ext} 格式文件]"
+        self._uploaded.urls, self._uploaded.incomplete = {}, False
+        try:
+            result, _ = self._parse_uncached(binary_content, ext, source_url)
+            image_urls, incomplete = self._uploaded.urls, self._uploaded.incomplete
+        finally:
+            self._uploaded.urls = None
 
+        # 有图片上传失败时不写缓存, 下次命中同一文档会重新上传
+        if not incomplete:
+            self._cache_store(digest, ext, result, image_urls)
         return result
 
+    def parse_deferred(self, binary_content: bytes, file_extension: str, source_url: str = "") -> dict:
+        """
+        与 parse 相同, 但图片不在解析线程/子进程里上传:
+        正文中的图片先写成 docimg://<SHA-256> 占位, 待上传图片按内容去重后随结果返回,
+        由 resolve_deferred 在事件循环中统一上传并替换, 解析 worker 可以立即处理下一个文档。
+        本次的表格预筛决策 (table_screen) 同样随结果返回, 解析子进程中的决策由父进程 absorb_table_screen 合并。
+        """
+        ext = self._normalize_ext(file_extension)
+        digest, hit = self._cache_lookup(binary_content, ext, source_url)
+        if hit is not None:
+            return {"markdown": hit, "pending": {}, "digest": "", "ext": ext, "trail": [], "table_screen": []}
+
+        self._uploaded.pending = {}
+        self._screened.entries = []
+        try:
+            result, trail = self._parse_uncached(binary_content, ext, source_url)
+            pending, table_screen = self._uploaded.pending, self._screened.entries
+        finally:
+            self._uploaded.pending = None
+            self._screened.entries = None
+        return {"markdown": result, "pending": pending, "digest": digest, "ext": ext, "trail": trail,
+                "table_screen": table_screen}
+
+    async def resolve_deferred(self, parsed: dict, client: httpx.AsyncClient) -> str:
+        """上传 parse_deferred 返回的待处理图片, 替换占位并写入解析缓存。"""
+        md_text, pending = parsed["markdown"], parsed["pending"]
+        image_urls: Dict[str, str] = {}
+        if pending:
+            print(f"  📤 正在上传 {len(pending)} 张图片 (按内容去重后)...")
+            url_by_digest = await EmbeddedImageUploader.upload_pending(pending, client)
+            md_text = EmbeddedImageUploader.resolve_placeholders(md_text, url_by_digest)
+            image_urls = {pending[d][0]: url for d, url in url_by_digest.items() if d in pending}
+            print(f"  ✅ 图片就绪 {len(image_urls)}/{len(pending)} 张")
+        if parsed["digest"] and len(image_urls) == len(pending):
+            await asyncio.to_thread(self._cache_store, parsed["digest"], parsed["ext"], md_text, image_urls)
+        return md_text
+
+    def _strategy_failing(self, ext: str, strategy: tuple) -> bool:
+        """样本足够且 (带先验的) 成功率低于 STRATEGY_FAILING_RATE。"""
+        attempts, successes, _ = self.parser_stats.get((ext, strategy[0]), (0, 0, 0.0))
+        if attempts < self.STRATEGY_MIN_SAMPLES:
+            return False
+        k = self.STRATEGY_PRIOR_WEIGHT
+        return (successes + self.STRATEGY_PRIOR_SUCCESS * k) / (attempts + k) < self.STRATEGY_FAILING_RATE
+
+    def _ordered_strategies(self, ext: str) -> List[tuple]:
+        """质量顺序, 有持续失败记录的解析器移到最后; 同一统计下结果是确定的。"""
+        strategies = self.PARSE_STRATEGIES.get(ext, [self._MARKITDOWN_STRATEGY])
+        return sorted(strategies, key=lambda st: self._strategy_failing(ext, st))
+
+    def _record_attempt(self, ext: str, name: str, ok: bool, elapsed_ms: float, persist: bool = True) -> None:
+        with self._stats_lock:
+            row = self.parser_stats.setdefault((ext, name), [0, 0, 0.0])
+            row[0] += 1
+            row[1] += int(ok)
+            row[2] += elapsed_ms
+        if persist:
+            self.cache.record_parser_attempt(ext, name, ok, elapsed_ms)
+
+    def absorb_trail(self, ext: str, source_url: str, trail: List[dict]) -> None:
+        """合并解析子进程的决策轨迹 (子进程已写入缓存库, 这里只更新内存统计)。"""
+        for t in trail:
+            self._record_attempt(ext, t["strategy"], t["ok"], t["ms"], persist=False)
+        if trail:
+            self.parse_trail_log.append({"url": source_url, "ext": ext, "trail": trail})
+
+    def _parse_uncached(self, binary_content: bytes, ext: str, source_url: str = "") -> tuple:
+        """按质量顺序依次尝试候选解析器, 返回 (Markdown, 决策轨迹)。"""
+        ctx = ParseContext(binary_content, ext, source_url)
+        result = ""
+        try:
+            for name, method in self._ordered_strategies(ext):
+                start = time.perf_counter()
+                try:
+                    result = getattr(self, method)(binary_content, source_url, ctx)
+                except Exception as e:
+                    print(f"⚠️ {name} 解析 {ext} 异常: {e}")
+                    result = ""
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                ok = bool(result and result.strip())
+                self._record_attempt(ext, name, ok, elapsed_ms)
+                ctx.trail.append({"strategy": name, "ok": ok, "ms": round(elapsed_ms, 1)})
+                if ok:
+                    break
+        finally:
+            ctx.close()
+
+        if not (result and result.strip()):
+            result = f"[无法解析 {ext} 格式文件]"
+        self.log_trail(ext, source_url, ctx.trail)
+        return result, ctx.trail
+
+    def log_trail(self, ext: str, source_url: str, trail: List[dict]) -> None:
+        self.parse_trail_log.append({"url": source_url, "ext": ext, "trail": trail})
+        steps = " → ".join(f"{t['strategy']} {'✓' if t['ok'] else '✗'} {t['ms']:.0f}ms" for t in trail)
+        print(f"  🧭 解析路径 ({ext}): {steps}")
+
+    def metrics(self) -> dict:
+        """解析器统计 (含其他进程写入缓存库的样本)、当前尝试顺序、最近的决策轨迹与缓存命中情况。"""
+        persisted = self.cache.load_parser_stats()
+        if persisted:
+            with self._stats_lock:
+                self.parser_stats = persisted
+        strategies: Dict[str, list] = {}
+        for (ext, name), (attempts, successes, total_ms) in sorted(self.parser_stats.items()):
+            strategies.setdefault(ext, []).append({
+                "strategy": name, "attempts": attempts,
+                "success_rate": round(successes / attempts, 3) if attempts else None,
+                "avg_ms": round(total_ms / attempts, 1) if attempts else None,
+            })
+        order = {ext: [st[0] for st in self._ordered_strategies(ext)] for ext in strategies}
+        return {
+            "parser_stats": strategies,
+            "strategy_order": order,
+            "recent_trails": list(self.parse_trail_log),
+            "table_screen": dict(self.table_screen_stats),
+            "cache": dict(self.cache.stats),
+        }
+
     async def parse_async(self, binary_content: bytes, file_extension: str, source_url: str = "") -> str:
         return await asyncio.to_thread(self.parse, binary_content, file_extension, source_url)
 
     def parse_html_content(self, html: str, base_url: str = "") -> str:
         if not html:
             return ""
-        cfg = use_config()
-        cfg.set("DEFAULT", "EXTRACTION_TIMEOUT", "10")
-        result = trafilatura.extract(
-            html, config=cfg, output_format='markdown',
-            include_images=True, favor_recall=True
-        )
+        result = self._extract_main_content(html)
         return self.cleaner.clean_html(result) if result else ""
 
+    # ── 网页 (抓取结果) ──────────────────────────────────────
+    def _extract_main_content(self, html) -> str:
+        """html 可以是字符串或已解析的 lxml 树 (trafilatura 会先复制再修剪, 传入的树不被修改)。"""
+        return trafilatura.extract(
+            html, config=self.trafilatura_config, output_format='markdown',
+            include_images=True, favor_recall=True
+        ) or ""
+
+    @staticmethod
+    def extract_videos(tree, base_url: str) -> List[str]:
+        """从已解析的 lxml 树中收集 <video>/<source> 与视频类 <iframe> 的地址。"""
+        try:
+            videos = []
+            for video in tree.iter("video"):
+                src = video.get("src")
+                if src: videos.append(urljoin(base_url, src))
+                for source in video.iter("source"):
+                    src = source.get("src")
+                    if src: videos.append(urljoin(base_url, src))
+            for iframe in tree.iter("iframe"):
+                src = iframe.get("src")
+                if src and any(k in src for k in ["youtube", "vimeo", "embed", ".mp4"]):
+                    videos.append(urljoin(base_url, src))
+            return list(dict.fromkeys(videos))  # 去重并保持顺序
+        except Exception as e:
+            print(f"⚠️ 视频解析失败: {e}")
+            return []
+
+    def extract_web_page(self, body: bytes, encoding: str, base_url: str) -> dict:
+        """
+        抓取到的 HTML 页面: 正文 Markdown (未清洗, 图片校验等清洗步骤由调用方异步完成) + 视频链接。
+        每页只做一次 lxml 解析, 正文与图片提取 (trafilatura) 和视频发现共用这棵树; 正文为空时不再找视频。
+        """
+        tree = trafilatura.load_html(body.decode(encoding or "utf-8", errors="replace"))
+        if tree is None:
+            return {"content": "", "videos": []}
+        content = self._extract_main_content(tree)
+        return {"content": content, "videos": self.extract_videos(tree, base_url) if content else []}
+
+
+# ==============================================================================
+# ========== 文档解析引擎 (DocumentParseEngine, 线程 / 进程池) ==========
+# ==============================================================================
+
+class SpooledDownload:
+    """
+    下载缓冲: 不超过 spool_bytes 时保存在内存, 超过后整体转存到临时文件 (与 SpooledTemporaryFile 相同的策略,
+    但临时文件有路径, 解析子进程可以直接按路径读取, 父进程不再持有整份文档)。
+    读取时优先使用零拷贝视图: 内存中为 bytearray 本身, 落盘后为只读 mmap。
+    """
+
+    def __init__(self, spool_bytes: int):
+        self.spool_bytes = spool_bytes
+        self.size = 0
+        self.path: Optional[str] = None
+        self._mem: Optional[bytearray] = bytearray()
+        self._file = None
+
+    @property
+    def on_disk(self) -> bool:
+        return self.path is not None
+
+    def write(self, chunk: bytes) -> None:
+        if self._mem is not None and len(self._mem) + len(chunk) > self.spool_bytes:
+            fd, self.path = tempfile.mkstemp(suffix=".download")
+            self._file = os.fdopen(fd, "w+b")
+            self._file.write(self._mem)
+            self._mem = None
+        if self._mem is not None:
+            self._mem += chunk
+        else:
+            self._file.write(chunk)
+        self.size += len(chunk)
+
+    def finish(self) -> None:
+        """下载完成: 落盘的文件刷新到磁盘后关闭写句柄, 之后按路径读取。"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def head(self, n: int) -> bytes:
+        if self._mem is not None:
+            return bytes(self._mem[:n])
+        self._file.flush()
+        with open(self.path, "rb") as f:
+            return f.read(n)
+
+    @contextlib.contextmanager
+    def view(self):
+        """只读视图 (支持切片、find、缓冲区协议), 退出时释放 mmap。"""
+        if self._mem is not None or not self.size:
+            yield self._mem if self._mem is not None else b""
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
+    def open(self):
+        """可 seek 的只读文件句柄, 供 ZipFile 等按需读取。"""
+        if self._mem is not None:
+            return BytesIO(self._mem)
+        return open(self.path, "rb")
+
+    def getvalue(self) -> bytes:
+        if self._mem is not None:
+            return bytes(self._mem)
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def close(self) -> None:
+        self.finish()
+        self._mem = None
+        if self.path and os.path.exists(self.path):
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class _ParseBuffer:
+    """
+    父进程 -> 解析子进程的文档字节传递: 优先共享内存, 不可用时落盘为临时文件。
+    已落盘的 SpooledDownload 直接传递其文件路径, 不再复制 (文件由下载方负责删除)。
+    """
+
+    def __init__(self, data):
+        self.size = len(data) if not isinstance(data, SpooledDownload) else data.size
+        self._shm = None
+        self._path = None
+        if isinstance(data, SpooledDownload):
+            if data.on_disk:
+                data.finish()
+                self.kind, self.handle = "file", data.path
+                return
+            with data.view() as view:
+                self._init_from(view)
+            return
+        self._init_from(data)
+
+    def _init_from(self, data) -> None:
+        if shared_memory is not None and data:
+            try:
+                self._shm = shared_memory.SharedMemory(create=True, size=len(data))
+                self._shm.buf[:len(data)] = data
+                self.kind, self.handle = "shm", self._shm.name
+                return
+            except Exception:
+                self._shm = None
+        fd, self._path = tempfile.mkstemp(suffix=".parse")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        self.kind, self.handle = "file", self._path
+
+    @staticmethod
+    def read(kind: str, handle: str, size: int) -> bytes:
+        if kind == "shm":
+            # fork 子进程与父进程共用 resource_tracker, 由父进程负责 unlink
+            shm = shared_memory.SharedMemory(name=handle)
+            try:
+                return bytes(shm.buf[:size])
+            finally:
+                shm.close()
+        with open(handle, "rb") as f:
+            return f.read()
+
+    def release(self) -> None:
+        if self._shm is not None:
+            try:
+                self._shm.close()
+                self._shm.unlink()
+            except Exception:
+                pass
+        if self._path and os.path.exists(self._path):
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+
+
+def _parse_worker_main(conn, service: "DocumentParserService") -> None:
+    """
+    解析子进程主循环: 接收 (任务类型, 传递方式, 句柄, 长度, 扩展名或编码, URL, 附加参数)。
+    service 为父进程中引擎持有的解析服务 (fork 继承, 无需序列化)。
+    doc 任务返回 parse_deferred 的结果 (图片由父进程上传), web 任务返回 extract_web_page 的结果;
+    pdf-pages 扫描大 PDF 的一个页范围, 由父进程合并。
+    """
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            break
+        if task is None:
+            break
+        op, kind, handle, size, ext, source_url, extra = task
+        try:
+            data = _ParseBuffer.read(kind, handle, size)
+            if op == "web":
+                conn.send(("ok", service.extract_web_page(data, ext, source_url)))
+            elif op == "pdf-pages":
+                conn.send(("ok", service.scan_pdf_range(data, *extra)))
+            else:
+                conn.send(("ok", service.parse_deferred(data, ext, source_url)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class DocumentParseEngine:
+    """
+    DocumentParserService 的执行后端。
+    - thread: asyncio.to_thread (原有行为, 受 GIL 限制);
+    - process: 常驻解析子进程池 (fork), 大小默认等于 CPU 核数; 首次解析/提取时一次性 fork
+      (没有文档需要解析的运行不创建进程), 且在本引擎创建任何线程之前, 之后不再 fork
+      (多线程进程 fork 出的子进程可能卡在其他线程持有的锁上);
+      等待子进程回复使用引擎自己的线程池 (大小等于子进程数), 不占用 asyncio.to_thread 的默认线程池;
+      文档字节经共享内存传递, 单文档超时后直接杀掉该子进程, 池中没有空闲子进程时由线程模式兜底;
+      等待方被取消 (如对冲胜出后取消落后的抓取) 时不杀子进程, 它完成当前任务后回到空闲列表;
+    - auto: 平台支持 fork 时使用 process, 否则回退 thread。
+    两种模式下图片都不在 worker 中上传: worker 返回带占位的结果后即可处理下一个文档,
+    图片由事件循环通过共享的连接池客户端并发上传, 最后替换占位。
+    抓取到的 HTML 页面 (trafilatura 正文 + 视频链接) 也在同一个池中提取;
+    页数较多的 PDF 由父进程规划分片, 各页范围提交到同一个池并行扫描, 扫描结果在父进程合并。
+    """
+    MODE = os.environ.get("DOC_PARSER_MODE", "auto")
+    WORKERS = int(os.environ.get("DOC_PARSER_WORKERS", "0")) or (os.cpu_count() or 2)
+    PARSE_TIMEOUT = float(os.environ.get("DOC_PARSE_TIMEOUT", "120"))
+
+    def __init__(self, parser_service: DocumentParserService, mode: Optional[str] = None,
+                 workers: Optional[int] = None, timeout: Optional[float] = None):
+        self.parser_service = parser_service
+        self.mode = (mode or self.MODE).lower()
+        self.workers = workers or self.WORKERS
+        self.timeout = timeout or self.PARSE_TIMEOUT
+        self._ctx = None
+        if self.mode in ("auto", "process"):
+            try:
+                self._ctx = multiprocessing.get_context("fork")
+            except ValueError:
+                print("⚠️ 当前平台不支持 fork, 文档解析回退到线程模式")
+        if self._ctx is None:
+            self.mode = "thread"
+        self._started = False
+        self._idle: List[tuple] = []
+        # 等待方已取消、仍在完成当前任务的子进程
+        self._draining: set = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._upload_client: Optional[httpx.AsyncClient] = None
+        self.stats = {"process": 0, "thread": 0, "web": 0, "pdf_sharded": 0, "timeout": 0, "crashed": 0, "drained": 0}
+
+    def start(self) -> None:
+        """fork 全部解析子进程并创建等待回复的线程池; 首次使用时自动调用, 运行中失去的子进程不再补充。"""
+        if self.mode == "thread" or self._started:
+            return
+        self._started = True
+        try:
+            for _ in range(self.workers):
+                self._idle.append(self._spawn_worker())
+        except Exception as e:
+            print(f"⚠️ 解析子进程启动失败, 回退到线程模式: {e}")
+            self.shutdown()
+            self.mode = "thread"
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="parse-exchange")
+
+    def _spawn_worker(self) -> tuple:
+        if shared_memory is not None:
+            # 先启动 resource_tracker, 保证子进程继承同一个 tracker
+            from multiprocessing import resource_tracker
+            resource_tracker.ensure_running()
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(target=_parse_worker_main, args=(child_conn, self.parser_service), daemon=True)
+        proc.start()
+        child_conn.close()
+        return proc, parent_conn
+
+    @staticmethod
+    def _kill_worker(worker: tuple) -> None:
+        proc, conn = worker
+        try:
+            proc.kill()
+            proc.join(timeout=5)
+        except Exception:
+            pass
+        conn.close()
+
+    @staticmethod
+    def _exchange(conn, task: tuple, timeout: float) -> Optional[tuple]:
+        conn.send(task)
+        if not conn.poll(timeout):
+            return None
+        return conn.recv()
+
+    @staticmethod
+    def _materialize(data) -> bytes:
+        return data.getvalue() if isinstance(data, SpooledDownload) else data
+
+    async def _parse_in_thread(self, data, ext: str, source_url: str) -> dict:
+        self.stats["thread"] += 1
+        return await asyncio.to_thread(
+            lambda: self.parser_service.parse_deferred(self._materialize(data), ext, source_url))
+
+    def _get_upload_client(self) -> httpx.AsyncClient:
+        if self._upload_client is None:
+            limit = EmbeddedImageUploader.UPLOAD_CONCURRENCY
+            self._upload_client = httpx.AsyncClient(
+                timeout=60, verify=False,
+                limits=httpx.Limits(max_connections=limit, max_keepalive_connections=limit))
+        return self._upload_client
+
+    async def parse(self, data, ext: str, source_url: str = "") -> str:
+        """data 为 bytes 或 SpooledDownload; 进程模式下已落盘的下载按路径交给子进程, 不经过父进程内存。"""
+        parsed = await self._parse_deferred(data, ext, source_url)
+        return await self.parser_service.resolve_deferred(parsed, self._get_upload_client())
+
+    async def extract_html(self, body, encoding: str, base_url: str = "") -> dict:
+        """网页正文与视频提取: {"content": 未清洗的 Markdown, "videos": [...]}。"""
+        if self.mode != "thread":
+            payload = await self._run_in_worker("web", body, encoding, base_url)
+            if payload is not None:
+                self.stats["web"] += 1
+                return payload
+        self.stats["thread"] += 1
+        return await asyncio.to_thread(
+            lambda: self.parser_service.extract_web_page(self._materialize(body), encoding, base_url))
+
+    async def _parse_pdf_sharded(self, data, source_url: str) -> Optional[dict]:
+        """
+        大 PDF: 父进程读取页数规划分片, 各页范围在池中并行扫描, 扫描结果 (含图片字节) 只回传父进程一次,
+        在父进程合并; 不需要分片或分片失败时返回 None。
+        """
+        view_cm = data.view() if isinstance(data, SpooledDownload) else contextlib.nullcontext(data)
+        with view_cm as view:
+            plan = await asyncio.to_thread(self.parser_service.pdf_shard_plan, view, self.workers)
+        if plan is None:
+            return None
+        bounds = plan["bounds"]
+        started = time.perf_counter()
+        buf = _ParseBuffer(data)
+        try:
+            shards = await asyncio.gather(*(self._run_in_worker("pdf-pages", buf, ".pdf", source_url, (a, b))
+                                            for a, b in zip(bounds, bounds[1:])), return_exceptions=True)
+        finally:
+            buf.release()
+        failed = next((pages for pages in shards if isinstance(pages, BaseException)), None)
+        if failed is not None:
+            print(f"  ⚠️ PDF 分片并行扫描失败, 整篇解析: {failed}")
+            return None
+        if any(pages is None for pages in shards):
+            return None
+        print(f"  ⚡ PDF {bounds[-1]} 页分 {len(bounds) - 1} 片并行扫描")
+        payload = await asyncio.to_thread(self.parser_service.merge_pdf_shards, plan, shards, source_url, started)
+        if payload is not None:
+            self.stats["pdf_sharded"] += 1
+        return payload
+
+    async def _parse_deferred(self, data, ext: str, source_url: str) -> dict:
+        if self.mode != "thread":
+            if self.workers >= 2 and self.parser_service._normalize_ext(ext) == ".pdf":
+                payload = await self._parse_pdf_sharded(data, source_url)
+                if payload is not None:
+                    return payload
+            payload = await self._run_in_worker("doc", data, ext, source_url)
+            if payload is not None:
+                self.stats["process"] += 1
+                self.parser_service.absorb_trail(payload["ext"], source_url, payload.get("trail", []))
+                self.parser_service.absorb_table_screen(payload.get("table_screen", []))
+                return payload
+        return await self._parse_in_thread(data, ext, source_url)
+
+    async def _run_in_worker(self, op: str, data, ext: str, source_url: str, extra=None):
+        """在空闲子进程中执行一个任务; 没有空闲子进程 (已因超时/崩溃失去) 时返回 None, 由调用方改用线程模式。"""
+        self.start()
+        if self.mode == "thread":
+            return None
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        await self._slots.acquire()
+        if not self._idle:
+            # 超时/崩溃失去的子进程不在运行中补充, 该名额由线程模式处理
+            self._slots.release()
+            return None
+        worker = self._idle.pop()
+
+        # 传入已建好的 _ParseBuffer 时 (分片共用同一份文档) 由调用方释放
+        owned = not isinstance(data, _ParseBuffer)
+        buf = _ParseBuffer(data) if owned else data
+        task = (op, buf.kind, buf.handle, buf.size, ext, source_url, extra)
+        exchange = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._exchange, worker[1], task, self.timeout)
+        draining = False
+        try:
+            reply = await asyncio.shield(exchange)
+        except (EOFError, OSError) as e:
+            self.stats["crashed"] += 1
+            self._kill_worker(worker)
+            raise RuntimeError(f"解析子进程异常退出: {e}")
+        except asyncio.CancelledError:
+            # 名额与文档缓冲在子进程完成当前任务之前保持占用
+            draining = True
+            self._draining.add(worker)
+            exchange.add_done_callback(lambda f: self._drain(f, worker, buf if owned else None))
+            raise
+        finally:
+            if not draining:
+                self._slots.release()
+                if owned:
+                    buf.release()
+
+        if reply is None:
+            self.stats["timeout"] += 1
+            self._kill_worker(worker)
+            raise TimeoutError(f"文档解析超时 ({self.timeout:.0f}s), 已终止解析子进程: {source_url}")
+        self._idle.append(worker)
+        status, payload = reply
+        if status != "ok":
+            raise RuntimeError(f"解析子进程异常: {payload}")
+        return payload
+
+    def _drain(self, exchange: asyncio.Future, worker: tuple, buf: Optional[_ParseBuffer]) -> None:
+        """被取消的任务在子进程中结束后: 丢弃回复, 子进程回到空闲列表 (超时或管道异常时杀掉)。"""
+        if buf is not None:
+            buf.release()
+        self._slots.release()
+        if worker not in self._draining:
+            # 引擎已关闭, 子进程已由 shutdown 终止
+            return
+        self._draining.discard(worker)
+        if exchange.cancelled() or exchange.exception() is not None or exchange.result() is None:
+            self._kill_worker(worker)
+            return
+        self.stats["drained"] += 1
+        self._idle.append(worker)
+
+    async def aclose(self) -> None:
+        self.shutdown()
+        if self._upload_client is not None:
+            await self._upload_client.aclose()
+            self._upload_client = None
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        while self._draining:
+            self._kill_worker(self._draining.pop())
+        while self._idle:
+            proc, conn = self._idle.pop()
+            try:
+                conn.send(None)
+                proc.join(timeout=2)
+            except Exception:
+                pass
+            if proc.is_alive():
+                proc.kill()
+            conn.close()
+
 
 class ContentScraper(ABC):
     """内容抓取器的抽象基类。"""
@@ -1250,26 +3070,299 @@ class ContentScraper(ABC):
         """
         pass
 
+    async def aclose(self) -> None:
+        """释放抓取器持有的资源 (如解析子进程)，默认无操作。"""
+        pass
+
+
+# --- 2.0 排队计时 ---
+class ScrapeQueueWait:
+    """
+    单个抓取条目在礼貌调度 / 内存预算队列中的累计等待, 供 HedgedScrapePolicy 从运行预算中扣除;
+    parsing 表示本地抓取器已下载完成、正在解析, 此时 HedgedScrapePolicy 不再按 HEDGE_DELAY 对冲。
+    """
+    __slots__ = ("total", "since", "parsing")
+
+    def __init__(self):
+        self.total = 0.0
+        self.since: Optional[float] = None
+        self.parsing = False
+
+    def seconds(self, now: float) -> float:
+        return self.total + (now - self.since if self.since is not None else 0.0)
+
+
+# 由 HedgedScrapePolicy 为每个条目设置; 抓取任务创建时复制上下文, 共享同一个计时对象
+_SCRAPE_QUEUE_WAIT: contextvars.ContextVar = contextvars.ContextVar("scrape_queue_wait", default=None)
+
+
+@contextlib.contextmanager
+def _scrape_queued():
+    """标记当前条目正在排队; 不在 HedgedScrapePolicy 中 (或已在计时) 时不做任何事。"""
+    tracker = _SCRAPE_QUEUE_WAIT.get()
+    if tracker is None or tracker.since is not None:
+        yield
+        return
+    loop = asyncio.get_running_loop()
+    tracker.since = loop.time()
+    try:
+        yield
+    finally:
+        tracker.total += loop.time() - tracker.since
+        tracker.since = None
+
+
+@contextlib.contextmanager
+def _scrape_parsing():
+    """标记当前条目已下载完成、正在解析; 不在 HedgedScrapePolicy 中时不做任何事。"""
+    tracker = _SCRAPE_QUEUE_WAIT.get()
+    if tracker is None:
+        yield
+        return
+    tracker.parsing = True
+    try:
+        yield
+    finally:
+        tracker.parsing = False
+
+
+# --- 2.0.1 按域名的礼貌调度 ---
+class HostPolitenessScheduler:
+    """
+    直连抓取的请求调度: 每个域名有并发上限与两次请求的最小间隔, 全局并发有上限,
+    全局空位按域名轮转分配 (同一域名的大量 URL 不会占满全部连接, 其他域名不必空等)。
+    收到 429 / 403 / 503 时该域名指数退避 (优先使用 Retry-After), 并发降为 1 且请求间隔加倍,
+    之后每连续成功 RECOVER_AFTER 次恢复一个并发名额并把间隔减半。
+    """
+    PER_HOST = int(os.environ.get("SCRAPE_PER_HOST_CONCURRENCY", "2"))
+    MIN_INTERVAL = float(os.environ.get("SCRAPE_HOST_MIN_INTERVAL", "0.5"))
+    GLOBAL = int(os.environ.get("SCRAPE_GLOBAL_CONCURRENCY", "32"))
+    BACKOFF_BASE = 2.0
+    BACKOFF_MAX = 60.0
+    RECOVER_AFTER = 5
+    THROTTLE_STATUS = (429, 403, 503)
+
+    def __init__(self):
+        self._queues: Dict[str, deque] = {}
+        self._rotation: deque = deque()
+        self._active: Dict[str, int] = {}
+        self._active_total = 0
+        self._next_start: Dict[str, float] = {}
+        self._strikes: Dict[str, int] = {}
+        self._caps: Dict[str, int] = {}
+        self._intervals: Dict[str, float] = {}
+        self._successes: Dict[str, int] = {}
+        self._timer = None
+        self.stats = {"granted": 0, "throttled": 0, "max_wait": 0.0}
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        try:
+            return (urlsplit(url).hostname or "").lower()
+        except ValueError:
+            return ""
+
+    def _host_cap(self, host: str) -> int:
+        return min(self._caps.get(host, self.PER_HOST), self.PER_HOST)
+
+    def _arm_timer(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        when = loop.time() + delay
+        if self._timer is not None and self._timer.when() <= when:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_at(when, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """按域名轮转, 每轮每个域名最多放行一个请求, 直到全局满额或没有可放行的域名。"""
+        loop = asyncio.get_running_loop()
+        progress = True
+        while progress and self._active_total < self.GLOBAL:
+            progress = False
+            for host in list(self._rotation):
+                if self._active_total >= self.GLOBAL:
+                    break
+                queue = self._queues[host]
+                while queue and queue[0].done():
+                    queue.popleft()
+                if not queue:
+                    self._rotation.remove(host)
+                    continue
+                if self._active.get(host, 0) >= self._host_cap(host):
+                    continue
+                wait = self._next_start.get(host, 0.0) - loop.time()
+                if wait > 0:
+                    self._arm_timer(wait)
+                    continue
+                queue.popleft().set_result(None)
+                self._active[host] = self._active.get(host, 0) + 1
+                self._active_total += 1
+                self._next_start[host] = loop.time() + self._intervals.get(host, self.MIN_INTERVAL)
+                self.stats["granted"] += 1
+                # 放行后移到队尾, 保证轮转
+                self._rotation.remove(host)
+                if queue:
+                    self._rotation.append(host)
+                progress = True
+
+    def _release(self, host: str) -> None:
+        self._active[host] -= 1
+        self._active_total -= 1
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def slot(self, url: str):
+        loop = asyncio.get_running_loop()
+        host = self.host_of(url)
+        waiter = loop.create_future()
+        self._queues.setdefault(host, deque()).append(waiter)
+        if host not in self._rotation:
+            self._rotation.append(host)
+        queued_at = loop.time()
+        self._dispatch()
+        try:
+            with _scrape_queued():
+                await waiter
+        except asyncio.CancelledError:
+            # 取消与放行同时发生时归还名额
+            if waiter.done() and not waiter.cancelled():
+                self._release(host)
+            raise
+        self.stats["max_wait"] = max(self.stats["max_wait"], loop.time() - queued_at)
+        try:
+            yield
+        finally:
+            self._release(host)
+
+    def report(self, url: str, status: int, retry_after: Optional[str] = None) -> Optional[float]:
+        """记录响应状态; 被限流时返回该域名的退避秒数。"""
+        host = self.host_of(url)
+        if status not in self.THROTTLE_STATUS:
+            if host in self._caps:
+                self._successes[host] = self._successes.get(host, 0) + 1
+                if self._successes[host] >= self.RECOVER_AFTER:
+                    self._successes[host] = 0
+                    self._strikes[host] = max(self._strikes.get(host, 0) - 1, 0)
+                    self._caps[host] += 1
+                    self._intervals[host] = self._intervals.get(host, self.MIN_INTERVAL) / 2
+                    if self._caps[host] >= self.PER_HOST and self._intervals[host] <= self.MIN_INTERVAL:
+                        del self._caps[host], self._intervals[host]
+                    self._dispatch()
+            return None
+        strikes = self._strikes[host] = self._strikes.get(host, 0) + 1
+        self._caps[host] = 1
+        self._intervals[host] = min(max(self._intervals.get(host, self.MIN_INTERVAL) * 2, 1.0), self.BACKOFF_MAX)
+        self._successes[host] = 0
+        delay = min(self.BACKOFF_BASE * 2 ** (strikes - 1), self.BACKOFF_MAX)
+        if retry_after and retry_after.strip().isdigit():
+            delay = min(max(float(retry_after), delay), self.BACKOFF_MAX)
+        loop = asyncio.get_running_loop()
+        self._next_start[host] = max(self._next_start.get(host, 0.0), loop.time() + delay)
+        self.stats["throttled"] += 1
+        print(f"  🐢 [Host Scheduler] {host} 返回 {status}, 退避 {delay:.1f}s (并发降为 1)")
+        return delay
+
+
+# --- 2.0.2 下载内存预算 ---
+class DownloadMemoryBudget:
+    """
+    单次运行的内存上限: 每个下载开始前预留其最多驻留内存的字节数 (即 SpooledDownload 的落盘阈值),
+    当前进程 RSS + 未释放的预留 超过 RSS_CEILING 时新下载按到达顺序排队,
+    直到已有下载释放预留或 RSS 回落 (定时复查)。没有进行中的下载时总会放行一个, 避免基线内存过高时卡死。
+    """
+    RSS_CEILING = int(float(os.environ.get("SCRAPE_RSS_CEILING_MB", "1024")) * 1024 * 1024)
+    RECHECK_INTERVAL = 0.5
+
+    def __init__(self, ceiling: Optional[int] = None):
+        self.ceiling = self.RSS_CEILING if ceiling is None else ceiling
+        self._waiters: deque = deque()
+        self._reserved = 0
+        self._active = 0
+        self._timer = None
+        self.stats = {"granted": 0, "queued": 0, "max_wait": 0.0, "peak_rss": 0}
+
+    @staticmethod
+    def current_rss() -> int:
+        """当前进程常驻内存 (字节); 不支持 /proc 的平台返回 0, 只按预留量计数。"""
+        try:
+            with open("/proc/self/statm", "rb") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return 0
+
+    def _dispatch(self) -> None:
+        while self._waiters and self._waiters[0][0].done():
+            self._waiters.popleft()
+        if not self._waiters:
+            return
+        rss = self.current_rss()
+        self.stats["peak_rss"] = max(self.stats["peak_rss"], rss)
+        while self._waiters:
+            waiter, nbytes = self._waiters[0]
+            if waiter.done():
+                self._waiters.popleft()
+                continue
+            if self._active and rss + self._reserved + nbytes > self.ceiling:
+                break
+            self._waiters.popleft()
+            self._reserved += nbytes
+            self._active += 1
+            self.stats["granted"] += 1
+            waiter.set_result(None)
+        if self._waiters and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.RECHECK_INTERVAL, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _release(self, nbytes: int) -> None:
+        self._reserved -= nbytes
+        self._active -= 1
+        self._dispatch()
+
+    @contextlib.asynccontextmanager
+    async def reserve(self, nbytes: int):
+        if self.ceiling <= 0:
+            yield
+            return
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append((waiter, nbytes))
+        queued_at = loop.time()
+        self._dispatch()
+        if not waiter.done():
+            self.stats["queued"] += 1
+        try:
+            with _scrape_queued():
+                await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(nbytes)
+            raise
+        self.stats["max_wait"] = max(self.stats["max_wait"], loop.time() - queued_at)
+        try:
+            yield
+        finally:
+            self._release(nbytes)
+
 
 # --- 2.1 SearchAPI.io 的手动抓取与清洗实现 ---
 class SearchApiScraper(ContentScraper):
     def __init__(self):
-        self.trafilatura_config = use_config()
-        self.trafilatura_config.set("DEFAULT", "EXTRACTION_TIMEOUT", "10")
         self.parser_service = DocumentParserService()
+        self.parse_engine = DocumentParseEngine(self.parser_service)
+        self.host_scheduler = HostPolitenessScheduler()
+        self.memory_budget = DownloadMemoryBudget()
 
-        # 编译常用的正则表达式以提高性能
-        self.NOISY_PATTERNS = [re.compile(p, re.IGNORECASE) for p in [
-            r'^\s*$', r'^[\-=*#_]{3,}$', r'.*\.(html|shtml|htm|php)\s*$',
-            r'.{0,50}(搜狐|网易|腾讯|新浪|登录|注册|版权所有|版权声明).{0,50}$',
-            r'\[\d+\]|\[下一页\]|\[上一页\]', r'\[(编辑|查看历史|讨论|阅读|来源|原标题)\]',
-            r'^\*+\s*\[.*?\]\(.*?\)',
-            r'^\s*(分享到|扫描二维码|返回搜狐|查看更多|责任编辑|记者|通讯员)',
-            r'^\s*([京公网安备京网文京ICP备]|互联网新闻信息服务许可证|信息网络传播视听节目许可证)',
-        ]]
-        self.IMG_PATTERN = re.compile(r'(!\[(.*?)\]\((.*?)\))')
-        self.LINK_PATTERN = re.compile(r'\[.*?\]\(.*?\)')
-        self.EDITOR_PATTERN = re.compile(r'(\(|\[)\s*责任编辑：.*?\s*(\)|\])')
+        # 编译常用的正则表达式以提高性能; 噪声行规则与 DataCleaningPipeline 共用同一个分类器
+        self.noise_classifier = DataCleaningPipeline._NOISE
+        self.image_validator = ImageUrlValidator.shared()
 
     # --- 2.1.1 内容提取工具 (来自您的代码) ---
     def _extract_pdf_text(self, binary_content: bytes) -> str:
@@ -1295,85 +3388,190 @@ class SearchApiScraper(ContentScraper):
             print(f"⚠️ PyMuPDF (fitz) 解析失败: {e}")
             return ""
 
-    def _parse_videos_from_html(self, html: str, base_url: str) -> List[str]:
-        try:
-            soup = BeautifulSoup(html, "lxml")
-            videos = []
-            for video in soup.find_all("video"):
-                src = video.get("src")
-                if src: videos.append(urljoin(base_url, src))
-                for source in video.find_all("source"):
-                    src = source.get("src")
-                    if src: videos.append(urljoin(base_url, src))
-            for iframe in soup.find_all("iframe"):
-                src = iframe.get("src")
-                if src and any(k in src for k in ["youtube", "vimeo", "embed", ".mp4"]):
-                    videos.append(urljoin(base_url, src))
-            return list(dict.fromkeys(videos))  # 去重并保持顺序
-        except Exception as e:
-            print(f"⚠️ 视频解析失败: {e}")
-            return []
-
     # --- 2.1.2 内容清洗工具 (来自您的代码，已优化和异步化) ---
-    async def _is_valid_image_url_async(self, url: str, client: httpx.AsyncClient) -> bool:
-        if not url or not url.startswith(('http://', 'https://')): return False
-        try:
-            resp = await client.head(url, timeout=5, follow_redirects=True)
-            content_type = resp.headers.get('content-type', '').lower()
-            return resp.is_success and 'image' in content_type
-        except httpx.RequestError:
-            return False
-
     async def _remove_invalid_images_async(self, md: str, client: httpx.AsyncClient) -> str:
-        MAX_IMAGES_TO_VALIDATE = 25
-        matches = list(self.IMG_PATTERN.finditer(md))
-        urls_to_check_all = {m.group(3).strip() for m in matches}
-
-        urls_to_check = set(list(urls_to_check_all)[:MAX_IMAGES_TO_VALIDATE])
-        if len(urls_to_check_all) > MAX_IMAGES_TO_VALIDATE:
-            print(f"⚠️ 图片数量过多 ({len(urls_to_check_all)}), 只验证前 {MAX_IMAGES_TO_VALIDATE} 张。")
-
-        tasks = {url: self._is_valid_image_url_async(url, client) for url in urls_to_check}
-        results = await asyncio.gather(*tasks.values(), return_exceptions=True)
-
-        url_status = dict(zip(tasks.keys(), results))
-        valid_urls = {url for url, res in url_status.items() if isinstance(res, bool) and res}
-        valid_urls.update(urls_to_check_all - urls_to_check)  # 未检查的默认有效
-
-        def replacer(match: re.Match):
-            return match.group(0) if match.group(3).strip() in valid_urls else ""
-
-        return self.IMG_PATTERN.sub(replacer, md)
+        return await self.image_validator.filter_markdown(md, client)
 
     def _is_noisy_line(self, line: str) -> bool:
-        stripped = line.strip()
-        for pat in self.NOISY_PATTERNS:
-            if pat.search(stripped): return True
-        links = self.LINK_PATTERN.findall(stripped)
-        if len(links) > 2 and len(stripped) / (len(links) + 1) < 30: return True
-        return False
+        return self.noise_classifier.is_noisy(line.strip())
 
     async def _clean_content_async(self, text: str, client: httpx.AsyncClient) -> str:
         if not text: return ""
         text = await self._remove_invalid_images_async(text, client)
+        # 与 DataCleaningPipeline 相同的逐行生成器: 不整体切分文本, iter_clean 只产出非空的行
+        return "\n".join(self.noise_classifier.iter_clean(DataCleaningPipeline._iter_lines(text)))
+
+    # --- 2.1.3 下载与类型嗅探 ---
+    SUPPORTED_EXTENSIONS = {
+        ".pdf", ".docx", ".doc", ".pptx", ".ppt", ".xlsx", ".xls", ".csv",
+        ".txt", ".md", ".markdown", ".json", ".xml",
+        ".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp",
+    }
+    MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+    # 下载超过该大小即转存临时文件, 也是每个下载在内存预算中的预留量
+    SPOOL_BYTES = int(os.environ.get("SCRAPER_SPOOL_BYTES", str(2 * 1024 * 1024)))
+    DOWNLOAD_DEADLINE = float(os.environ.get("SCRAPER_DOWNLOAD_DEADLINE", "60"))
+    # 读取速率下限 (字节/秒): 超过宽限期后平均速率低于该值即放弃, 防止慢速"滴灌"拖满整个期限
+    MIN_READ_RATE = int(os.environ.get("SCRAPER_MIN_READ_RATE", str(16 * 1024)))
+    READ_RATE_GRACE = 10.0
+    SNIFF_BYTES = 1024
+    OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+    # OLE2 目录项中的流名称 (UTF-16LE), 用于区分 doc / xls / ppt
+    OLE2_STREAMS = [
+        ("WordDocument".encode("utf-16-le"), ".doc"),
+        ("Workbook".encode("utf-16-le"), ".xls"),
+        ("PowerPoint Document".encode("utf-16-le"), ".ppt"),
+    ]
 
-        lines = text.splitlines()
-        cleaned_lines = []
-        for line in lines:
-            if not self._is_noisy_line(line):
-                line = self.EDITOR_PATTERN.sub('', line).strip()
-                if line: cleaned_lines.append(line)
-
-        # 去除连续空行
-        out = []
-        for i, line in enumerate(cleaned_lines):
-            if i > 0 and not line.strip() and not cleaned_lines[i - 1].strip():
-                continue
-            out.append(line)
+    @staticmethod
+    def _sniff_magic(head: bytes) -> Optional[str]:
+        """按文件头魔数判断类型; 返回扩展名, ".zip"/".ole" 表示需下载完成后再细分的容器, ".html" 表示网页。"""
+        if head.startswith(b'%PDF'):
+            return ".pdf"
+        if head.startswith(b'PK\x03\x04'):
+            return ".zip"
+        if head.startswith(SearchApiScraper.OLE2_MAGIC):
+            return ".ole"
+        if head.startswith(b'\x89PNG'):
+            return ".png"
+        if head.startswith(b'\xff\xd8\xff'):
+            return ".jpg"
+        if head.startswith((b'GIF87a', b'GIF89a')):
+            return ".gif"
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return ".webp"
+        if head.startswith(b'BM') and head[6:10] == b'\x00\x00\x00\x00':
+            return ".bmp"
+        text_head = head.lstrip(b'\xef\xbb\xbf \t\r\n')[:512].lower()
+        if text_head.startswith(b'<!doctype html') or b'<html' in text_head:
+            return ".html"
+        return None
+
+    @classmethod
+    def _resolve_container(cls, kind: str, body: SpooledDownload, ext_hint: str) -> Optional[str]:
+        """ZIP 按内部目录区分 docx/pptx/xlsx; OLE2 按流名称区分 doc/xls/ppt; 无法判断时沿用 URL 扩展名。"""
+        if kind == ".zip":
+            try:
+                # 只读取中央目录, 不把整个文件载入内存
+                with body.open() as f, zipfile.ZipFile(f) as zf:
+                    names = zf.namelist()
+            except zipfile.BadZipFile:
+                return None
+            if "[Content_Types].xml" in names:
+                for prefix, ext in (("word/", ".docx"), ("ppt/", ".pptx"), ("xl/", ".xlsx")):
+                    if any(n.startswith(prefix) for n in names):
+                        return ext
+            return ext_hint if ext_hint in (".docx", ".pptx", ".xlsx") else None
+        with body.view() as view:
+            for marker, ext in cls.OLE2_STREAMS:
+                if view.find(marker) != -1:
+                    return ext
+        return ext_hint if ext_hint in (".doc", ".xls", ".ppt") else None
+
+    @staticmethod
+    def _ext_from_content_type(content_type: str) -> Optional[str]:
+        """没有魔数可依时, 按 Content-Type 推断文本类文档; 返回 None 表示按网页处理。"""
+        if 'pdf' in content_type:
+            return ".pdf"
+        if 'csv' in content_type:
+            return ".csv"
+        if 'application/json' in content_type:
+            return ".json"
+        if 'text/xml' in content_type or 'application/xml' in content_type:
+            return ".xml"
+        if 'text/markdown' in content_type:
+            return ".md"
+        if 'text/plain' in content_type:
+            return ".txt"
+        return None
+
+    async def _stream_download(self, url: str, client: httpx.AsyncClient, headers: dict) -> dict:
+        """
+        单次流式 GET: 读取前 SNIFF_BYTES 字节嗅探类型, 超过 20MB 立即中止,
+        从首字节起超过宽限期后平均读取速率低于 MIN_READ_RATE, 且仍有数据未到达时放弃
+        (连接与首字节等待由 20s 读超时约束; 已完整到达的慢响应照常返回)。
+        正文写入 SpooledDownload (超过 SPOOL_BYTES 转存临时文件), 由调用方负责 close。
+        """
+        async with client.stream("GET", url, headers=headers, follow_redirects=True, timeout=20) as resp:
+            resp.raise_for_status()
+            content_type = resp.headers.get('content-type', '').lower()
+            declared = int(resp.headers.get('content-length') or 0)
+            if declared > self.MAX_DOWNLOAD_BYTES:
+                raise ValueError(f"文件过大 ({declared / 1024 / 1024:.2f}MB > 20MB)，跳过处理。")
+
+            buf = SpooledDownload(self.SPOOL_BYTES)
+            try:
+                magic, sniffed = None, False
+                first_byte, too_slow = None, None
+                async for chunk in resp.aiter_bytes():
+                    if too_slow:
+                        raise TimeoutError(too_slow)
+                    if first_byte is None:
+                        first_byte = time.monotonic()
+                    buf.write(chunk)
+                    if not sniffed and buf.size >= self.SNIFF_BYTES:
+                        magic, sniffed = self._sniff_magic(buf.head(self.SNIFF_BYTES)), True
+                        if magic is None and content_type.startswith(("video/", "audio/")):
+                            raise ValueError(f"不支持的内容类型 ({content_type})，跳过处理。")
+                    if buf.size > self.MAX_DOWNLOAD_BYTES:
+                        raise ValueError("文件过大 (已超过 20MB)，中止下载。")
+                    elapsed = time.monotonic() - first_byte
+                    if elapsed > self.READ_RATE_GRACE and buf.size / elapsed < self.MIN_READ_RATE:
+                        msg = f"下载速率过低 ({buf.size / elapsed / 1024:.1f}KB/s)，中止下载: {url}"
+                        if declared and buf.size < declared:
+                            raise TimeoutError(msg)
+                        if not declared:
+                            # 长度未知: 只有下一个分块到达才说明还有数据未传完
+                            too_slow = msg
+                if not sniffed:
+                    magic = self._sniff_magic(buf.head(self.SNIFF_BYTES))
+                buf.finish()
+            except BaseException:
+                buf.close()
+                raise
+            return {
+                "final_url": str(resp.url), "content_type": content_type, "body": buf,
+                "magic": magic, "encoding": resp.encoding or "utf-8",
+            }
 
-        return "\n".join(out).strip()
+    # 被限流 (429/403/503) 后按退避时间重试的次数
+    THROTTLE_RETRIES = 1
 
-    # --- 2.1.3 主抓取函数 (来自您的代码，封装为scrape方法) ---
+    async def _polite_download(self, url: str, client: httpx.AsyncClient, headers: dict) -> dict:
+        """在域名调度器分配的名额内下载; 排队时间不计入 DOWNLOAD_DEADLINE。"""
+        for attempt in range(self.THROTTLE_RETRIES + 1):
+            async with self.host_scheduler.slot(url):
+                try:
+                    download = await asyncio.wait_for(self._stream_download(url, client, headers),
+                                                      timeout=self.DOWNLOAD_DEADLINE)
+                except asyncio.TimeoutError:
+                    raise TimeoutError(f"下载超时 ({self.DOWNLOAD_DEADLINE:.0f}s): {url}")
+                except httpx.HTTPStatusError as e:
+                    resp = e.response
+                    backoff = self.host_scheduler.report(url, resp.status_code, resp.headers.get("retry-after"))
+                    if backoff is None or attempt == self.THROTTLE_RETRIES:
+                        raise
+                    continue
+            self.host_scheduler.report(url, 200)
+            return download
+
+    def _detect_document_ext(self, download: dict, url_ext: str) -> Optional[str]:
+        """魔数 > URL 扩展名 > Content-Type; 返回 None 表示按网页处理。"""
+        magic = download["magic"]
+        if magic == ".html":
+            return None
+        if magic in (".zip", ".ole"):
+            ext = self._resolve_container(magic, download["body"], url_ext)
+            if not ext:
+                raise ValueError(f"不支持的压缩/复合文档格式 (URL 扩展名 {url_ext or '无'})")
+            return ext
+        if magic:
+            return magic
+        if url_ext in self.SUPPORTED_EXTENSIONS:
+            return url_ext
+        return self._ext_from_content_type(download["content_type"])
+
+    # --- 2.1.4 主抓取函数 (来自您的代码，封装为scrape方法) ---
     async def scrape(self, item_info: Dict[str, Any], client: httpx.AsyncClient) -> dict:
         url = item_info.get("url")
         print(f"🕸️ [SearchAPI Scraper] 开始处理: {url}")
@@ -1381,106 +3579,36 @@ class SearchApiScraper(ContentScraper):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
 
         try:
-            # 1. 检测是否为支持的文档类型
-            supported_extensions = {
-                ".pdf", ".docx", ".doc", ".pptx", ".ppt", ".xlsx", ".xls", ".csv",
-                ".txt", ".md", ".markdown", ".json", ".xml",
-                ".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp",
-            }
-            url_lower = url.lower()
-            ext = os.path.splitext(url_lower)[1]
-
-            is_document = ext in supported_extensions
-            content_type = ""
-
-            # 如果这类已知扩展名，可以直接认定为文档，减少 HEAD 请求（或保留 HEAD 以检测大小）
-            # 这里保留 HEAD 请求以获取 Content-Type 和 Content-Length
-            async with client.stream("HEAD", url, headers=headers, follow_redirects=True) as head_response:
-                content_type = head_response.headers.get('content-type', '').lower()
-                content_length = int(head_response.headers.get('content-length', 0))
-
-                # Check for document mime types if extension wasn't obvious
-                if not is_document:
-                    if 'pdf' in content_type:
-                        is_document = True;
-                        ext = ".pdf"
-                    elif 'word' in content_type or 'officedocument' in content_type:
-                        is_document = True;
-                        ext = ".docx"  # Simplification
-                    elif 'excel' in content_type or 'spreadsheet' in content_type:
-                        is_document = True;
-                        ext = ".xlsx"
-                    elif 'powerpoint' in content_type or 'presentation' in content_type:
-                        is_document = True;
-                        ext = ".pptx"
-                    elif 'csv' in content_type:
-                        is_document = True;
-                        ext = ".csv"
-                    elif 'image/' in content_type:
-                        is_document = True
-                        if 'png' in content_type:
-                            ext = ".png"
-                        elif 'gif' in content_type:
-                            ext = ".gif"
-                        elif 'webp' in content_type:
-                            ext = ".webp"
-                        elif 'bmp' in content_type:
-                            ext = ".bmp"
-                        else:
-                            ext = ".jpg"
-                    elif 'application/json' in content_type:
-                        is_document = True;
-                        ext = ".json"
-                    elif 'text/xml' in content_type or 'application/xml' in content_type:
-                        is_document = True;
-                        ext = ".xml"
-                    elif 'text/plain' in content_type and ext not in supported_extensions:
-                        is_document = True;
-                        ext = ".txt"
-                    elif 'text/markdown' in content_type:
-                        is_document = True;
-                        ext = ".md"
-
-                # 【优化】检查文件大小 (限制为 20MB)
-                MAX_SIZE = 20 * 1024 * 1024
-                if is_document and content_length > MAX_SIZE:
-                    raise ValueError(f"文档文件过大 ({content_length / 1024 / 1024:.2f}MB > 20MB)，跳过处理。")
-
-            # 根据类型执行不同逻辑
-            raw_content, final_url = "", url
-
-            if is_document:
-                print(f"  📄 [SearchAPI Scraper] 检测到文档 ({ext}): {url}")
+            url_ext = os.path.splitext(url.lower().split('?', 1)[0])[1]
+            # 内存紧张时在这里排队, 不占用域名调度名额
+            async with self.memory_budget.reserve(self.SPOOL_BYTES):
+                download = await self._polite_download(url, client, headers)
                 try:
-                    async def _download_doc():
-                        resp = await client.get(url, timeout=None, headers=headers, follow_redirects=True)
-                        resp.raise_for_status()
-                        return str(resp.url), await resp.aread()
-
-                    final_url, file_bytes = await asyncio.wait_for(_download_doc(), timeout=60)
-                except asyncio.TimeoutError:
-                    raise TimeoutError(f"下载超时 (60s): {url}")
-
-                print(f"  🚀 [SearchAPI Scraper] 正在使用 DocumentParserService 解析 ({ext})...")
-                raw_content = await asyncio.to_thread(
-                    self.parser_service.parse, file_bytes, ext or ".bin", url
-                )
-            else:
-                print(f"  📑 [SearchAPI Scraper] 检测到 HTML: {url}")
-                response = await client.get(url, timeout=20, headers=headers, follow_redirects=True)
-                response.raise_for_status()
-                final_url = str(response.url)
-                html_content = response.text
-                raw_content = await asyncio.to_thread(
-                    trafilatura.extract, html_content, config=self.trafilatura_config,
-                    output_format='markdown', include_images=True, favor_recall=True)
-
-                # HTML的视频解析和清洗
+                    final_url = download["final_url"]
+                    ext = self._detect_document_ext(download, url_ext)
+
+                    raw_content = ""
+                    # 下载已完成: 解析阶段不计入对冲延迟
+                    with _scrape_parsing():
+                        if ext:
+                            print(f"  📄 [SearchAPI Scraper] 检测到文档 ({ext}): {url}")
+                            print(f"  🚀 [SearchAPI Scraper] 正在使用 DocumentParserService 解析 ({ext}, {self.parse_engine.mode})...")
+                            raw_content = await self.parse_engine.parse(download["body"], ext, url)
+                        else:
+                            print(f"  📑 [SearchAPI Scraper] 检测到 HTML: {url}")
+                            # 正文与视频在解析进程池中一次提取
+                            page = await self.parse_engine.extract_html(download["body"], download["encoding"], final_url)
+                            raw_content = page["content"]
+                finally:
+                    download["body"].close()
+
+            # HTML的视频解析和清洗 (在释放下载缓冲之后进行)
+            if not ext:
                 if raw_content:
                     print(f"  🧹 [SearchAPI Scraper] 正在清洗HTML内容: {final_url}")
                     cleaned_content = await self._clean_content_async(raw_content, client)
                     print(cleaned_content)
-                    videos = self._parse_videos_from_html(html_content, final_url)
+                    videos = page["videos"]
                     if videos:
                         video_section = "\n\n## 参考视频:\n" + "\n".join(f"- {vid}" for vid in videos)
                         cleaned_content += video_section
@@ -1494,6 +3622,22 @@ class SearchApiScraper(ContentScraper):
             print(f"⚠️ [SearchAPI Scraper] {error_msg}")
             return {**item_info, "content": "", "status": "failed", "error_message": str(e)}
 
+    async def aclose(self) -> None:
+        await self.image_validator.aclose()
+        await self.parse_engine.aclose()
+        hs = self.host_scheduler.stats
+        if hs["granted"]:
+            print(f"📊 [SearchAPI Scraper] 域名调度: 放行 {hs['granted']} 次, 限流退避 {hs['throttled']} 次, "
+                  f"最长排队 {hs['max_wait']:.1f}s")
+        ms = self.memory_budget.stats
+        if ms["queued"]:
+            print(f"📊 [SearchAPI Scraper] 内存预算: {ms['queued']} 个下载因内存排队, 最长 {ms['max_wait']:.1f}s, "
+                  f"RSS 峰值 {ms['peak_rss'] / 1024 / 1024:.0f}MB (上限 {self.memory_budget.ceiling / 1024 / 1024:.0f}MB)")
+        metrics = await asyncio.to_thread(self.parser_service.metrics)
+        if metrics["recent_trails"]:
+            order = "; ".join(f"{ext}: {' > '.join(names)}" for ext, names in metrics["strategy_order"].items())
+            print(f"📊 [SearchAPI Scraper] 解析器顺序 ({len(metrics['recent_trails'])} 个文档): {order}")
+
 
 # --- 2.2 FirecrawlScraper ---
 class FirecrawlScraper(ContentScraper):
@@ -1703,6 +3847,255 @@ class TianyanEnterpriseScraper:
             return {**base_return, "status": "failed", "data": None, "message": error_msg}
 
 
+# --- 3. 对冲抓取策略 ---
+class HedgedScrapePolicy:
+    """
+    抓取策略引擎: 每个条目先用本地抓取器 (SearchApiScraper, 无 API 费用) 抓取;
+    超过 HEDGE_DELAY 秒仍未完成 (已下载完成、正在解析的除外) 或已失败时, 依次启动 Reader API (条目自身的搜索源优先, 其后按 HEDGE_PROVIDERS)
+    作为对冲, 先成功者胜出, 其余任务取消。
+    整次运行共享一个截止时间 (RUN_BUDGET 秒) 和对冲次数上限 (MAX_HEDGES, 即付费 API 调用数);
+    条目在域名礼貌调度 / 内存预算队列中的等待不计入预算 (截止时间按排队时长顺延)。
+    """
+    PRIMARY = "searchapi"
+    HEDGE_DELAY = float(os.environ.get("SCRAPE_HEDGE_DELAY", "8"))
+    HEDGE_PROVIDERS = [p.strip() for p in os.environ.get("SCRAPE_HEDGE_PROVIDERS", "jina,firecrawl,tavily").split(",")
+                       if p.strip()]
+    RUN_BUDGET = float(os.environ.get("SCRAPE_RUN_BUDGET", "120"))
+    MAX_HEDGES = int(os.environ.get("SCRAPE_MAX_HEDGES", "30"))
+
+    def __init__(self, scrapers: Dict[str, ContentScraper]):
+        self.scrapers = scrapers
+        self._deadline: Optional[float] = None
+        self._hedges_left = self.MAX_HEDGES
+        self.stats = {"won_by": {}, "hedged": 0, "hedge_wins": 0, "cancelled": 0, "over_budget": 0}
+
+    def start_run(self) -> None:
+        self._deadline = asyncio.get_running_loop().time() + self.RUN_BUDGET
+        self._hedges_left = self.MAX_HEDGES
+
+    def _plan(self, item: Dict[str, Any]) -> List[str]:
+        order = [self.PRIMARY, item.get("provider")] + self.HEDGE_PROVIDERS
+        return [name for name in dict.fromkeys(order) if name in self.scrapers]
+
+    async def scrape(self, item: Dict[str, Any], client: httpx.AsyncClient) -> dict:
+        loop = asyncio.get_running_loop()
+        if self._deadline is None:
+            self.start_run()
+        plan = self._plan(item)
+        pending: Dict[asyncio.Task, str] = {}
+        last_failure: Optional[dict] = None
+        queue_wait = ScrapeQueueWait()
+
+        def _launch(name: str) -> None:
+            token = _SCRAPE_QUEUE_WAIT.set(queue_wait)
+            try:
+                pending[asyncio.ensure_future(self.scrapers[name].scrape(item, client))] = name
+            finally:
+                _SCRAPE_QUEUE_WAIT.reset(token)
+
+        _launch(plan[0])
+        next_idx = 1
+        try:
+            while pending:
+                now = loop.time()
+                remaining = self._deadline + queue_wait.seconds(now) - now
+                if remaining <= 0:
+                    self.stats["over_budget"] += 1
+                    print(f"⏱️ [Scrape Policy] 超出本次运行抓取预算 ({self.RUN_BUDGET:g}s): {item.get('url')}")
+                    break
+                can_hedge = next_idx < len(plan) and self._hedges_left > 0
+                # 本地抓取已下载完成时, 解析耗时与源站快慢无关, 不再计入对冲延迟 (解析失败时仍立即对冲)
+                timed_hedge = can_hedge and not queue_wait.parsing
+                done, _ = await asyncio.wait(pending, timeout=min(self.HEDGE_DELAY, remaining) if timed_hedge else remaining,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                failed = False
+                for task in done:
+                    name = pending.pop(task)
+                    result = task.result() if task.exception() is None else {
+                        **item, "content": "", "status": "failed", "error_message": str(task.exception())}
+                    if isinstance(result, dict) and result.get("status") == "success":
+                        self.stats["won_by"][name] = self.stats["won_by"].get(name, 0) + 1
+                        if name != plan[0]:
+                            self.stats["hedge_wins"] += 1
+                            print(f"🏁 [Scrape Policy] 对冲胜出 ({name}): {item.get('url')}")
+                        return result
+                    last_failure, failed = result, True
+                # 超时未完成 (且不在解析中) 或有抓取器失败: 启动下一个对冲
+                if (failed or not (done or queue_wait.parsing)) and can_hedge:
+                    name = plan[next_idx]
+                    next_idx += 1
+                    self._hedges_left -= 1
+                    self.stats["hedged"] += 1
+                    print(f"🔀 [Scrape Policy] {'失败' if failed else f'{self.HEDGE_DELAY:g}s 未完成'}, 对冲 {name}: {item.get('url')}")
+                    _launch(name)
+        finally:
+            for task in pending:
+                task.cancel()
+            self.stats["cancelled"] += len(pending)
+        return last_failure or {**item, "content": "", "status": "failed", "error_message": "超出本次运行抓取预算"}
+
+    def summary(self) -> str:
+        st = self.stats
+        won = ", ".join(f"{k} {v}" for k, v in st["won_by"].items()) or "无"
+        return (f"胜出路径: {won}; 对冲 {st['hedged']} 次 (胜出 {st['hedge_wins']}), "
+                f"取消 {st['cancelled']} 个, 超预算 {st['over_budget']} 个")
+
+
+# --- 4. 近重复页面消除 ---
+class ContentDeduplicator:
+    """
+    转载新闻、镜像政策页经常被不同搜索源、不同查询重复返回。两级去重:
+    - 抓取前 (prefilter): 规范化 URL 相同, 或标题相同且搜索摘要 SimHash 接近的条目归为一组,
+      组内只抓取第一个, 失败时再依次尝试组内其他条目;
+    - 抓取后 (collapse): 正文 SimHash 海明距离 <= CONTENT_DISTANCE 的页面合并, 保留正文最长的一份。
+    被合并条目的 URL / 查询 / 来源记录在保留条目的 duplicates 中, 其 references 并入保留条目,
+    输出时保留条目会分发到所有被引用的 origin_key, 不会有分组因合并而丢失内容。
+    SimHash 使用内置 hash(), 只在同一进程内比较。
+    """
+    SHINGLE = 4
+    CONTENT_DISTANCE = int(os.environ.get("DEDUP_CONTENT_DISTANCE", "3"))
+    SNIPPET_DISTANCE = 3
+    MIN_TITLE_CHARS = 12
+    MIN_SNIPPET_CHARS = 30
+    MIN_CONTENT_CHARS = 200
+    # 海明距离 <= 3 时, 64 位签名按 4 段 16 位切分至少有一段完全相同 (抽屉原理)
+    BANDS = 4
+    _NON_WORD = re.compile(r'[\W_]+')
+    _CJK = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+
+    def __init__(self):
+        self.stats = {"prefiltered": 0, "collapsed": 0, "bytes_saved": 0, "tokens_saved": 0}
+
+    @classmethod
+    def simhash(cls, text: str) -> int:
+        """字符 SHINGLE-gram 集合的 64 位 SimHash; 按字节位置计数, 避免逐位的 Python 循环。"""
+        norm = cls._NON_WORD.sub("", text.lower())
+        k = cls.SHINGLE
+        shingles = {norm[i:i + k] for i in range(max(len(norm) - k + 1, 1))}
+        buf = struct.pack(f"<{len(shingles)}q", *map(hash, shingles))
+        half = len(shingles) / 2
+        value = 0
+        for pos in range(8):
+            bit_counts = [0] * 8
+            for byte, count in Counter(buf[pos::8]).items():
+                for bit in range(8):
+                    if byte >> bit & 1:
+                        bit_counts[bit] += count
+            for bit in range(8):
+                if bit_counts[bit] > half:
+                    value |= 1 << (pos * 8 + bit)
+        return value
+
+    @staticmethod
+    def distance(a: int, b: int) -> int:
+        return bin(a ^ b).count("1")
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """粗略 token 估算: 每个汉字约 1 token, 其余字符约 4 个 1 token。"""
+        cjk = len(ContentDeduplicator._CJK.findall(text))
+        return cjk + (len(text) - cjk) // 4
+
+    @classmethod
+    def _is_document_url(cls, url: str) -> bool:
+        ext = os.path.splitext(urlsplit(url).path)[1].lower()
+        return ext in SearchApiScraper.SUPPORTED_EXTENSIONS and ext not in (".html", ".htm")
+
+    def prefilter(self, items: List[Dict[str, Any]]) -> List[List[int]]:
+        """返回抓取分组 (条目下标列表), 每组第一个为代表条目。"""
+        groups: List[List[int]] = []
+        by_url: Dict[str, int] = {}
+        by_title: Dict[str, List[tuple]] = {}
+        for idx, item in enumerate(items):
+            url_key = item.get("canonical_url") or canonicalize_url(item.get("url") or "")
+            if url_key in by_url:
+                groups[by_url[url_key]].append(idx)
+                continue
+
+            title = self._NON_WORD.sub("", (item.get("title") or "").lower())
+            snippet = item.get("snippet") or ""
+            gi = None
+            title_key = title
+            sig = None
+            # 文档链接的标题/摘要常由搜索引擎生成, 不能据此判重
+            if (len(title) >= self.MIN_TITLE_CHARS and len(snippet) >= self.MIN_SNIPPET_CHARS
+                    and not self._is_document_url(item.get("url") or "")):
+                sig = self.simhash(snippet)
+                gi = next((g for g, other in by_title.get(title_key, [])
+                           if self.distance(sig, other) <= self.SNIPPET_DISTANCE), None)
+            if gi is None:
+                gi = len(groups)
+                groups.append([idx])
+                if sig is not None:
+                    by_title.setdefault(title_key, []).append((gi, sig))
+            else:
+                groups[gi].append(idx)
+            by_url[url_key] = gi
+        self.stats["prefiltered"] = sum(len(g) - 1 for g in groups)
+        return groups
+
+    def _record_saving(self, content: str) -> None:
+        self.stats["bytes_saved"] += len(content.encode("utf-8"))
+        self.stats["tokens_saved"] += self.estimate_tokens(content)
+
+    @staticmethod
+    def _duplicate_info(item: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: item.get(k) for k in ("url", "title", "source", "provider", "query")}
+
+    @staticmethod
+    def _absorb(kept: Dict[str, Any], dropped: Dict[str, Any]) -> None:
+        kept.setdefault("duplicates", []).append(ContentDeduplicator._duplicate_info(dropped))
+        kept["duplicates"].extend(dropped.get("duplicates", []))
+        kept.setdefault("references", []).extend(dropped.get("references", []))
+
+    def merge_group(self, results: list, items: List[Dict[str, Any]], group: List[int], winner: int) -> None:
+        """抓取分组的结果: 代表条目携带组内其他条目的信息, 其余条目标记为 duplicate。"""
+        kept = results[winner]
+        if not (isinstance(kept, dict) and kept.get("status") == "success"):
+            return
+        for idx in group:
+            if idx == winner:
+                continue
+            self._absorb(kept, items[idx])
+            results[idx] = {**items[idx], "status": "duplicate", "duplicate_of": kept.get("url")}
+            # 未抓取的条目按代表条目的正文估算节省量
+            self._record_saving(kept.get("content") or "")
+
+    def collapse(self, results: list) -> None:
+        """抓取后按正文 SimHash 合并近重复页面 (原地修改, 下标与输入条目保持一致)。"""
+        candidates = [i for i, r in enumerate(results)
+                      if isinstance(r, dict) and r.get("status") == "success"
+                      and len(r.get("content") or "") >= self.MIN_CONTENT_CHARS]
+        candidates.sort(key=lambda i: len(results[i]["content"]), reverse=True)
+        width = 64 // self.BANDS
+        mask = (1 << width) - 1
+        bands: Dict[tuple, List[tuple]] = {}
+        for i in candidates:
+            r = results[i]
+            sig = self.simhash(r["content"])
+            keys = [(b, sig >> (b * width) & mask) for b in range(self.BANDS)]
+            match = None
+            for key in keys:
+                match = next((j for j, other in bands.get(key, []) if self.distance(sig, other) <= self.CONTENT_DISTANCE), None)
+                if match is not None:
+                    break
+            if match is None:
+                for key in keys:
+                    bands.setdefault(key, []).append((i, sig))
+                continue
+            kept = results[match]
+            self._absorb(kept, r)
+            self._record_saving(r["content"])
+            self.stats["collapsed"] += 1
+            results[i] = {**{k: v for k, v in r.items() if k not in ("content", "duplicates", "references")},
+                          "content": "", "status": "duplicate", "duplicate_of": kept.get("url")}
+
+    def summary(self) -> str:
+        st = self.stats
+        return (f"抓取前合并 {st['prefiltered']} 条, 正文近重复合并 {st['collapsed']} 条, "
+                f"节省约 {st['bytes_saved'] / 1024:.1f} KB / {st['tokens_saved']} tokens")
+
+
 class DataOrchestrator:
     def __init__(self):
         self.content_scrapers: Dict[str, ContentScraper] = {
@@ -1711,6 +4104,22 @@ class DataOrchestrator:
         }
         self.job_scraper = ZhiLianJobScraper()
         self.enterprise_scraper = TianyanEnterpriseScraper()
+        self.deduplicator = ContentDeduplicator()
+        self.scrape_policy = HedgedScrapePolicy(self.content_scrapers)
+
+    async def _scrape_group(self, items: List[Dict[str, Any]], group: List[int], client: httpx.AsyncClient) -> tuple:
+        """依次抓取一组近重复条目, 第一个成功即返回 (下标, 结果); 全部失败时返回第一个条目的结果。"""
+        first = None
+        for idx in group:
+            try:
+                result = await self.scrape_policy.scrape(items[idx], client)
+            except Exception as e:
+                result = e
+            if isinstance(result, dict) and result.get("status") == "success":
+                return idx, result
+            if first is None:
+                first = (idx, result)
+        return first
 
     # 【调整】整个 process_all 方法被重构，以实现条件化任务调度。
     async def process_all(
@@ -1732,11 +4141,14 @@ class DataOrchestrator:
                                      limits=httpx.Limits(max_connections=50)) as client:
 
             content_tasks = []
+            groups: List[List[int]] = []
+            self.scrape_policy.start_run()
             if web_url_info_list:
-                print(f"  [Orchestrator] 准备 {len(web_url_info_list)}个网页抓取任务。")
-                for item in web_url_info_list:
-                    scraper = self.content_scrapers.get(item.get("provider")) or self.content_scrapers["searchapi"]
-                    content_tasks.append(scraper.scrape(item, client))
+                groups = self.deduplicator.prefilter(web_url_info_list)
+                print(f"  [Orchestrator] 准备 {len(groups)}个网页抓取任务 "
+                      f"(共 {len(web_url_info_list)} 条, 抓取前合并近重复 {len(web_url_info_list) - len(groups)} 条)。")
+                for group in groups:
+                    content_tasks.append(self._scrape_group(web_url_info_list, group, client))
             job_tasks = []
             if career_payload and career_payload.get("keywords") and career_payload.get("provinces"):
                 print("  [Orchestrator] 准备招聘信息抓取任务。")
@@ -1757,11 +4169,32 @@ class DataOrchestrator:
             if not tasks_to_run:
                 print("  [Orchestrator] 没有可执行的任务。")
                 return final_results
-            all_results = await asyncio.gather(*tasks_to_run, return_exceptions=True)
+            try:
+                all_results = await asyncio.gather(*tasks_to_run, return_exceptions=True)
+            finally:
+                for scraper in self.content_scrapers.values():
+                    await scraper.aclose()
             # 【调整】安全地解析和分离三组任务的结果
             content_end_idx = len(content_tasks)
             job_end_idx = content_end_idx + len(job_tasks)
-            final_results["content_results"] = all_results[:content_end_idx]
+            # 还原为与 web_url_info_list 一一对应的结果列表, 再合并正文近重复的页面
+            content_results: list = [None] * len(web_url_info_list)
+            for group, outcome in zip(groups, all_results[:content_end_idx]):
+                if isinstance(outcome, Exception):
+                    outcome = (group[0], outcome)
+                winner, result = outcome
+                content_results[winner] = result
+                for idx in group:
+                    if idx != winner:
+                        content_results[idx] = {**web_url_info_list[idx], "status": "skipped"}
+                self.deduplicator.merge_group(content_results, web_url_info_list, group, winner)
+            self.deduplicator.collapse(content_results)
+            if web_url_info_list:
+                print(f"  [Orchestrator] 抓取: {self.scrape_policy.summary()}")
+                print(f"  [Orchestrator] 去重: {self.deduplicator.summary()}")
+            final_results["content_results"] = content_results
+            final_results["dedup_stats"] = dict(self.deduplicator.stats)
+            final_results["scrape_stats"] = dict(self.scrape_policy.stats)
 
             job_task_results = all_results[content_end_idx:job_end_idx]
             if job_task_results:
@@ -1802,21 +4235,27 @@ async def main_async(raw_input: Any) -> Dict[str, Any]:
             sanitized_url = re.sub(r'[^a-zA-Z0-9]', '-',
                                    result.get("url", "").replace("https://", "").replace("http://", ""))
 
-            # Retrieve the origin_key from the input list corresponding to this result
-            # Note: results["content_results"] corresponds exactly to web_url_info_list order
-            origin_key = web_url_info_list[i].get("origin_key", "comprehensive_data")
-
-            item_data = {
-                "type": "web", "source_id": f"web-{sanitized_url[:100]}", "url": result.get("url"),
-                "title": result.get("title"), "source": result.get("source"), "snippet": result.get("snippet"),
-                "query": result.get("query"), "content": result.get("content", "")
-            }
-
-            if origin_key in content_results_by_origin:
+            # 同一规范 URL (及合并进来的近重复页面) 只抓取一次, 按 references 分发回每个引用它的 origin_key
+            references_by_origin: Dict[str, List[Dict[str, Any]]] = {}
+            for ref in result.get("references") or [web_url_info_list[i]]:
+                origin_key = ref.get("origin_key", "comprehensive_data")
+                if origin_key not in content_results_by_origin:
+                    origin_key = "comprehensive_data"
+                references_by_origin.setdefault(origin_key, []).append(ref)
+
+            for origin_key, refs in references_by_origin.items():
+                item_data = {
+                    "type": "web", "source_id": f"web-{sanitized_url[:100]}", "url": result.get("url"),
+                    "title": result.get("title"), "source": result.get("source"), "snippet": result.get("snippet"),
+                    "query": refs[0].get("query", result.get("query")), "content": result.get("content", "")
+                }
+                queries = list(dict.fromkeys(ref.get("query") for ref in refs if ref.get("query")))
+                if len(queries) > 1:
+                    item_data["queries"] = queries
+                if result.get("duplicates"):
+                    # 被合并的近重复页面 (转载/镜像) 的 URL、查询与来源
+                    item_data["duplicates"] = result["duplicates"]
                 content_results_by_origin[origin_key].append(item_data)
-            else:
-                # Fallback
-                content_results_by_origin["comprehensive_data"].append(item_data)
 
     # 4. 格式化视频内容输出 (暂不分组，视频通常只出现在 comprehensive 或 general 中，这里简单处理)
     # 如果需要严格分组，也需要在 _extract_urls 中对视频加 origin_key